@@ -0,0 +1,175 @@
+import threading
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+# -----------------------------------------------------------
+# STREAMING ALERT ENGINE
+# -----------------------------------------------------------
+# Alert state lives in a shared collection (one document per bin: last reading time and
+# fill, the over-threshold and silent flags, when each rule last fired), not in process
+# memory, so a reading is evaluated against the same history whichever worker received it.
+# Every state write is a compare-and-set on the document's version: the upsert is
+# filtered on the version that was read, so if another worker wrote first it collides
+# on _id, and the loser re-reads and re-evaluates. An alert is queued only by the write
+# that recorded it, so each one is raised by exactly one worker.
+STATE_COLLECTION = "alert_state"
+MAX_CONFLICTS = 5
+
+class AlertEngine:
+    """
+    Evaluates readings against each bin's stored alert state, so no history is rescanned.
+    Rules:
+      - Overfilled Bin: fill level crosses `fill_threshold` (re-arms once it drops
+        `rearm_margin` points below it, e.g. after collection)
+      - Sensor Silent: no reading for `silence_minutes` of wall-clock time; checked
+        periodically by check_silence() rather than per reading
+      - Fill Spike: fill rises faster than `spike_per_hour` points/hour
+    Each (bin, rule) fires at most once per `debounce_minutes`. Alerts queue up in this
+    process until drain() hands them to a batched writer; requeue() puts back a batch
+    whose write failed.
+    """
+    def __init__(self, fill_threshold=80, rearm_margin=10, silence_minutes=120,
+                 spike_per_hour=40, debounce_minutes=30):
+        self.fill_threshold = fill_threshold
+        self.rearm_margin = rearm_margin
+        self.silence = timedelta(minutes=silence_minutes)
+        self.spike_per_hour = spike_per_hour
+        self.debounce = timedelta(minutes=debounce_minutes)
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def ensure_indexes(state_collection):
+        state_collection.create_index([("time", 1)])  # silence checks
+
+    def observe(self, state_collection, readings, emit=True):
+        """Fold new readings into the stored alert state; with emit=False state is updated silently."""
+        by_serial = {}
+        for r in sorted((r for r in readings if r.get("serial") is not None and r.get("time") is not None),
+                        key=lambda r: r["time"]):
+            by_serial.setdefault(r["serial"], []).append(r)
+        self._commit(state_collection, list(by_serial),
+                     lambda serial, state: self._fold(serial, state, by_serial[serial], emit))
+
+    def _fold(self, serial, state, readings, emit=True):
+        """(new state, alerts) after time-ordered `readings`, or (None, []) if none is newer than the state."""
+        state, alerts, changed = self._copy(state), [], False
+        for r in readings:
+            t, fill = r["time"], r.get("status_current_fill_level")
+            if state["time"] is not None and t <= state["time"]:
+                continue  # already seen (re-ingested or out-of-order)
+            if fill is not None and fill == fill:  # skip NaN
+                if fill >= self.fill_threshold or r.get("bin_status") == "Full":
+                    if not state["above"]:
+                        state["above"] = True
+                        if emit:
+                            self._fire(state, alerts, serial, t, "Overfilled Bin", "High",
+                                       f"Bin {serial} at {fill:.0f}% fill (threshold {self.fill_threshold}%)")
+                elif fill < self.fill_threshold - self.rearm_margin:
+                    state["above"] = False
+
+                if state["fill"] is not None and state["time"] is not None:
+                    hours = (t - state["time"]).total_seconds() / 3600
+                    if hours > 0 and (fill - state["fill"]) / hours > self.spike_per_hour and emit:
+                        self._fire(state, alerts, serial, t, "Fill Spike", "Medium",
+                                   f"Bin {serial} filled {fill - state['fill']:.0f} points in {hours * 60:.0f} min")
+                state["fill"] = fill
+            state["time"], state["silent"], changed = t, False, True
+        return (state if changed else None), alerts
+
+    def alert_current(self, state_collection):
+        """Queue Overfilled Bin alerts for bins that are over threshold but were never alerted."""
+        def transition(serial, state):
+            state, alerts = self._copy(state), []
+            if not state["above"] or "Overfilled Bin" in state["fired"]:
+                return None, []
+            self._fire(state, alerts, serial, state["time"], "Overfilled Bin", "High",
+                       f"Bin {serial} at {state['fill']:.0f}% fill (threshold {self.fill_threshold}%)")
+            return state, alerts
+        serials = [d["_id"] for d in state_collection.find(
+            {"above": True, "fired.Overfilled Bin": {"$exists": False}}, {"_id": 1})]
+        self._commit(state_collection, serials, transition)
+
+    def check_silence(self, state_collection, now=None):
+        """
+        Queue Sensor Silent alerts for bins with no reading within the silence window
+        before `now` (wall-clock UTC by default, so it fires even when every sensor stops).
+        """
+        now = now or datetime.utcnow()
+        cutoff = now - self.silence
+
+        def transition(serial, state):
+            state, alerts = self._copy(state), []
+            if state["silent"] or state["time"] is None or state["time"] >= cutoff:
+                return None, []
+            state["silent"] = True
+            minutes = (now - state["time"]).total_seconds() / 60
+            self._fire(state, alerts, serial, now, "Sensor Silent", "High",
+                       f"Bin {serial} has not reported for {minutes:.0f} min")
+            return state, alerts
+        serials = [d["_id"] for d in state_collection.find({"time": {"$lt": cutoff}, "silent": {"$ne": True}}, {"_id": 1})]
+        self._commit(state_collection, serials, transition)
+
+    def _commit(self, state_collection, serials, transition):
+        """
+        Apply transition(serial, stored_state) -> (new_state or None, alerts) to each bin
+        as compare-and-set writes, re-evaluating the bins another worker changed meanwhile.
+        """
+        for _ in range(MAX_CONFLICTS):
+            if not serials:
+                return
+            stored = {d["_id"]: d for d in state_collection.find({"_id": {"$in": serials}})}
+            ops, results = [], []
+            for serial in serials:
+                state, alerts = transition(serial, stored.get(serial))
+                if state is None:
+                    continue
+                version = state["v"]
+                ops.append(UpdateOne({"_id": serial, "v": version}, {"$set": dict(state, v=version + 1)}, upsert=True))
+                results.append((serial, alerts))
+            if not ops:
+                return
+            rejected = set()
+            try:
+                state_collection.bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+                rejected = {err["index"] for err in e.details.get("writeErrors", [])}
+            with self._lock:
+                self._pending.extend(a for k, (_, alerts) in enumerate(results) if k not in rejected for a in alerts)
+            serials = [serial for k, (serial, _) in enumerate(results) if k in rejected]
+        if serials:
+            print(f"⚠️ Alert state of {len(serials)} bins kept changing under concurrent writers; skipped this pass.")
+
+    @staticmethod
+    def _copy(state):
+        state = dict(state or {"time": None, "fill": None, "above": False, "silent": False, "v": 0})
+        state.pop("_id", None)
+        state["fired"] = dict(state.get("fired") or {})
+        return state
+
+    def _fire(self, state, alerts, serial, t, alert_type, severity, message):
+        last = state["fired"].get(alert_type)
+        if last is not None and t - last < self.debounce:
+            return
+        state["fired"][alert_type] = t
+        alerts.append((alert_type, message, severity, serial))
+
+    def drain(self):
+        """Return and clear queued alerts as (type, message, severity, serial) tuples."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            return pending
+
+    def requeue(self, alerts):
+        """Put back drained alerts whose write failed, ahead of anything queued since."""
+        with self._lock:
+            self._pending[:0] = alerts
+
+    def reset(self, state_collection):
+        """Forget all alert state (e.g. before history is replayed from scratch)."""
+        state_collection.delete_many({})
+        with self._lock:
+            self._pending.clear()
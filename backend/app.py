@@ -1,28 +1,285 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, g, Response
 from flask_cors import CORS
+import os, json, queue, atexit, threading, time
+from datetime import datetime
+import psycopg2
 import trial_core as core
+import events
+import metrics
+import reading_buckets
+from ingest_buffer import ReadingBuffer, BufferFull
 
 # -------------------------------------------------
 # INITIALIZE FLASK APP
 # -------------------------------------------------
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor", "ETag"])
 
 # -------------------------------------------------
 # SETUP DATABASE CONNECTIONS
 # -------------------------------------------------
-sql_conn, sql_cursor, mongo_client, mongo_db, bin_readings_collection = core.get_connections()
-core.setup_databases(sql_cursor, sql_conn, bin_readings_collection, drop_existing=False)
+# Nothing here talks to a database: the pool opens connections on first checkout
+# (SWMS_PG_POOL_MIN defaults to 0) and the Mongo client connects on first use.
+# Pool sizes are per process; with gunicorn, total connections = workers * SWMS_PG_POOL_MAX
+pg_pool = core.create_connection_pool(
+    minconn=int(os.environ.get("SWMS_PG_POOL_MIN", 0)),
+    maxconn=int(os.environ.get("SWMS_PG_POOL_MAX", 10)),
+    timeout=float(os.environ.get("SWMS_PG_POOL_TIMEOUT", 10)),
+)
+mongo_client, mongo_db, bin_readings_collection = core.get_mongo_connection(
+    max_pool_size=int(os.environ.get("SWMS_MONGO_POOL_MAX", 100))
+)
+
+
+# -------------------------------------------------
+# REQUEST METRICS
+# -------------------------------------------------
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - started, route, request.method, response.status_code)
+    return response
+
+
+# -------------------------------------------------
+# BACKGROUND BOOTSTRAP
+# -------------------------------------------------
+# Schema migrations and the initial CSV load run on a background thread so the
+# worker starts serving at once. Data endpoints answer 503 until the schema is in
+# place; /api/ready reports progress (200 only once bootstrap has finished).
+# A failed bootstrap (e.g. the databases are still starting) is retried with capped
+# exponential backoff; SWMS_BOOTSTRAP_ATTEMPTS > 0 gives up after that many attempts.
+startup = {"state": "starting", "schema_ready": False, "error": None, "attempts": 0,
+           "started_at": datetime.utcnow().isoformat()}
+BOOTSTRAP_LOCK = "swms_bootstrap"
+ALWAYS_AVAILABLE = {"home", "ready", "pool_stats", "metrics_endpoint", "profiler", "static"}
+
+
+def bootstrap():
+    max_attempts = int(os.environ.get("SWMS_BOOTSTRAP_ATTEMPTS", 0))
+    delay, max_delay = 1.0, float(os.environ.get("SWMS_BOOTSTRAP_RETRY_MAX", 60))
+    while True:
+        startup["attempts"] += 1
+        try:
+            run_bootstrap()
+            break
+        except Exception as e:
+            startup["error"] = str(e)
+            if max_attempts and startup["attempts"] >= max_attempts:
+                startup["state"] = "failed"
+                print(f"❌ Bootstrap failed: {e}")
+                return
+            startup["state"] = "retrying"
+            print(f"❌ Bootstrap failed: {e}; retrying in {delay:.0f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay)
+    startup["state"], startup["error"] = "ready", None
+    threading.Thread(target=retention_loop, name="retention", daemon=True).start()
+    threading.Thread(target=silence_loop, name="silence-check", daemon=True).start()
+
+
+def run_bootstrap():
+    with pg_pool.connection() as (sql_conn, sql_cursor):
+        startup["state"] = "migrating"
+        core.setup_databases(sql_cursor, sql_conn, bin_readings_collection, drop_existing=False)
+        startup["schema_ready"] = True
+
+        # Cross-worker live updates through LISTEN/NOTIFY (in-process bus if unavailable;
+        # embedded storage runs in one process, so it always uses the in-process bus)
+        if core.STORAGE == "server" and os.environ.get("SWMS_PG_EVENTS", "1") == "1":
+            events.start_pg_bridge(lambda: psycopg2.connect(**core.PG_CONFIG))
+
+        # One worker loads at a time; the others wait, then find the data present
+        sql_cursor.execute("SELECT pg_advisory_lock(hashtext(%s));", (BOOTSTRAP_LOCK,))
+        try:
+            # AUTO-LOAD DATA IF EMPTY
+            if not reading_buckets.has_readings(bin_readings_collection):
+                startup["state"] = "loading"
+                print("⚠️ No bin data found in MongoDB. Loading from CSV...")
+                core.load_data_from_csv(sql_cursor, sql_conn, bin_readings_collection)
+                core.generate_system_alerts(sql_cursor, sql_conn, bin_readings_collection)
+            else:
+                print("✅ MongoDB already contains readings. Skipping CSV load.")
+                core.prime_alert_engine(bin_readings_collection)
+        finally:
+            sql_conn.rollback()
+            sql_cursor.execute("SELECT pg_advisory_unlock(hashtext(%s));", (BOOTSTRAP_LOCK,))
+            sql_conn.commit()
+
+
+RETENTION_LOCK = "swms_retention"
+
+
+def retention_loop():
+    """Compact old readings every SWMS_RETENTION_INTERVAL_HOURS (0 disables); one worker at a time."""
+    interval = float(os.environ.get("SWMS_RETENTION_INTERVAL_HOURS", 6)) * 3600
+    while interval > 0:
+        try:
+            with pg_pool.connection() as (sql_conn, sql_cursor):
+                sql_cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s));", (RETENTION_LOCK,))
+                if sql_cursor.fetchone()[0]:
+                    try:
+                        core.compact_readings(bin_readings_collection)
+                    finally:
+                        sql_cursor.execute("SELECT pg_advisory_unlock(hashtext(%s));", (RETENTION_LOCK,))
+                sql_conn.commit()
+        except Exception as e:
+            print(f"❌ Retention run failed: {e}")
+        time.sleep(interval)
+
+
+SILENCE_LOCK = "swms_silence_check"
+
+
+def silence_loop():
+    """Alert on silent sensors every SWMS_SILENCE_CHECK_SECONDS (0 disables); one worker at a time."""
+    interval = float(os.environ.get("SWMS_SILENCE_CHECK_SECONDS", 60))
+    while interval > 0:
+        time.sleep(interval)
+        try:
+            with pg_pool.connection() as (sql_conn, sql_cursor):
+                sql_cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s));", (SILENCE_LOCK,))
+                if sql_cursor.fetchone()[0]:
+                    try:
+                        core.check_silent_sensors(sql_cursor, sql_conn, bin_readings_collection)
+                    finally:
+                        sql_cursor.execute("SELECT pg_advisory_unlock(hashtext(%s));", (SILENCE_LOCK,))
+                sql_conn.commit()
+        except Exception as e:
+            print(f"❌ Silence check failed: {e}")
+
+
+bootstrap_thread = threading.Thread(target=bootstrap, name="bootstrap", daemon=True)
+bootstrap_thread.start()
+
+
+@app.before_request
+def require_schema():
+    if not startup["schema_ready"] and request.endpoint not in ALWAYS_AVAILABLE:
+        return jsonify({"error": "Service is starting up", "state": startup["state"]}), 503, {"Retry-After": "5"}
+
+
+# -------------------------------------------------
+# SENSOR READING BUFFER
+# -------------------------------------------------
+# Batches that still fail after SWMS_READING_MAX_ATTEMPTS flushes are appended here as
+# NDJSON; once the cause is fixed the file can be replayed through POST /api/readings.
+DEAD_LETTER_PATH = os.environ.get("SWMS_DEAD_LETTER_PATH", "dead-readings.ndjson")
+
+
+def flush_readings(batch, progress):
+    with pg_pool.connection() as (sql_conn, sql_cursor):
+        core.ingest_readings(sql_cursor, sql_conn, bin_readings_collection, batch, progress)
+
+
+def dead_letter_readings(batch, error):
+    with open(DEAD_LETTER_PATH, "a") as f:
+        for r in batch:
+            f.write(json.dumps(r, default=str) + "\n")
+    print(f"☠️ {len(batch)} readings written to {DEAD_LETTER_PATH}")
+
+
+reading_buffer = ReadingBuffer(
+    flush_readings,
+    max_size=int(os.environ.get("SWMS_READING_BUFFER_MAX", 50000)),
+    flush_size=int(os.environ.get("SWMS_READING_FLUSH_SIZE", 2000)),
+    flush_interval=float(os.environ.get("SWMS_READING_FLUSH_INTERVAL", 1.0)),
+    max_attempts=int(os.environ.get("SWMS_READING_MAX_ATTEMPTS", 10)),
+    dead_letter_fn=dead_letter_readings,
+)
+atexit.register(reading_buffer.flush_now)
+
 
 # -------------------------------------------------
-# AUTO-LOAD DATA IF EMPTY
+# PAGINATION HELPERS
 # -------------------------------------------------
-if bin_readings_collection.count_documents({}) == 0:
-    print("⚠️ No bin data found in MongoDB. Loading from CSV...")
-    core.load_data_from_csv(sql_cursor, sql_conn, bin_readings_collection)
-    core.generate_system_alerts(sql_cursor, sql_conn)
-else:
-    print(f"✅ MongoDB already contains {bin_readings_collection.count_documents({})} records. Skipping CSV load.")
+def page_args(default_limit, max_limit=1000):
+    """Common ?cursor=&limit=&fields= arguments."""
+    limit = min(max(optional_int("limit", default_limit) or 0, 1), max_limit)
+    fields = request.args.get("fields")
+    return request.args.get("cursor"), limit, fields.split(",") if fields else None
+
+
+def paged(items, next_cursor):
+    """JSON array body (unchanged for existing clients) with the next page cursor in a header."""
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return jsonify(items), 200, headers
+
+
+def conditional(tagged):
+    """JSON response for a cached (etag, data) pair; 304 if the client already has it."""
+    etag, data = tagged
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    if request.if_none_match.contains(etag):
+        return "", 304, headers
+    return jsonify(data), 200, headers
+
+
+def number_arg(name, convert, default=None):
+    """?name= converted with `convert` (`default` if absent); ValueError naming the argument if malformed."""
+    value = request.args.get(name, default)
+    if value in (None, ""):
+        return None
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be {'an integer' if convert is int else 'a number'}") from None
+
+
+def optional_float(name, default=None):
+    return number_arg(name, float, default)
+
+
+def optional_int(name, default=None):
+    return number_arg(name, int, default)
+
+
+def geo_args():
+    """?bbox=min_lon,min_lat,max_lon,max_lat and ?near=lat,lon&radius=<km>."""
+    bbox = request.args.get("bbox")
+    if bbox:
+        bbox = [float(v) for v in bbox.split(",")]
+        if len(bbox) != 4:
+            raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    near = request.args.get("near")
+    if near:
+        lat, lon = (float(v) for v in near.split(","))
+        near = (lat, lon, optional_float("radius", 1.0))
+    return bbox or None, near or None
+
+
+# -------------------------------------------------
+# PER-REQUEST CONNECTIONS
+# -------------------------------------------------
+def get_db():
+    """Check out a pooled connection for this request (returned in teardown)."""
+    if "sql_conn" not in g:
+        g.sql_conn = pg_pool.getconn()
+        g.sql_cursor = g.sql_conn.cursor()
+    return g.sql_conn, g.sql_cursor
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    sql_conn = g.pop("sql_conn", None)
+    if sql_conn is None:
+        return
+    g.pop("sql_cursor").close()
+    if exc is not None:
+        sql_conn.rollback()
+    pg_pool.putconn(sql_conn)
+
+
+@app.errorhandler(core.PoolTimeout)
+def pool_timeout(e):
+    return jsonify({"error": str(e)}), 503
 
 
 # -------------------------------------------------
@@ -31,6 +288,7 @@ else:
 @app.route("/api/dashboard", methods=["GET"])
 def dashboard():
     """Return summary data for dashboard cards."""
+    sql_conn, sql_cursor = get_db()
     summary = core.get_dashboard_summary(sql_cursor, bin_readings_collection)
 
     response = {
@@ -52,41 +310,157 @@ def dashboard():
 def collection_efficiency():
     """Return collection efficiency trends for dashboard graph."""
     try:
-        days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-        efficiencies = [82, 91, 75, 96, 88, 79, 93]
-        data = [{"day": d, "efficiency": e} for d, e in zip(days, efficiencies)]
-        return jsonify(data), 200
+        days = optional_int("days", 7)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    sql_conn, sql_cursor = get_db()
+    try:
+        return jsonify(core.get_collection_efficiency(sql_cursor, days)), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# -------------------------------------------------
+# FORECAST ENDPOINT
+# -------------------------------------------------
+@app.route("/api/forecast", methods=["GET"])
+def forecast():
+    """Return bins ordered by predicted time until full."""
+    try:
+        threshold = optional_float("threshold", 80)
+        limit = optional_int("limit", 50)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(core.get_fill_forecast(bin_readings_collection, threshold, limit)), 200
+
+
+# -------------------------------------------------
+# ROLLUPS ENDPOINT
+# -------------------------------------------------
+@app.route("/api/rollups", methods=["GET"])
+def rollup_series():
+    """
+    Return a pre-aggregated time series.
+    ?metric=fill|fill_area|collected_bins|collected_fill|route_minutes
+    &granularity=hour|day&key=<serial, address or truck id>&start=<ISO>&end=<ISO>
+    """
+    sql_conn, sql_cursor = get_db()
+    try:
+        start, end = request.args.get("start"), request.args.get("end")
+        series = core.query_rollups(
+            sql_cursor, bin_readings_collection,
+            request.args.get("metric", "fill"),
+            request.args.get("granularity", "day"),
+            request.args.get("key"),
+            datetime.fromisoformat(start) if start else None,
+            datetime.fromisoformat(end) if end else None,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(series), 200
+
+
+# -------------------------------------------------
+# READING HISTORY & RETENTION
+# -------------------------------------------------
+@app.route("/api/bins/<serial>/history", methods=["GET"])
+def bin_history(serial):
+    """Readings of one bin across the hot and cold tiers. ?start=<ISO>&end=<ISO>"""
+    try:
+        start, end = request.args.get("start"), request.args.get("end")
+        rows = core.get_reading_history(
+            bin_readings_collection, serial,
+            datetime.fromisoformat(start) if start else None,
+            datetime.fromisoformat(end) if end else None,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(rows), 200
+
+
+@app.route("/api/retention", methods=["GET", "POST"])
+def retention_status():
+    """GET: size of each tier. POST: compact now (?hot_days= overrides SWMS_HOT_DAYS)."""
+    if request.method == "POST":
+        try:
+            hot_days = optional_int("hot_days")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        sql_conn, sql_cursor = get_db()
+        sql_cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s));", (RETENTION_LOCK,))
+        if not sql_cursor.fetchone()[0]:
+            return jsonify({"message": "Compaction already running."}), 409
+        try:
+            result = core.compact_readings(bin_readings_collection, hot_days)
+        finally:
+            sql_cursor.execute("SELECT pg_advisory_unlock(hashtext(%s));", (RETENTION_LOCK,))
+            sql_conn.commit()
+        result["cutoff"] = str(result["cutoff"])
+        return jsonify(result), 200
+    return jsonify(core.retention.tier_stats(bin_readings_collection)), 200
+
+
 # -------------------------------------------------
 # BINS ENDPOINT
 # -------------------------------------------------
 @app.route("/api/bins", methods=["GET"])
 def bins():
-    """Return standardized bin data for frontend."""
-    pipeline = [
-        {"$sort": {"time": -1}},
-        {"$group": {"_id": "$serial", "latest": {"$first": "$$ROOT"}}},
-        {"$replaceRoot": {"newRoot": "$latest"}},
-        {"$limit": 100}
-    ]
-    raw_bins = list(bin_readings_collection.aggregate(pipeline))
+    """
+    Return standardized bin data for frontend, ordered by serial.
+    ?cursor=&limit=&fields=serial,fill_level,...&status=&area=&min_fill=&max_fill=
+    &bbox=min_lon,min_lat,max_lon,max_lat&near=lat,lon&radius=<km>
+    """
+    try:
+        cursor, limit, fields = page_args(100)
+        bbox, near = geo_args()
+        items, next_cursor = core.list_bins(
+            bin_readings_collection, cursor, limit,
+            status=request.args.get("status"), area=request.args.get("area"),
+            min_fill=optional_float("min_fill"), max_fill=optional_float("max_fill"), fields=fields,
+            bbox=bbox, near=near,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return paged(items, next_cursor)
+
+
+# -------------------------------------------------
+# SENSOR READINGS INGESTION ENDPOINT
+# -------------------------------------------------
+@app.route("/api/readings", methods=["POST"])
+def post_readings():
+    """
+    Accept one reading, a JSON array of readings, or NDJSON (one reading per line).
+    Readings are queued and written in batches; 429/503 signal the sensor to back off.
+    """
+    if not reading_buffer.healthy:
+        return jsonify({"error": "Reading storage unavailable."}), 503, {"Retry-After": "30"}
+
+    try:
+        if request.mimetype in ("application/x-ndjson", "application/ndjson"):
+            raw = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        else:
+            raw = request.get_json()
+            raw = raw if isinstance(raw, list) else [raw]
+        readings = [core.normalize_reading(r) for r in raw]
+    except Exception as e:
+        return jsonify({"error": f"Invalid reading: {e}"}), 400
+
+    if not readings:
+        return jsonify({"error": "No readings supplied."}), 400
+
+    try:
+        reading_buffer.offer(readings)
+    except BufferFull as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "5"}
 
-    formatted_bins = []
-    for b in raw_bins:
-        formatted_bins.append({
-            "serial": b.get("serial"),
-            "address": b.get("address"),
-            "status": b.get("bin_status") or "Unknown",
-            "fill_level": b.get("status_current_fill_level") or 0,
-            "lat": b.get("lat"),
-            "lon": b.get("lon"),
-            "last_updated": b.get("time"),
-        })
+    return jsonify({"accepted": len(readings)}), 202
 
-    return jsonify(formatted_bins), 200
+
+@app.route("/api/readings/stats", methods=["GET"])
+def reading_stats():
+    """Return ingestion buffer counters."""
+    return jsonify(reading_buffer.stats()), 200
 
 
 # -------------------------------------------------
@@ -94,11 +468,9 @@ def bins():
 # -------------------------------------------------
 @app.route("/api/trucks", methods=["GET"])
 def trucks():
-    """Return all trucks and their status."""
-    sql_cursor.execute("SELECT id, name, status FROM Trucks;")
-    data = sql_cursor.fetchall()
-    trucks_list = [{"id": t[0], "name": t[1], "status": t[2]} for t in data]
-    return jsonify(trucks_list), 200
+    """Return all trucks and their status (cached; 304 on a matching If-None-Match)."""
+    sql_conn, sql_cursor = get_db()
+    return conditional(core.get_trucks(sql_cursor))
 
 
 # -------------------------------------------------
@@ -106,19 +478,20 @@ def trucks():
 # -------------------------------------------------
 @app.route("/api/alerts", methods=["GET"])
 def alerts():
-    """Return recent system alerts."""
-    sql_cursor.execute("""
-        SELECT id, type, message, severity, timestamp 
-        FROM MonitoringAlerts 
-        ORDER BY timestamp DESC 
-        LIMIT 10;
-    """)
-    data = sql_cursor.fetchall()
-    alerts_list = [
-        {"id": a[0], "type": a[1], "message": a[2], "severity": a[3], "timestamp": str(a[4])}
-        for a in data
-    ]
-    return jsonify(alerts_list), 200
+    """
+    Return recent system alerts, newest first.
+    ?cursor=&limit=&fields=&severity=&type=&serial=
+    """
+    sql_conn, sql_cursor = get_db()
+    try:
+        cursor, limit, fields = page_args(10)
+        items, next_cursor = core.list_alerts(
+            sql_cursor, cursor, limit, severity=request.args.get("severity"),
+            alert_type=request.args.get("type"), serial=request.args.get("serial"), fields=fields,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return paged(items, next_cursor)
 
 
 # -------------------------------------------------
@@ -126,39 +499,9 @@ def alerts():
 # -------------------------------------------------
 @app.route("/api/landfills", methods=["GET"])
 def landfills():
-    """Return landfill capacity and usage."""
-    sql_cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Landfills (
-            id SERIAL PRIMARY KEY,
-            name TEXT,
-            capacity_tons DOUBLE PRECISION,
-            used_tons DOUBLE PRECISION
-        );
-    """)
-    sql_conn.commit()
-
-    sql_cursor.execute("SELECT id, name, capacity_tons, used_tons FROM Landfills;")
-    data = sql_cursor.fetchall()
-
-    if not data:
-        sql_cursor.execute(
-            "INSERT INTO Landfills (name, capacity_tons, used_tons) VALUES ('Central Landfill', 10000, 6800);"
-        )
-        sql_conn.commit()
-        sql_cursor.execute("SELECT id, name, capacity_tons, used_tons FROM Landfills;")
-        data = sql_cursor.fetchall()
-
-    landfills_list = [
-        {
-            "id": l[0],
-            "name": l[1],
-            "capacity_tons": l[2],
-            "used_tons": l[3],
-            "usage_percent": round((l[3] / l[2]) * 100, 2) if l[2] else 0
-        }
-        for l in data
-    ]
-    return jsonify(landfills_list), 200
+    """Return landfill capacity and usage (cached; 304 on a matching If-None-Match)."""
+    sql_conn, sql_cursor = get_db()
+    return conditional(core.get_landfills(sql_cursor))
 
 
 # -------------------------------------------------
@@ -167,37 +510,19 @@ def landfills():
 @app.route("/api/routes", methods=["GET", "POST"])
 def routes():
     """GET returns routes; POST creates new route."""
+    sql_conn, sql_cursor = get_db()
     try:
-        # ✅ Ensure table exists
-        sql_cursor.execute("""
-            CREATE TABLE IF NOT EXISTS Routes (
-                name TEXT NOT NULL,
-                area TEXT,
-                truck_id VARCHAR REFERENCES Trucks(id)
-            );
-        """)
-        sql_conn.commit()
-
+        # ?cursor=&limit=&fields=&status=&area=&truck_id=
         if request.method == "GET":
-            sql_cursor.execute("""
-                SELECT r.id, r.name, r.area, r.status, t.name AS truck_name
-                FROM Routes r
-                LEFT JOIN Trucks t ON r.truck_id = t.id
-                ORDER BY r.created_at DESC
-                LIMIT 20;
-            """)
-            rows = sql_cursor.fetchall()
-            routes = [
-                {
-                    "id": r[0],
-                    "name": r[1],
-                    "area": r[2],
-                    "status": r[3],
-                    "truck_name": r[4] or "Unassigned"
-                }
-                for r in rows
-            ]
-            return jsonify(routes), 200
+            try:
+                cursor, limit, fields = page_args(20)
+                routes, next_cursor = core.list_routes(
+                    sql_cursor, cursor, limit, status=request.args.get("status"),
+                    area=request.args.get("area"), truck_id=optional_int("truck_id"), fields=fields,
+                )
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return paged(routes, next_cursor)
 
         # ✅ POST - Create new route
         if request.method == "POST":
@@ -211,11 +536,9 @@ def routes():
 
             # 🔍 Allow both numeric truck_id or truck_name
             if isinstance(truck_ref, str) and not truck_ref.isdigit():
-                sql_cursor.execute("SELECT id FROM Trucks WHERE name = %s", (truck_ref,))
-                truck_row = sql_cursor.fetchone()
-                if not truck_row:
+                truck_id = core.get_truck_id(sql_cursor, truck_ref)
+                if truck_id is None:
                     return jsonify({"message": f"Truck '{truck_ref}' not found"}), 404
-                truck_id = truck_row[0]
             else:
                 truck_id = int(truck_ref)
 
@@ -231,6 +554,9 @@ def routes():
             # ✅ Update truck status
             sql_cursor.execute("UPDATE Trucks SET status = 'On-Route' WHERE id = %s", (truck_id,))
             sql_conn.commit()
+            core.invalidate_dashboard_summary()
+            core.invalidate_trucks()
+            events.publish("trucks", [{"id": truck_id, "status": "On-Route"}])
 
             return jsonify({
                 "message": "Route created successfully",
@@ -248,19 +574,44 @@ def routes():
 # -------------------------------------------------
 @app.route("/api/collect", methods=["POST"])
 def collect():
-    """Trigger waste collection and assign a truck."""
-    bins = core.find_bins_for_collection(bin_readings_collection)
+    """
+    Trigger waste collection. Default claims one idle truck and every unclaimed full bin;
+    ?mode=fleet splits the bins across all idle trucks by capacity and route length.
+    ?horizon_hours=N also collects bins forecast to fill up within N hours.
+    ?near=lat,lon&radius=<km> restricts collection to bins around a point.
+    """
+    sql_conn, sql_cursor = get_db()
+    body = request.get_json(silent=True) or {}
+    try:
+        horizon = optional_float("horizon_hours", body.get("horizon_hours"))
+        _, near = geo_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    bins = core.find_bins_for_collection(bin_readings_collection, horizon_hours=horizon, near=near,
+                                         sql_cursor=sql_cursor)
     if not bins:
         return jsonify({"message": "No bins need collection."}), 200
 
-    truck = core.get_available_truck(sql_cursor)
+    if (request.args.get("mode") or body.get("mode")) == "fleet":
+        assignments, unassigned = core.dispatch_fleet(sql_cursor, sql_conn, bins)
+        if assignments is None:
+            return jsonify({"message": "Fleet assignment failed."}), 500
+        if not assignments:
+            return jsonify({"message": "No idle trucks or unclaimed bins available.", "unassigned_bins": len(unassigned)}), 200
+
+        return jsonify({
+            "message": f"{len(assignments)} trucks assigned to routes.",
+            "routes": [{"truck": t[1], "bins": [b["serial"] for b in r]} for t, r in assignments],
+            "unassigned_bins": len(unassigned),
+        }), 200
+
+    truck, route = core.dispatch_truck(sql_cursor, sql_conn, bins)
     if not truck:
         return jsonify({"message": "No trucks available."}), 200
+    if not route:
+        return jsonify({"message": "No bins need collection."}), 200
 
-    route = core.create_optimized_route(bins)
-    core.assign_truck_to_route(sql_cursor, sql_conn, truck[0], route)
-
-    return jsonify({"message": f"Truck {truck[1]} assigned to route."}), 200
+    return jsonify({"message": f"Truck {truck[1]} assigned to route.", "bins": len(route)}), 200
 
 
 # -------------------------------------------------
@@ -269,6 +620,7 @@ def collect():
 @app.route("/api/complete_route/<int:truck_id>", methods=["POST"])
 def complete_route_endpoint(truck_id):
     """Mark a truck's route as complete and reset its status."""
+    sql_conn, sql_cursor = get_db()
     try:
         sql_cursor.execute("SELECT name, status FROM Trucks WHERE id = %s", (truck_id,))
         truck = sql_cursor.fetchone()
@@ -286,6 +638,29 @@ def complete_route_endpoint(truck_id):
         return jsonify({"message": f"Error completing route: {e}"}), 500
 
 
+# -------------------------------------------------
+# LIVE UPDATES (SERVER-SENT EVENTS)
+# -------------------------------------------------
+@app.route("/api/stream", methods=["GET"])
+def stream():
+    """Push bin, alert and truck changes to the client as they happen."""
+    def generate(q):
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event_type, data = q.get(timeout=15)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+        finally:
+            events.unsubscribe(q)
+
+    return Response(generate(events.subscribe()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 # -------------------------------------------------
 # HEALTH CHECK
 # -------------------------------------------------
@@ -294,9 +669,99 @@ def home():
     return jsonify({"status": "Backend is running ✅"}), 200
 
 
+@app.route("/api/ready", methods=["GET"])
+def ready():
+    """Readiness probe: 200 once migrations and the initial data load are done, else 503."""
+    return jsonify(startup), 200 if startup["state"] == "ready" else 503
+
+
+@app.route("/api/pool", methods=["GET"])
+def pool_stats():
+    """Return connection pool size and wait-time metrics."""
+    return jsonify(pg_pool.stats()), 200
+
+
+# -------------------------------------------------
+# METRICS & PROFILING
+# -------------------------------------------------
+def runtime_gauges():
+    pool = pg_pool.stats()
+    buffer = reading_buffer.stats()
+    cache = core.summary_cache.stats()
+    reference = core.reference_cache.stats()
+    trucks = core.truck_cache.stats()
+    names = core.truck_name_cache.stats()
+    bins = core.bin_metadata_cache.stats()
+    return [
+        ("swms_pg_pool_in_use", "Pooled PostgreSQL connections checked out.", {}, pool["in_use"]),
+        ("swms_pg_pool_checkouts_total", "Pool checkouts since start.", {}, pool["checkouts"]),
+        ("swms_pg_pool_timeouts_total", "Checkouts that timed out waiting.", {}, pool["timeouts"]),
+        ("swms_pg_pool_wait_seconds_total", "Time spent waiting for a pooled connection.", {}, pool["total_wait_seconds"]),
+        ("swms_reading_buffer_queued", "Sensor readings waiting to be flushed.", {}, buffer["queued"]),
+        ("swms_reading_buffer_rejected_total", "Readings rejected because the buffer was full.", {}, buffer["rejected"]),
+        ("swms_reading_buffer_dead_lettered_total", "Readings dropped to the dead-letter file after repeated flush failures.", {}, buffer["dead_lettered"]),
+        ("swms_summary_cache_hits_total", "Dashboard summary cache hits.", {}, cache["hits"]),
+        ("swms_summary_cache_misses_total", "Dashboard summary cache misses.", {}, cache["misses"]),
+        ("swms_reference_cache_hits_total", "Reference data cache hits.", {"cache": "reference"}, reference["hits"]),
+        ("swms_reference_cache_hits_total", "Reference data cache hits.", {"cache": "trucks"}, trucks["hits"]),
+        ("swms_reference_cache_hits_total", "Reference data cache hits.", {"cache": "truck_names"}, names["hits"]),
+        ("swms_reference_cache_hits_total", "Reference data cache hits.", {"cache": "bins"}, bins["hits"]),
+        ("swms_reference_cache_misses_total", "Reference data cache misses.", {"cache": "reference"}, reference["misses"]),
+        ("swms_reference_cache_misses_total", "Reference data cache misses.", {"cache": "trucks"}, trucks["misses"]),
+        ("swms_reference_cache_misses_total", "Reference data cache misses.", {"cache": "truck_names"}, names["misses"]),
+        ("swms_reference_cache_misses_total", "Reference data cache misses.", {"cache": "bins"}, bins["misses"]),
+        ("swms_reference_cache_evictions_total", "LRU evictions from the bin metadata cache.", {}, bins["evictions"]),
+        ("swms_event_subscribers", "Open live-update streams.", {}, events.subscriber_count()),
+        ("swms_ready", "1 once bootstrap has finished.", {}, int(startup["state"] == "ready")),
+    ]
+
+
+metrics.register_gauges(runtime_gauges)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus text exposition of request, query and runtime metrics for this process."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/profiler", methods=["GET", "POST"])
+def profiler():
+    """
+    Sampling profiler, available when SWMS_PROFILER=1.
+    POST {"action": "start"|"stop"|"reset", "interval_ms": 10}; GET ?limit=N returns
+    collapsed stacks (flamegraph input), most sampled first.
+    """
+    if os.environ.get("SWMS_PROFILER", "0") != "1":
+        return jsonify({"error": "Profiler disabled (set SWMS_PROFILER=1)"}), 404
+    if request.method == "GET":
+        try:
+            limit = optional_int("limit")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return Response(metrics.profiler.collapsed(limit), mimetype="text/plain")
+
+    body = request.get_json(silent=True) or {}
+    action = body.get("action")
+    if action == "start":
+        interval = body.get("interval_ms")
+        try:
+            interval = float(interval) if interval not in (None, "") else None
+        except (TypeError, ValueError):
+            return jsonify({"error": "interval_ms must be a number"}), 400
+        metrics.profiler.start(interval / 1000 if interval else None)
+    elif action == "stop":
+        metrics.profiler.stop()
+    elif action == "reset":
+        metrics.profiler.reset()
+    else:
+        return jsonify({"error": "action must be start, stop or reset"}), 400
+    return jsonify(metrics.profiler.stats()), 200
+
+
 # -------------------------------------------------
 # RUN APP
 # -------------------------------------------------
 if __name__ == "__main__":
     print("🚀 Starting Smart Waste Backend Server on http://localhost:5000")
-    app.run(debug=True, port=5000)
+    app.run(debug=True, port=5000, threaded=True)
@@ -0,0 +1,336 @@
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+import psycopg2
+from pymongo import MongoClient
+import trial_core as core
+import docstore
+import embedded
+import reading_buckets
+import routing
+import synthetic
+
+# -----------------------------------------------------------
+# BENCHMARK HARNESS
+# -----------------------------------------------------------
+# Generates a synthetic city (synthetic.py), loads it and measures:
+#   ingest       CSV -> PostgreSQL/MongoDB throughput, plus the incremental no-op re-run
+#   storage      documents and bytes of the reading collections (--readings-format)
+#   aggregations latency of the read paths behind the dashboard, collection and forecast
+#   routing      planning time and tour quality (vs. nearest neighbour) by route size
+#   endpoints    p50/p99 and throughput of /api/* handlers under concurrent requests
+# Everything runs against throwaway databases (SWMS_BENCH_PG_DB / SWMS_BENCH_MONGO_DB),
+# never the application's own. Without a MongoDB server the harness falls back to
+# mongomock (optional requirement); without PostgreSQL the SQL-backed stages are
+# skipped and reported as such.
+# --storage embedded benchmarks the single-file SQLite backend instead (both stores in
+# a temporary file; no servers needed).
+# Results are printed and written as JSON so runs can be diffed.
+BENCH_PG_DB = os.environ.get("SWMS_BENCH_PG_DB", "smart_waste_bench")
+BENCH_MONGO_DB = os.environ.get("SWMS_BENCH_MONGO_DB", "smart_waste_bench")
+ENDPOINTS = [
+    "/api/dashboard",
+    "/api/bins?limit=100",
+    "/api/bins?status=Full&fields=serial,fill_level,lat,lon",
+    "/api/alerts?limit=50",
+    "/api/trucks",
+    "/api/efficiency",
+    "/api/forecast?limit=50",
+    "/api/rollups?metric=fill&granularity=day",
+]
+
+@contextmanager
+def quiet():
+    """Silence the per-call progress prints of the code under test."""
+    with redirect_stdout(io.StringIO()):
+        yield
+
+def summarize(samples):
+    """Latency percentiles in milliseconds for a list of durations in seconds."""
+    ms = np.asarray(samples) * 1000
+    return {
+        "n": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+def timed(fn, repeat):
+    """Run fn once cold, then `repeat` times; returns summarize() of the warm runs plus cold_ms."""
+    start = time.perf_counter()
+    fn()
+    cold = time.perf_counter() - start
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {"cold_ms": round(cold * 1000, 3), **summarize(samples)}
+
+# -----------------------------------------------------------
+# BACKENDS
+# -----------------------------------------------------------
+def connect_postgres(dbname=BENCH_PG_DB, timeout=3):
+    """Connect to (creating if needed) the benchmark database; None if PostgreSQL is unreachable."""
+    config = dict(core.PG_CONFIG, connect_timeout=timeout)
+    try:
+        admin = psycopg2.connect(**dict(config, dbname="postgres"))
+    except psycopg2.OperationalError as e:
+        print(f"⚠️ PostgreSQL unavailable, skipping SQL stages: {e}".strip())
+        return None
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_database WHERE datname=%s;", (dbname,))
+        if cur.fetchone() is None:
+            cur.execute(f'CREATE DATABASE "{dbname}";')
+    admin.close()
+    core.PG_CONFIG["dbname"] = dbname  # the app pool and event bridge follow PG_CONFIG
+    return psycopg2.connect(**config)
+
+def connect_mongo(mode="auto", dbname=BENCH_MONGO_DB):
+    """(client, db, bin_readings, backend_name) for a live server or mongomock."""
+    if mode in ("auto", "live"):
+        try:
+            client = MongoClient(core.MONGO_URI, serverSelectionTimeoutMS=2000)
+            client.admin.command("ping")
+            client.drop_database(dbname)
+            return client, client[dbname], client[dbname]["bin_readings"], "mongodb"
+        except Exception as e:
+            if mode == "live":
+                raise
+            print(f"⚠️ MongoDB unavailable, using mongomock: {e}".splitlines()[0])
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("❌ No MongoDB server and mongomock is not installed "
+                         "(pip install mongomock, or run with --storage embedded).")
+    client = mongomock.MongoClient()
+    return client, client[dbname], client[dbname]["bin_readings"], "mongomock"
+
+def connect_embedded(path, dbname=BENCH_MONGO_DB):
+    """(sql_conn, (client, db, bin_readings, "sqlite")) on one fresh SQLite file."""
+    core.STORAGE, core.SQLITE_PATH = "embedded", path  # the app pool follows these
+    client = docstore.Client(path)
+    return embedded.connect(path), (client, client[dbname], client[dbname]["bin_readings"], "sqlite")
+
+# -----------------------------------------------------------
+# STAGES
+# -----------------------------------------------------------
+def bench_ingest(sql_conn, coll, csv_path, readings_df):
+    result = {"rows": len(readings_df)}
+    if sql_conn is not None:
+        sql_cursor = sql_conn.cursor()
+        with quiet():
+            core.setup_databases(sql_cursor, sql_conn, coll, drop_existing=True)
+            result["full"] = core.load_data_from_csv(sql_cursor, sql_conn, coll, csv_path)
+            start = time.perf_counter()
+            core.load_data_from_csv(sql_cursor, sql_conn, coll, csv_path, incremental=True)
+            result["incremental_rerun_seconds"] = round(time.perf_counter() - start, 3)
+            core.generate_system_alerts(sql_cursor, sql_conn, coll)
+        return result
+
+    # MongoDB-only path: the same insert_readings pipeline, minus the Bins upsert
+    with quiet():
+        core.ensure_reading_unique_index(coll)
+        reading_buckets.ensure_indexes(coll)
+        core.get_bin_state_collection(coll).create_index([("location", "2dsphere")])
+        core.alert_engine.reset(core.get_alert_state_collection(coll))
+        core.fill_forecaster.reset()
+        start = time.perf_counter()
+        records = core._prepare_readings(readings_df).to_dict("records")
+        inserted = core.insert_readings(coll, records)
+        core.alert_engine.drain()
+    seconds = time.perf_counter() - start
+    result["full"] = {"rows_inserted": inserted, "seconds": round(seconds, 3),
+                      "rows_per_sec": round(inserted / seconds, 1) if seconds else None}
+    return result
+
+def storage_stats(coll):
+    """Documents, data and index bytes of the per-reading and bucket collections."""
+    stats = {}
+    for name in (coll.name, reading_buckets.COLLECTION):
+        s = coll.database.command("collStats", name)
+        stats[name] = {"documents": s.get("count", 0), "data_bytes": s.get("size", 0),
+                       "index_bytes": s.get("totalIndexSize", 0)}
+    return stats
+
+def bench_aggregations(sql_conn, coll, repeat):
+    some_serial = core.get_bin_state_collection(coll).find_one({}, {"_id": 1})["_id"]
+    cases = {
+        "find_bins_for_collection": lambda: core.find_bins_for_collection(coll),
+        "find_bins_for_collection_24h": lambda: core.find_bins_for_collection(coll, horizon_hours=24),
+        "fill_forecast": lambda: core.get_fill_forecast(coll),
+        "list_bins_page": lambda: core.list_bins(coll, limit=100),
+        "list_bins_near": lambda: core.list_bins(coll, limit=100, near=(*synthetic.CITY_CENTRE, 2.0)),
+        "rollups_fill_daily": lambda: core.query_rollups(None, coll, "fill", "day"),
+        "rollups_fill_hourly_one_bin": lambda: core.query_rollups(None, coll, "fill", "hour", key=some_serial),
+        "reading_history_one_bin": lambda: core.get_reading_history(coll, some_serial),
+    }
+    if sql_conn is not None:
+        sql_cursor = sql_conn.cursor()
+        cases.update({
+            "dashboard_summary_uncached": lambda: core._load_dashboard_summary(sql_cursor, coll),
+            "collection_efficiency": lambda: core.get_collection_efficiency(sql_cursor),
+            "list_alerts_page": lambda: core.list_alerts(sql_cursor, limit=50),
+        })
+    results, skipped = {}, []
+    with quiet():
+        for name, fn in cases.items():
+            try:
+                results[name] = timed(fn, repeat)
+            except NotImplementedError as e:  # e.g. $geoWithin under mongomock
+                skipped.append(f"aggregations.{name}: {e}")
+    return results, skipped
+
+def bench_routing(bins_df, sizes, time_limit, seed):
+    rng = np.random.default_rng(seed)
+    results = {}
+    for size in sizes:
+        sample = bins_df.iloc[rng.choice(len(bins_df), size=min(size, len(bins_df)), replace=False)]
+        points = list(zip(sample["lat"], sample["lon"]))
+        _, stats = routing.plan_route(points, synthetic.CITY_CENTRE, time_limit)
+        stats["improvement_vs_nn_pct"] = round(100 * (1 - stats["length_km"] / stats["initial_km"]), 2) \
+            if stats["initial_km"] else 0.0
+        trucks = [(40, 60.0)] * int(np.ceil(len(points) / 40))
+        start = time.perf_counter()
+        planned, unassigned = routing.plan_fleet_routes(points, trucks, synthetic.CITY_CENTRE, time_limit)
+        stats["fleet"] = {
+            "trucks": len(planned), "unassigned": len(unassigned),
+            "total_km": round(sum(s["length_km"] for _, _, s in planned), 3),
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        results[str(size)] = stats
+    return results
+
+def bench_endpoints(mongo, concurrency, total_requests):
+    """Drive the Flask handlers in-process (test client) from `concurrency` threads."""
+    core.get_mongo_connection = lambda max_pool_size=100: mongo[:3]
+    os.environ.setdefault("SWMS_PG_EVENTS", "0")
+    os.environ.setdefault("SWMS_BOOTSTRAP_ATTEMPTS", "1")  # fail the run instead of retrying
+    with quiet():
+        import app as app_module
+        app_module.bootstrap_thread.join()
+    if app_module.startup["state"] != "ready":
+        raise RuntimeError(f"app bootstrap failed: {app_module.startup['error']}")
+
+    def worker(k):
+        client = app_module.app.test_client()
+        samples = []
+        for i in range(k, total_requests, concurrency):
+            path = ENDPOINTS[i % len(ENDPOINTS)]
+            start = time.perf_counter()
+            status = client.get(path).status_code
+            samples.append((path, time.perf_counter() - start, status))
+        return samples
+
+    start = time.perf_counter()
+    with quiet(), ThreadPoolExecutor(concurrency) as pool:
+        samples = [s for batch in pool.map(worker, range(concurrency)) for s in batch]
+    wall = time.perf_counter() - start
+    results = {"concurrency": concurrency, "requests": len(samples),
+               "throughput_rps": round(len(samples) / wall, 1), "all": summarize([s[1] for s in samples])}
+    for path in ENDPOINTS:
+        mine = [s for s in samples if s[0] == path]
+        results[path] = {**summarize([s[1] for s in mine]),
+                         "errors": sum(1 for s in mine if s[2] >= 400)}
+    return results
+
+# -----------------------------------------------------------
+# ENTRY POINT
+# -----------------------------------------------------------
+def run(args):
+    report = {"started_at": datetime.utcnow().isoformat(), "config": vars(args), "skipped": []}
+    reading_buckets.FORMAT = args.readings_format
+    reading_buckets.ENABLED = args.readings_format == "buckets"
+    started = time.perf_counter()
+    bins_df = synthetic.generate_bins(args.bins, seed=args.seed)
+    readings_df = synthetic.generate_readings(bins_df, args.readings, days=args.days, seed=args.seed)
+    workdir = tempfile.mkdtemp(prefix="swms-bench-")
+    csv_path = os.path.join(workdir, "synthetic-bins.csv")
+    readings_df.to_csv(csv_path, index=False)
+    report["generate_seconds"] = round(time.perf_counter() - started, 3)
+    print(f"🧪 Generated {len(readings_df)} readings for {len(bins_df)} bins.")
+
+    if args.storage == "embedded":
+        sql_conn, mongo = connect_embedded(os.path.join(workdir, "bench.db"))
+    else:
+        sql_conn = None if args.no_postgres else connect_postgres()
+        mongo = connect_mongo(args.mongo)
+    report["backends"] = {"storage": args.storage, "sql": None if sql_conn is None else
+                          "sqlite" if args.storage == "embedded" else "postgresql", "mongo": mongo[3]}
+    if mongo[3] == "mongomock":
+        # mongomock scans every document per update, so upsert-heavy paths degrade quadratically
+        report["skipped"].append("representative MongoDB timings: mongomock numbers check that the stages run, "
+                                 "not how fast they are (keep --bins/--readings small)")
+
+    report["ingest"] = bench_ingest(sql_conn, mongo[2], csv_path, readings_df)
+    print(f"📥 Ingest: {report['ingest']['full']}")
+    try:
+        report["storage"] = storage_stats(mongo[2])
+    except Exception as e:  # collStats is not implemented by mongomock
+        report["skipped"].append(f"storage: {e}")
+    report["aggregations"], skipped = bench_aggregations(sql_conn, mongo[2], args.repeat)
+    report["skipped"] += skipped
+    report["routing"] = bench_routing(bins_df, args.route_sizes, args.route_time_limit, args.seed)
+    if sql_conn is not None:
+        report["endpoints"] = bench_endpoints(mongo, args.concurrency, args.requests)
+    else:
+        report["skipped"].append("endpoints: require a SQL backend")
+        report["skipped"].append("aggregations.dashboard/efficiency/alerts: require a SQL backend")
+    return report
+
+def print_report(report):
+    for name, s in report.get("storage", {}).items():
+        print(f"💽 {name:16s} {s['documents']:>10,} docs  {s['data_bytes'] / 1e6:9.2f} MB data  "
+              f"{s['index_bytes'] / 1e6:9.2f} MB indexes")
+    print("\n📊 Aggregations (ms)")
+    for name, r in report["aggregations"].items():
+        print(f"   {name:32s} cold {r['cold_ms']:9.2f}   p50 {r['p50_ms']:9.2f}   p99 {r['p99_ms']:9.2f}")
+    print("🗺️ Routing")
+    for size, r in report["routing"].items():
+        print(f"   {size:>6s} bins  {r['seconds']:6.2f}s  {r['length_km']:9.2f} km  "
+              f"({r['improvement_vs_nn_pct']:5.2f}% shorter than NN)  fleet {r['fleet']['trucks']} trucks "
+              f"{r['fleet']['total_km']:.1f} km")
+    if "endpoints" in report:
+        e = report["endpoints"]
+        print(f"🌐 Endpoints ({e['concurrency']} threads, {e['throughput_rps']} req/s)")
+        for path in ENDPOINTS:
+            r = e[path]
+            print(f"   {path:55s} p50 {r['p50_ms']:8.2f}   p99 {r['p99_ms']:8.2f}   errors {r['errors']}")
+    for note in report["skipped"]:
+        print(f"⏭️ Skipped {note}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, aggregation, routing and API latency.")
+    parser.add_argument("--bins", type=int, default=2000)
+    parser.add_argument("--readings", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20, help="warm repetitions per aggregation")
+    parser.add_argument("--route-sizes", type=lambda s: [int(v) for v in s.split(",")], default=[50, 200, 1000])
+    parser.add_argument("--route-time-limit", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--mongo", choices=["auto", "live", "mock"], default="auto")
+    parser.add_argument("--readings-format", choices=["documents", "buckets"], default=reading_buckets.FORMAT,
+                        help="reading storage layout to benchmark (SWMS_READINGS_FORMAT)")
+    parser.add_argument("--storage", choices=["server", "embedded"], default=core.STORAGE,
+                        help="PostgreSQL + MongoDB, or one SQLite file for both (SWMS_STORAGE)")
+    parser.add_argument("--no-postgres", action="store_true", help="skip the SQL-backed stages")
+    parser.add_argument("--out", default="benchmark-results.json")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"💾 Results written to {args.out}")
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# -----------------------------------------------------------
+# TTL CACHE
+# -----------------------------------------------------------
+class TTLCache:
+    """
+    Thread-safe in-process cache whose entries expire `ttl` seconds after being loaded.
+    With max_entries set, the least recently used entry is evicted to make room.
+    get_or_load() lets only one thread rebuild a missing key; the others wait for its result.
+    Caches are per process, so with several workers invalidation is local and the TTL
+    bounds how stale another worker's copy can get.
+    """
+    def __init__(self, ttl=30.0, max_entries=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._generation = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def _lookup(self, key):
+        # Caller holds the lock
+        entry = self._data.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+        self.misses += 1
+        return False, None
+
+    def _store(self, key, value):
+        # Caller holds the lock
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        if self.max_entries is not None:
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            found, value = self._lookup(key)
+            return value if found else default
+
+    def generation(self):
+        """Token for set(): take it before reading the source of a value."""
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, generation=None):
+        """Store value; with a generation token, skip it if anything was invalidated since."""
+        with self._lock:
+            if generation is None or generation == self._generation:
+                self._store(key, value)
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                return value
+            load_lock = self._loading.setdefault(key, threading.Lock())
+        with load_lock:
+            # Another thread may have loaded it while we waited
+            with self._lock:
+                entry = self._data.get(key)
+                if entry and entry[0] > time.monotonic():
+                    return entry[1]
+                generation = self._generation
+            value = loader()
+            # Skip storing if an invalidation happened mid-load; the value may predate it
+            with self._lock:
+                if generation == self._generation:
+                    self._store(key, value)
+                self._loading.pop(key, None)
+            return value
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when key is None."""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "ttl": self.ttl, "max_entries": self.max_entries}
+
+def etag(value):
+    """Stable entity tag for a JSON-serialisable value (used for If-None-Match)."""
+    body = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(body.encode()).hexdigest()
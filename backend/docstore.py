@@ -0,0 +1,904 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import islice
+from math import radians, sin, cos, asin, sqrt
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne, UpdateMany, DeleteOne, DeleteMany
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+import embedded
+
+# -----------------------------------------------------------
+# EMBEDDED DOCUMENT STORE (SWMS_STORAGE=embedded)
+# -----------------------------------------------------------
+# MongoDB collections kept in the same SQLite file as the embedded SQL tables, using
+# the JSON1 functions: one table per collection, (_id TEXT PRIMARY KEY, doc TEXT), with
+# datetimes stored as {"$date": "<fixed-width ISO>"} so they sort and compare as text.
+# Client/Database/Collection implement the part of the pymongo API this backend uses
+# (find/sort/limit, find_one, counts, insert_many, bulk_write of UpdateOne upserts,
+# update_many, delete_many, indexes, and the aggregate stages of rebuild_bin_state and
+# rollups.query); anything else raises NotImplementedError rather than guessing.
+# Indexes become SQLite expression indexes on json_extract(doc, '$.<field>'), and a
+# query's top-level equality, $in and range conditions are pushed into SQL so those
+# indexes are used; the full filter is then checked in Python on the decoded documents.
+# Sorts on _id and indexed top-level fields are ordered in SQL as well, so a sorted
+# find().limit() decodes only the documents it returns.
+# Fields are matched as stored: unlike MongoDB, a condition on an array field does not
+# match its elements. 2dsphere indexes are accepted but $geoWithin is evaluated in Python.
+META_TABLE = "_docstore_indexes"
+MAX_IDLE_CONNECTIONS = 8
+_MISSING = object()  # field absent from a document
+_REMOVE = object()   # $$REMOVE in aggregation expressions
+
+# -----------------------------------------------------------
+# ENCODING
+# -----------------------------------------------------------
+def _clean(value):
+    """value in the JSON shape stored: tagged datetimes/ObjectIds, NaN as null."""
+    if isinstance(value, (str, int, type(None))):
+        return value
+    if isinstance(value, float):
+        return None if value != value else value
+    if isinstance(value, dict):
+        return {k: _clean(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_clean(v) for v in value]
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return {"$date": value.strftime("%Y-%m-%dT%H:%M:%S.%f")}
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    if hasattr(value, "item"):  # numpy scalars
+        return _clean(value.item())
+    raise TypeError(f"cannot store {type(value).__name__} in the embedded document store")
+
+def _dumps(value):
+    return json.dumps(_clean(value), separators=(",", ":"), allow_nan=False)
+
+def _tagged(obj):
+    if len(obj) == 1:
+        if "$date" in obj:
+            return datetime.fromisoformat(obj["$date"])
+        if "$oid" in obj:
+            return ObjectId(obj["$oid"])
+    return obj
+
+def _loads(text):
+    return json.loads(text, object_hook=_tagged)
+
+def _sql_value(value):
+    """Parameter comparable with json_extract() of a stored field, or None if not pushed down."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, datetime):
+        return _dumps(value)
+    return None
+
+# -----------------------------------------------------------
+# FIELD ACCESS + ORDERING
+# -----------------------------------------------------------
+def _get(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return _MISSING
+        doc = doc[part]
+    return doc
+
+def _set(doc, path, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+def _unset(doc, path):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(last, None)
+
+def _order(value):
+    """Sort key following MongoDB's cross-type order (null < numbers < strings < ... < dates)."""
+    if value is _MISSING or value is None:
+        return (1, 0)
+    if isinstance(value, bool):
+        return (8, value)
+    if isinstance(value, (int, float)):
+        return (2, value if value == value else float("-inf"))
+    if isinstance(value, str):
+        return (3, value)
+    if isinstance(value, dict):
+        return (4, _dumps(value))
+    if isinstance(value, list):
+        return (5, _dumps(value))
+    if isinstance(value, ObjectId):
+        return (7, str(value))
+    if isinstance(value, datetime):
+        return (9, value)
+    return (10, str(value))
+
+def _sort_spec(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    return [(k, d) for k, d in (key_or_list.items() if isinstance(key_or_list, dict) else key_or_list)]
+
+def _sorted(docs, spec):
+    docs = list(docs)
+    for key, direction in reversed(spec):
+        docs.sort(key=lambda d: _order(_get(d, key)), reverse=direction == -1)
+    return docs
+
+def _sql_unorderable(key):
+    """SQL condition true when `key` holds a value SQLite orders differently from MongoDB
+    (bools, arrays, objects other than dates, which includes ObjectIds)."""
+    kind = f"json_type(doc, '$.{key}')"
+    return f"({kind} IN ('true', 'false', 'array') OR ({kind} = 'object' AND json_type(doc, '$.{key}.\"$date\"') IS NULL))"
+
+# -----------------------------------------------------------
+# QUERY FILTERS
+# -----------------------------------------------------------
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _comparable(a, b):
+    return (_number(a) and _number(b)) or (isinstance(a, str) and isinstance(b, str)) or \
+        (isinstance(a, datetime) and isinstance(b, datetime))
+
+def _equal(value, target):
+    if target is None:
+        return value is _MISSING or value is None
+    return value is not _MISSING and value == target
+
+def _within(point, spec):
+    if not isinstance(point, dict) or not isinstance(point.get("coordinates"), list):
+        return False
+    lon, lat = point["coordinates"][:2]
+    if "$centerSphere" in spec:
+        (clon, clat), radius = spec["$centerSphere"]
+        a = sin(radians(lat - clat) / 2) ** 2 + cos(radians(clat)) * cos(radians(lat)) * sin(radians(lon - clon) / 2) ** 2
+        return 2 * asin(min(1.0, sqrt(a))) <= radius
+    geometry = spec.get("$geometry", {})
+    if geometry.get("type") == "Polygon":
+        ring, inside = geometry["coordinates"][0], False
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+            if (y1 > lat) != (y2 > lat) and lon < (x2 - x1) * (lat - y1) / (y2 - y1) + x1:
+                inside = not inside
+        return inside
+    raise NotImplementedError(f"embedded $geoWithin supports $centerSphere and Polygon, not {spec}")
+
+_QUERY_OPERATORS = {
+    "$eq": _equal,
+    "$ne": lambda v, t: not _equal(v, t),
+    "$gt": lambda v, t: _comparable(v, t) and v > t,
+    "$gte": lambda v, t: _comparable(v, t) and v >= t,
+    "$lt": lambda v, t: _comparable(v, t) and v < t,
+    "$lte": lambda v, t: _comparable(v, t) and v <= t,
+    "$in": lambda v, t: t.contains(v) if isinstance(t, _Members) else any(_equal(v, x) for x in t),
+    "$nin": lambda v, t: not _QUERY_OPERATORS["$in"](v, t),
+    "$exists": lambda v, t: (v is not _MISSING) == bool(t),
+    "$geoWithin": _within,
+}
+class _Members(list):
+    """An $in / $nin list with its hashable values also kept in a set, for O(1) membership."""
+    def __init__(self, values):
+        super().__init__(values)
+        self.hashed, self.other = set(), []
+        for v in self:
+            try:
+                self.hashed.add(v)
+            except TypeError:
+                self.other.append(v)
+        self.none = None in self.hashed
+
+    def contains(self, value):
+        if value is _MISSING:
+            return self.none
+        try:
+            if value in self.hashed:
+                return True
+        except TypeError:
+            pass
+        return any(_equal(value, x) for x in self.other)
+
+def _prepare(query):
+    """`query` with every $in / $nin list wrapped in _Members; done once per query, not per document."""
+    if isinstance(query, dict):
+        return {k: _Members(v) if k in ("$in", "$nin") and isinstance(v, (list, tuple)) else _prepare(v)
+                for k, v in query.items()}
+    if isinstance(query, list):
+        return [_prepare(q) for q in query]
+    return query
+
+# As in MongoDB, a condition on an array field matches if any element matches;
+# $ne / $nin on an array hold only if no element equals the target(s).
+_NEGATED = {"$ne": "$eq", "$nin": "$in"}
+
+def _test(op, value, target):
+    if op in _NEGATED:
+        return not _test(_NEGATED[op], value, target)
+    test = _QUERY_OPERATORS.get(op)
+    if test is None:
+        raise NotImplementedError(f"embedded query operator {op}")
+    if test(value, target):
+        return True
+    return isinstance(value, list) and op not in ("$exists", "$geoWithin") and any(test(v, target) for v in value)
+
+def _is_operator_dict(cond):
+    return isinstance(cond, dict) and bool(cond) and all(k.startswith("$") for k in cond)
+
+def _matches(doc, query):
+    for key, cond in query.items():
+        if key == "$and":
+            if not all(_matches(doc, q) for q in cond):
+                return False
+        elif key == "$or":
+            if not any(_matches(doc, q) for q in cond):
+                return False
+        elif key == "$nor":
+            if any(_matches(doc, q) for q in cond):
+                return False
+        elif key.startswith("$"):
+            raise NotImplementedError(f"embedded query operator {key}")
+        elif _is_operator_dict(cond):
+            value = _get(doc, key)
+            for op, target in cond.items():
+                if not _test(op, value, target):
+                    return False
+        elif not _test("$eq", _get(doc, key), cond):
+            return False
+    return True
+
+_SQL_COMPARISONS = {"$eq": "=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+def _narrow(query):
+    """SQL conditions (and params) selecting a superset of the documents `query` matches."""
+    where, params = [], []
+    for key, cond in query.items():
+        if key == "$and":
+            for q in cond:
+                w, p = _narrow(q)
+                where += w
+                params += p
+            continue
+        if key.startswith("$") or "." in key:
+            continue
+        if key == "_id":
+            if not isinstance(cond, dict):
+                where.append("_id = ?")
+                params.append(_dumps(cond))
+            elif list(cond) == ["$in"]:
+                where.append("_id IN (SELECT value FROM json_each(?))")
+                params.append(json.dumps([_dumps(v) for v in cond["$in"]]))
+            else:
+                # Ranges (keyset pages) compare the raw value; the _id column holds it JSON-encoded
+                for op, target in cond.items():
+                    if op in _SQL_COMPARISONS and _sql_value(target) is not None:
+                        where.append(f"json_extract(doc, '$._id') {_SQL_COMPARISONS[op]} ?")
+                        params.append(_sql_value(target))
+            continue
+        column = f"json_extract(doc, '$.{key}')"
+        # An array comes back from json_extract as JSON text ('[...'), which the scalar
+        # comparison would drop although an element may match; keep those rows for _matches
+        array = f"({column} >= '[' AND {column} < '\\')"
+        if not _is_operator_dict(cond):
+            cond = {"$eq": cond}
+        for op, target in cond.items():
+            if op in _SQL_COMPARISONS and _sql_value(target) is not None:
+                where.append(f"({column} {_SQL_COMPARISONS[op]} ? OR {array})")
+                params.append(_sql_value(target))
+            elif op == "$in" and target and all(_sql_value(v) is not None for v in target):
+                where.append(f"({column} IN ({', '.join(['?'] * len(target))}) OR {array})")
+                params += [_sql_value(v) for v in target]
+    return where, params
+
+def _project(doc, projection):
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {k: 1 for k in projection}
+    included = [k for k, v in projection.items() if v and k != "_id"]
+    if included:
+        out = {k: doc[k] for k in included if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    return {k: v for k, v in doc.items() if projection.get(k, 1)}
+
+# -----------------------------------------------------------
+# UPDATES
+# -----------------------------------------------------------
+def _apply_update(doc, update, inserting):
+    if isinstance(update, list):  # aggregation pipeline update
+        for stage in update:
+            for op, spec in stage.items():
+                if op not in ("$set", "$addFields"):
+                    raise NotImplementedError(f"embedded pipeline update stage {op}")
+                updated = _add_fields(doc, spec)
+                doc.clear()
+                doc.update(updated)
+        return
+    for op, fields in update.items():
+        for path, value in fields.items():
+            current = _get(doc, path)
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                _set(doc, path, value)
+            elif op == "$setOnInsert":
+                continue
+            elif op == "$unset":
+                _unset(doc, path)
+            elif op == "$inc":
+                _set(doc, path, (0 if current is _MISSING or current is None else current) + value)
+            elif op in ("$min", "$max"):
+                if current is _MISSING or (_order(value) < _order(current) if op == "$min" else _order(value) > _order(current)):
+                    _set(doc, path, value)
+            elif op == "$push":
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                _set(doc, path, (list(current) if isinstance(current, list) else []) + list(items))
+            else:
+                raise NotImplementedError(f"embedded update operator {op}")
+
+def _upsert_seed(query):
+    """The equality fields of a filter, which an upsert copies into the new document."""
+    doc = {}
+    for key, cond in query.items():
+        if key == "$and":
+            for q in cond:
+                doc.update(_upsert_seed(q))
+        elif not key.startswith("$") and not _is_operator_dict(cond):
+            _set(doc, key, cond)
+    return doc
+
+# -----------------------------------------------------------
+# AGGREGATION
+# -----------------------------------------------------------
+def _truthy(value):
+    return value not in (_MISSING, None, False, 0)
+
+def _compare(op):
+    tests = {"$eq": lambda a, b: a == b, "$ne": lambda a, b: a != b, "$gt": lambda a, b: a > b,
+             "$gte": lambda a, b: a >= b, "$lt": lambda a, b: a < b, "$lte": lambda a, b: a <= b}
+    return lambda args, doc: tests[op](*(_order(_evaluate(a, doc)) for a in args))
+
+def _cond(args, doc):
+    if isinstance(args, dict):
+        args = [args["if"], args["then"], args["else"]]
+    return _evaluate(args[1] if _truthy(_evaluate(args[0], doc)) else args[2], doc)
+
+def _arithmetic(fn):
+    def apply(args, doc):
+        values = [_evaluate(a, doc) for a in args]
+        if any(v is _MISSING or v is None for v in values):
+            return None
+        result = values[0]
+        for v in values[1:]:
+            result = fn(result, v)
+        return result
+    return apply
+
+_EXPRESSION_OPERATORS = {
+    "$cond": _cond,
+    "$and": lambda args, doc: all(_truthy(_evaluate(a, doc)) for a in args),
+    "$or": lambda args, doc: any(_truthy(_evaluate(a, doc)) for a in args),
+    "$not": lambda args, doc: not _truthy(_evaluate(args[0] if isinstance(args, list) else args, doc)),
+    "$ifNull": lambda args, doc: next((v for v in (_evaluate(a, doc) for a in args[:-1])
+                                       if v is not _MISSING and v is not None), _evaluate(args[-1], doc)),
+    "$literal": lambda args, doc: args,
+    "$add": _arithmetic(lambda a, b: a + b),
+    "$subtract": _arithmetic(lambda a, b: a - b),
+    "$multiply": _arithmetic(lambda a, b: a * b),
+    "$divide": _arithmetic(lambda a, b: a / b),
+    **{op: _compare(op) for op in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte")},
+}
+
+def _evaluate(expr, doc):
+    if isinstance(expr, str):
+        if expr == "$$ROOT":
+            return doc
+        if expr == "$$REMOVE":
+            return _REMOVE
+        return _get(doc, expr[1:]) if expr.startswith("$") else expr
+    if isinstance(expr, list):
+        return [None if v is _MISSING else v for v in (_evaluate(e, doc) for e in expr)]
+    if isinstance(expr, dict):
+        if len(expr) == 1 and next(iter(expr)).startswith("$"):
+            op, args = next(iter(expr.items()))
+            if op not in _EXPRESSION_OPERATORS:
+                raise NotImplementedError(f"embedded aggregation operator {op}")
+            return _EXPRESSION_OPERATORS[op](args, doc)
+        out = {}
+        for k, v in expr.items():
+            v = _evaluate(v, doc)
+            if v is not _MISSING and v is not _REMOVE:
+                out[k] = v
+        return out
+    return expr
+
+def _add_fields(doc, spec):
+    out = dict(doc)
+    for path, expr in spec.items():
+        value = _evaluate(expr, doc)
+        if value is _MISSING or value is _REMOVE:
+            _unset(out, path)
+        else:
+            _set(out, path, value)
+    return out
+
+def _group(docs, spec):
+    groups, averages = {}, {}
+    for doc in docs:
+        group_id = _evaluate(spec["_id"], doc)
+        group_id = None if group_id is _MISSING else group_id
+        key = _dumps(group_id)
+        acc = groups.get(key)
+        if acc is None:
+            acc = groups[key] = {"_id": group_id}
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (op, arg), = accumulator.items()
+            value = _evaluate(arg, doc)
+            if op == "$sum":
+                acc[field] = acc.get(field, 0) + (value if _number(value) else 0)
+            elif op == "$first":
+                acc.setdefault(field, None if value is _MISSING else value)
+            elif op == "$last":
+                acc[field] = None if value is _MISSING else value
+            elif op in ("$min", "$max"):
+                current = acc.setdefault(field, None)
+                if value is not _MISSING and value is not None and (current is None or (
+                        _order(value) < _order(current) if op == "$min" else _order(value) > _order(current))):
+                    acc[field] = value
+            elif op == "$avg":
+                total = averages.setdefault((key, field), [0.0, 0])
+                if _number(value):
+                    total[0] += value
+                    total[1] += 1
+                acc[field] = total[0] / total[1] if total[1] else None
+            elif op == "$push":
+                acc.setdefault(field, []).append(None if value is _MISSING else value)
+            else:
+                raise NotImplementedError(f"embedded $group accumulator {op}")
+    return list(groups.values())
+
+# -----------------------------------------------------------
+# CLIENT / DATABASE / COLLECTION
+# -----------------------------------------------------------
+class Client:
+    """Document databases stored in one SQLite file (the MongoClient of embedded mode)."""
+    def __init__(self, path, timeout=embedded.BUSY_TIMEOUT):
+        self.path, self.timeout = path, timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._tables = set()
+        with self._connection() as db:
+            db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {META_TABLE} (
+                    collection TEXT,
+                    name TEXT,
+                    spec TEXT,
+                    is_unique INTEGER,
+                    PRIMARY KEY (collection, name)
+                );
+            """)
+
+    @contextmanager
+    def _connection(self):
+        """Check out a SQLite connection (pooled; writes hold it for their whole transaction)."""
+        with self._lock:
+            db = self._idle.pop() if self._idle else None
+        if db is None:
+            db = embedded.open_database(self.path, self.timeout)
+        try:
+            yield db
+        finally:
+            if db.in_transaction:
+                db.execute("ROLLBACK;")
+            with self._lock:
+                if len(self._idle) < MAX_IDLE_CONNECTIONS:
+                    self._idle.append(db)
+                    db = None
+            if db is not None:
+                db.close()
+
+    @contextmanager
+    def _write(self):
+        with self._connection() as db:
+            db.execute("BEGIN IMMEDIATE;")
+            yield db
+            db.execute("COMMIT;")
+
+    def __getitem__(self, name):
+        return Database(self, name)
+
+    get_database = __getitem__
+
+    def drop_database(self, name):
+        prefix = f"{name}."
+        with self._write() as db:
+            # Prefix compare rather than LIKE, where '_' in a database name is a wildcard
+            tables = [t for (t,) in db.execute("SELECT name FROM sqlite_master WHERE type='table' AND substr(name, 1, ?) = ?;",
+                                                (len(prefix), prefix))]
+            for table in tables:
+                db.execute(f'DROP TABLE "{table}";')
+                db.execute(f"DELETE FROM {META_TABLE} WHERE collection = ?;", (table,))
+        with self._lock:
+            self._tables.difference_update(tables)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for db in idle:
+            db.close()
+
+class Database:
+    def __init__(self, client, name):
+        self.client, self.name = client, name
+
+    def __getitem__(self, name):
+        return Collection(self, name)
+
+    get_collection = __getitem__
+
+    def list_collection_names(self):
+        prefix = f"{self.name}."
+        with self.client._connection() as db:
+            rows = db.execute("SELECT name FROM sqlite_master WHERE type='table' AND substr(name, 1, ?) = ?;",
+                              (len(prefix), prefix))
+            return [name[len(prefix):] for (name,) in rows]
+
+    def command(self, command, value=None, **kwargs):
+        if command == "ping":
+            return {"ok": 1.0}
+        if command != "collStats":
+            raise NotImplementedError(f"embedded command {command}")
+        collection = self[value]
+        with self.client._connection() as db:
+            collection._ensure(db)
+            count, size = db.execute(f"SELECT COUNT(*), COALESCE(SUM(length(doc)), 0) FROM {collection._table};").fetchone()
+            try:  # dbstat is optional in SQLite builds
+                index_bytes = db.execute(
+                    "SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name IN "
+                    "(SELECT name FROM sqlite_master WHERE type='index' AND tbl_name = ?);",
+                    (collection.full_name,)).fetchone()[0]
+            except sqlite3.OperationalError:
+                index_bytes = 0
+        return {"ns": collection.full_name, "count": count, "size": size, "totalIndexSize": index_bytes, "ok": 1.0}
+
+class Cursor:
+    """Lazy find() result; sort/limit/skip chain like pymongo's Cursor."""
+    def __init__(self, collection, query, projection):
+        self._collection, self._query, self._projection = collection, query or {}, projection
+        self._sort, self._limit, self._skip = None, 0, 0
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _sort_spec(key_or_list, direction)
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def skip(self, skip):
+        self._skip = skip
+        return self
+
+    def batch_size(self, batch_size):
+        return self
+
+    def __iter__(self):
+        fetch = self._skip + self._limit if self._limit else 0
+        if self._sort:
+            docs = self._collection._find_sorted(self._query, self._sort, fetch)
+        else:
+            docs = self._collection._find(self._query, fetch)
+        docs = islice(docs, self._skip, self._skip + self._limit if self._limit else None)
+        return (_project(d, self._projection) for d in docs)
+
+class Collection:
+    def __init__(self, database, name):
+        self.database, self.name = database, name
+        self.full_name = f"{database.name}.{name}"
+        self._table = f'"{self.full_name}"'
+        self._client = database.client
+
+    def _ensure(self, db):
+        if self.full_name in self._client._tables:
+            return
+        db.execute(f"CREATE TABLE IF NOT EXISTS {self._table} (_id TEXT PRIMARY KEY, doc TEXT NOT NULL);")
+        with self._client._lock:
+            self._client._tables.add(self.full_name)
+
+    def _select(self, db, query, limit=0):
+        self._ensure(db)
+        query = _prepare(query)
+        where, params = _narrow(query)
+        sql = f"SELECT doc FROM {self._table}" + (f" WHERE {' AND '.join(where)}" if where else "")
+        if limit and not query:
+            sql += f" LIMIT {int(limit)}"
+        rows = db.execute(sql + ";", params).fetchall()
+        return (doc for doc in (_loads(text) for (text,) in rows) if not query or _matches(doc, query))
+
+    def _find(self, query, limit=0):
+        with self._client._connection() as db:
+            return self._select(db, query, limit)
+
+    def _sql_order(self, db, spec):
+        """ORDER BY for a sort on _id and indexed top-level fields, or None to sort in Python."""
+        indexed = {"_id"}
+        for (keys,) in db.execute(f"SELECT spec FROM {META_TABLE} WHERE collection = ?;", (self.full_name,)):
+            indexed.update(k for k, d in json.loads(keys) if d in (1, -1))
+        if not all(k in indexed and "." not in k for k, _ in spec):
+            return None
+        return ", ".join(f"json_extract(doc, '$.{k}'){' DESC' if d == -1 else ''}" for k, d in spec)
+
+    def _find_sorted(self, query, spec, limit=0):
+        """
+        Matching documents in sort order. On indexed fields SQL does the ordering and only
+        the first `limit` matches are decoded. If a candidate's sort field holds a value
+        SQLite orders differently from MongoDB (bool, array, object) it is sorted in Python.
+        """
+        with self._client._connection() as db:
+            self._ensure(db)
+            order = self._sql_order(db, spec)
+            query = _prepare(query)
+            where, params = _narrow(query)
+            if order is not None:
+                unorderable = " OR ".join(_sql_unorderable(k) for k, _ in spec)
+                if db.execute(f"SELECT 1 FROM {self._table} WHERE " + " AND ".join(where + [f"({unorderable})"])
+                              + " LIMIT 1;", params).fetchone():
+                    order = None
+            if order is None:
+                return _sorted(self._select(db, query), spec)
+            rows = db.execute(f"SELECT doc FROM {self._table}" + (f" WHERE {' AND '.join(where)}" if where else "")
+                              + f" ORDER BY {order};", params)
+            docs = []
+            try:
+                for (text,) in rows:
+                    doc = _loads(text)
+                    if query and not _matches(doc, query):
+                        continue
+                    docs.append(doc)
+                    if limit and len(docs) >= limit:
+                        break
+            finally:
+                rows.close()  # an unfinished SELECT would pin the WAL snapshot
+            return docs
+
+    # Reads
+    def find(self, filter=None, projection=None):
+        return Cursor(self, filter, projection)
+
+    def find_one(self, filter=None, projection=None, sort=None):
+        cursor = self.find(filter, projection)
+        if sort:
+            cursor.sort(sort)
+        return next(iter(cursor.limit(1)), None)
+
+    def count_documents(self, filter):
+        if not filter:
+            return self.estimated_document_count()
+        return sum(1 for _ in self._find(filter))
+
+    def estimated_document_count(self):
+        with self._client._connection() as db:
+            self._ensure(db)
+            return db.execute(f"SELECT COUNT(*) FROM {self._table};").fetchone()[0]
+
+    # Writes
+    def _insert(self, db, doc):
+        doc.setdefault("_id", ObjectId())
+        try:
+            db.execute(f"INSERT INTO {self._table} (_id, doc) VALUES (?, ?);", (_dumps(doc["_id"]), _dumps(doc)))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.full_name}: {e}", 11000)
+        return doc["_id"]
+
+    def _update(self, db, query, update, upsert, multi):
+        """Returns (matched, upserted_id)."""
+        matched = 0
+        for doc in self._select(db, query):
+            _apply_update(doc, update, inserting=False)
+            try:
+                db.execute(f"UPDATE {self._table} SET doc = ? WHERE _id = ?;", (_dumps(doc), _dumps(doc["_id"])))
+            except sqlite3.IntegrityError as e:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.full_name}: {e}", 11000)
+            matched += 1
+            if not multi:
+                break
+        if matched or not upsert:
+            return matched, None
+        doc = _upsert_seed(query)
+        _apply_update(doc, update, inserting=True)
+        return 0, self._insert(db, doc)
+
+    def _delete(self, db, query, multi):
+        if not query and multi:
+            return db.execute(f"DELETE FROM {self._table};").rowcount
+        ids = [_dumps(doc["_id"]) for doc in islice(self._select(db, query), None if multi else 1)]
+        for i in range(0, len(ids), 10000):
+            db.execute(f"DELETE FROM {self._table} WHERE _id IN (SELECT value FROM json_each(?));",
+                       (json.dumps(ids[i:i + 10000]),))
+        return len(ids)
+
+    def insert_one(self, document):
+        with self._client._write() as db:
+            self._ensure(db)
+            return InsertOneResult(self._insert(db, document), True)
+
+    def insert_many(self, documents, ordered=True):
+        """Rejected documents (duplicate keys) are reported in one BulkWriteError, like pymongo."""
+        ids, errors = [], []
+        with self._client._write() as db:
+            self._ensure(db)
+            for index, doc in enumerate(documents):
+                try:
+                    ids.append(self._insert(db, doc))
+                except DuplicateKeyError as e:
+                    errors.append({"index": index, "code": 11000, "errmsg": str(e), "op": doc})
+                    if ordered:
+                        break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [], "nInserted": len(ids),
+                                  "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []})
+        return InsertManyResult(ids, True)
+
+    def update_one(self, filter, update, upsert=False):
+        with self._client._write() as db:
+            self._ensure(db)
+            matched, upserted_id = self._update(db, filter, update, upsert, multi=False)
+        return UpdateResult({"n": matched or int(upserted_id is not None), "nModified": matched,
+                             "upserted": upserted_id}, True)
+
+    def update_many(self, filter, update, upsert=False):
+        with self._client._write() as db:
+            self._ensure(db)
+            matched, upserted_id = self._update(db, filter, update, upsert, multi=True)
+        return UpdateResult({"n": matched or int(upserted_id is not None), "nModified": matched,
+                             "upserted": upserted_id}, True)
+
+    def delete_one(self, filter):
+        with self._client._write() as db:
+            self._ensure(db)
+            return DeleteResult({"n": self._delete(db, filter, multi=False)}, True)
+
+    def delete_many(self, filter):
+        with self._client._write() as db:
+            self._ensure(db)
+            return DeleteResult({"n": self._delete(db, filter, multi=True)}, True)
+
+    def bulk_write(self, requests, ordered=True):
+        """InsertOne/UpdateOne/UpdateMany/DeleteOne/DeleteMany in one SQLite transaction."""
+        result = {"writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+                  "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []}
+        with self._client._write() as db:
+            self._ensure(db)
+            for index, op in enumerate(requests):
+                try:
+                    if isinstance(op, InsertOne):
+                        self._insert(db, op._doc)
+                        result["nInserted"] += 1
+                    elif isinstance(op, (UpdateOne, UpdateMany)):
+                        matched, upserted_id = self._update(db, op._filter, op._doc, op._upsert,
+                                                            multi=isinstance(op, UpdateMany))
+                        result["nMatched"] += matched
+                        result["nModified"] += matched
+                        if upserted_id is not None:
+                            result["nUpserted"] += 1
+                            result["upserted"].append({"index": index, "_id": upserted_id})
+                    elif isinstance(op, (DeleteOne, DeleteMany)):
+                        result["nRemoved"] += self._delete(db, op._filter, multi=isinstance(op, DeleteMany))
+                    else:
+                        raise NotImplementedError(f"embedded bulk_write of {type(op).__name__}")
+                except DuplicateKeyError as e:
+                    result["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                    if ordered:
+                        break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    # Aggregation
+    def aggregate(self, pipeline, **kwargs):
+        stages = list(pipeline)
+        query = stages.pop(0)["$match"] if stages and "$match" in stages[0] else {}
+        docs = self._find(query)
+        for stage in stages:
+            (op, spec), = stage.items()
+            if op == "$match":
+                spec = _prepare(spec)
+                docs = [d for d in docs if _matches(d, spec)]
+            elif op == "$sort":
+                docs = _sorted(docs, _sort_spec(spec))
+            elif op == "$group":
+                docs = _group(docs, spec)
+            elif op == "$replaceRoot":
+                docs = [_evaluate(spec["newRoot"], d) for d in docs]
+            elif op in ("$set", "$addFields"):
+                docs = [_add_fields(d, spec) for d in docs]
+            elif op == "$project":
+                docs = [_project(d, spec) for d in docs]
+            elif op == "$skip":
+                docs = list(docs)[spec:]
+            elif op == "$limit":
+                docs = list(docs)[:spec]
+            elif op == "$count":
+                docs = [{spec: sum(1 for _ in docs)}]
+            elif op == "$merge":
+                self._merge(docs, spec)
+                return iter([])
+            else:
+                raise NotImplementedError(f"embedded aggregation stage {op}")
+        return iter(list(docs))
+
+    def _merge(self, docs, spec):
+        """$merge on _id: whenMatched replace/merge/keepExisting, whenNotMatched insert/discard."""
+        if isinstance(spec, str):
+            spec = {"into": spec}
+        target = self.database[spec["into"] if isinstance(spec["into"], str) else spec["into"]["coll"]]
+        matched, not_matched = spec.get("whenMatched", "merge"), spec.get("whenNotMatched", "insert")
+        if spec.get("on", "_id") != "_id" or matched not in ("replace", "merge", "keepExisting") \
+                or not_matched not in ("insert", "discard"):
+            raise NotImplementedError(f"embedded $merge {spec}")
+        with self._client._write() as db:
+            target._ensure(db)
+            for doc in docs:
+                doc.setdefault("_id", ObjectId())
+                row = db.execute(f"SELECT doc FROM {target._table} WHERE _id = ?;", (_dumps(doc["_id"]),)).fetchone()
+                if row is None:
+                    if not_matched == "insert":
+                        target._insert(db, doc)
+                elif matched != "keepExisting":
+                    merged = dict(_loads(row[0]), **doc) if matched == "merge" else doc
+                    db.execute(f"UPDATE {target._table} SET doc = ? WHERE _id = ?;", (_dumps(merged), _dumps(doc["_id"])))
+
+    # Indexes
+    def create_index(self, keys, unique=False, name=None, **kwargs):
+        keys = _sort_spec(keys)
+        name = name or "_".join(f"{k}_{d}" for k, d in keys)
+        with self._client._write() as db:
+            self._ensure(db)
+            if db.execute(f"SELECT 1 FROM {META_TABLE} WHERE collection = ? AND name = ?;",
+                          (self.full_name, name)).fetchone():
+                return name
+            # Geo/text indexes have no SQL equivalent; their operators are evaluated in Python
+            if all(d in (1, -1) for _, d in keys):
+                columns = ", ".join(f"json_extract(doc, '$.{k}'){' DESC' if d == -1 else ''}" for k, d in keys)
+                try:
+                    db.execute(f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS '
+                               f'"{self.full_name}:{name}" ON {self._table} ({columns});')
+                except sqlite3.IntegrityError as e:
+                    raise OperationFailure(f"E11000 duplicate key error collection: {self.full_name}: {e}", 11000)
+            db.execute(f"INSERT INTO {META_TABLE} (collection, name, spec, is_unique) VALUES (?, ?, ?, ?);",
+                       (self.full_name, name, json.dumps(keys), int(unique)))
+        return name
+
+    def index_information(self):
+        info = {"_id_": {"key": [("_id", 1)], "v": 2}}
+        with self._client._connection() as db:
+            for name, spec, is_unique in db.execute(
+                    f"SELECT name, spec, is_unique FROM {META_TABLE} WHERE collection = ?;", (self.full_name,)):
+                info[name] = {"key": [tuple(k) for k in json.loads(spec)], "v": 2}
+                if is_unique:
+                    info[name]["unique"] = True
+        return info
+
+    def drop_index(self, name):
+        with self._client._write() as db:
+            if not db.execute(f"DELETE FROM {META_TABLE} WHERE collection = ? AND name = ?;",
+                              (self.full_name, name)).rowcount:
+                raise OperationFailure(f"index not found with name [{name}]", 27)
+            db.execute(f'DROP INDEX IF EXISTS "{self.full_name}:{name}";')
+
+    def drop(self):
+        with self._client._write() as db:
+            db.execute(f"DROP TABLE IF EXISTS {self._table};")
+            db.execute(f"DELETE FROM {META_TABLE} WHERE collection = ?;", (self.full_name,))
+        with self._client._lock:
+            self._client._tables.discard(self.full_name)
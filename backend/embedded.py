@@ -0,0 +1,337 @@
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, date
+from functools import lru_cache
+from psycopg2.extras import execute_values as _pg_execute_values
+import metrics
+
+# -----------------------------------------------------------
+# EMBEDDED SQL STORAGE (SWMS_STORAGE=embedded)
+# -----------------------------------------------------------
+# A single SQLite file stands in for PostgreSQL so a small depot can run the whole
+# backend in one process. Connection and Cursor mimic the slice of the psycopg2 API
+# trial_core uses: the same SQL text is accepted and rewritten once per distinct
+# statement (cached) into SQLite's dialect; sqlite3 then keeps the prepared statement
+# in its per-connection statement cache.
+#   %s / = ANY(%s)            ? / IN (SELECT value FROM json_each(?)) (list sent as JSON)
+#   ::type casts, CASCADE     dropped
+#   NOW(), LEAST, GREATEST    CURRENT_TIMESTAMP, MIN, MAX
+#   EXTRACT(EPOCH FROM a - b) julianday difference in seconds
+#   SELECT DISTINCT ON (k)    GROUP BY k
+#   (VALUES %s) AS v(cols)    SELECT column1 AS ... FROM (VALUES ...)
+#   COPY ... FROM STDIN CSV   batched INSERT
+#   pg_advisory_lock & co.    process-local locks (one process owns the file)
+# Transactions: plain reads run in autocommit, like PostgreSQL's per-statement
+# snapshots under READ COMMITTED; the first write (or SELECT ... FOR UPDATE) opens a
+# BEGIN IMMEDIATE transaction that holds the database write lock until commit or
+# rollback. Concurrent writers queue on it for up to SWMS_SQLITE_BUSY_TIMEOUT seconds,
+# which replaces row locks and SKIP LOCKED: dispatches simply run one after another.
+# The file is in WAL mode, so readers never wait for the writer.
+BUSY_TIMEOUT = float(os.environ.get("SWMS_SQLITE_BUSY_TIMEOUT", 30))
+MAX_VARIABLES = 32766  # SQLITE_MAX_VARIABLE_NUMBER since SQLite 3.32
+WRITE_VERBS = {"INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER"}
+
+def open_database(path, timeout=BUSY_TIMEOUT):
+    """Raw sqlite3 connection to `path` with the pragmas both embedded stores rely on."""
+    db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False,
+                         detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=512)
+    db.execute("PRAGMA journal_mode=WAL;")
+    db.execute("PRAGMA synchronous=NORMAL;")  # durable across crashes of the process, fsync per checkpoint
+    db.execute("PRAGMA foreign_keys=ON;")
+    db.execute("PRAGMA temp_store=MEMORY;")
+    return db
+
+# TIMESTAMP columns hold ISO 8601 text ("YYYY-MM-DD HH:MM:SS[.ffffff]", the format of
+# CURRENT_TIMESTAMP) and come back as naive datetimes, as they do from psycopg2.
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.fromisoformat(raw.decode()))
+
+def _adapt(value):
+    if isinstance(value, datetime):
+        return value.isoformat(" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):  # numpy scalars
+        return value.item()
+    return value
+
+# -----------------------------------------------------------
+# ADVISORY LOCKS
+# -----------------------------------------------------------
+# Session locks as in PostgreSQL: held by the connection that took them (re-entrantly,
+# one unlock per lock), released when it closes; an unlock from another connection
+# returns false and leaves the lock held.
+_advisory_owners = {}  # key -> [owning connection, hold count]
+_advisory_guard = threading.Condition()
+
+def _hashtext(text):
+    return zlib.crc32(str(text).encode()) - (1 << 31)
+
+def _lock(owner, key, blocking=True):
+    with _advisory_guard:
+        while True:
+            held = _advisory_owners.get(key)
+            if held is None or held[0] is owner:
+                _advisory_owners[key] = [owner, held[1] + 1 if held else 1]
+                return True
+            if not blocking:
+                return False
+            _advisory_guard.wait()
+
+def _unlock(owner, key):
+    with _advisory_guard:
+        held = _advisory_owners.get(key)
+        if held is None or held[0] is not owner:
+            return False
+        held[1] -= 1
+        if not held[1]:
+            del _advisory_owners[key]
+            _advisory_guard.notify_all()
+        return True
+
+def _unlock_all(owner):
+    with _advisory_guard:
+        for key in [k for k, held in _advisory_owners.items() if held[0] is owner]:
+            del _advisory_owners[key]
+        _advisory_guard.notify_all()
+
+def _register_functions(db, owner):
+    db.create_function("hashtext", 1, _hashtext, deterministic=True)
+    db.create_function("pg_advisory_lock", 1, lambda key: _lock(owner, key) and None)
+    db.create_function("pg_try_advisory_lock", 1, lambda key: int(_lock(owner, key, blocking=False)))
+    db.create_function("pg_advisory_unlock", 1, lambda key: int(_unlock(owner, key)))
+
+# -----------------------------------------------------------
+# SQL TRANSLATION
+# -----------------------------------------------------------
+_FOR_UPDATE = re.compile(r"\s+FOR\s+UPDATE(\s+SKIP\s+LOCKED)?", re.I)
+_TEMP_TABLE = re.compile(r"CREATE\s+TEMP(?:ORARY)?\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.I)
+_ON_COMMIT_DELETE = re.compile(r"\s+ON\s+COMMIT\s+DELETE\s+ROWS", re.I)
+_CASCADE = re.compile(r"\s+CASCADE\s*(;?)\s*$", re.I)
+_CAST = re.compile(r"::\w+(\s+precision)?", re.I)
+_EPOCH = re.compile(r"EXTRACT\(\s*EPOCH\s+FROM\s+([\w.]+)\s*-\s*([\w.]+)\s*\)", re.I)
+_DISTINCT_ON = re.compile(r"SELECT\s+DISTINCT\s+ON\s*\(([^)]*)\)\s*(.*?)\s+FROM\s+(\w+)", re.I | re.S)
+_VALUES_ALIAS = re.compile(r"\(\s*VALUES\s+(.*?)\s*\)\s+AS\s+(\w+)\s*\(([^)]*)\)", re.I | re.S)
+_PLACEHOLDER = re.compile(r"=\s*ANY\(\s*%s\s*\)|%s", re.I)
+_COPY = re.compile(r"COPY\s+(\w+)\s*\(([^)]*)\)\s+FROM\s+STDIN", re.I)
+_SERIAL_KEY = re.compile(r"\bSERIAL\s+PRIMARY\s+KEY\b", re.I)
+_JSONB = re.compile(r"\bJSONB\b", re.I)
+
+@lru_cache(maxsize=1024)
+def translate(sql):
+    """
+    Rewrite one PostgreSQL statement for SQLite. Returns (sql, placeholder kinds,
+    is_write, temp table cleared on commit or None); kinds mark the = ANY(%s)
+    placeholders whose list parameter is sent as JSON.
+    """
+    temp_table = None
+    if _ON_COMMIT_DELETE.search(sql):
+        sql = _ON_COMMIT_DELETE.sub("", sql)
+        temp_table = _TEMP_TABLE.search(sql).group(1)
+    locks = bool(_FOR_UPDATE.search(sql))
+    sql = _FOR_UPDATE.sub("", sql)
+    if sql.lstrip().upper().startswith("DROP"):
+        sql = _CASCADE.sub(r"\1", sql)
+    sql = _CAST.sub("", sql)
+    # Column types in DDL (SQLite's INTEGER PRIMARY KEY is the autoincrementing rowid)
+    sql = _SERIAL_KEY.sub("INTEGER PRIMARY KEY", sql)
+    sql = _JSONB.sub("TEXT", sql)
+    sql = re.sub(r"\bNOW\(\)", "CURRENT_TIMESTAMP", sql, flags=re.I)
+    sql = re.sub(r"\bLEAST\(", "MIN(", sql, flags=re.I)
+    sql = re.sub(r"\bGREATEST\(", "MAX(", sql, flags=re.I)
+    sql = _EPOCH.sub(r"((julianday(\1) - julianday(\2)) * 86400.0)", sql)
+    sql = _DISTINCT_ON.sub(r"SELECT \2 FROM \3 WHERE true GROUP BY \1", sql)
+    sql = _VALUES_ALIAS.sub(lambda m: "(SELECT " + ", ".join(
+        f"column{i} AS {c.strip()}" for i, c in enumerate(m.group(3).split(","), 1)
+    ) + f" FROM (VALUES {m.group(1)})) AS {m.group(2)}", sql)
+    # INSERT ... SELECT ... JOIN ... ON CONFLICT is ambiguous to SQLite's parser
+    # (ON could belong to the join) unless the SELECT has a WHERE clause
+    upper = sql.upper()
+    conflict = upper.find("ON CONFLICT")
+    if upper.lstrip().startswith("INSERT") and conflict > 0 and " SELECT " in upper[:conflict].replace("\n", " ") \
+            and "WHERE" not in upper[upper.rfind("FROM", 0, conflict):conflict]:
+        sql = sql[:conflict] + "WHERE true\n        " + sql[conflict:]
+
+    kinds = []
+    def placeholder(m):
+        if m.group(0) == "%s":
+            kinds.append(False)
+            return "?"
+        kinds.append(True)
+        return "IN (SELECT value FROM json_each(?))"
+    sql = _PLACEHOLDER.sub(placeholder, sql).replace("%%", "%")
+
+    verb = (sql.split(None, 1) or ["?"])[0].upper()
+    is_write = locks or verb in WRITE_VERBS or (
+        verb == "WITH" and re.search(r"\b(INSERT|UPDATE|DELETE)\b", sql, re.I) is not None)
+    return sql, tuple(kinds), is_write, temp_table
+
+def _bind(kinds, params):
+    if params is None:
+        return ()
+    return [json.dumps([_adapt(v) for v in p]) if as_json else _adapt(p) for as_json, p in zip(kinds, params)]
+
+# -----------------------------------------------------------
+# CONNECTION + CURSOR (psycopg2-compatible subset)
+# -----------------------------------------------------------
+class Connection:
+    def __init__(self, path, timeout=BUSY_TIMEOUT):
+        self.path = path
+        self._db = open_database(path, timeout)
+        _register_functions(self._db, self)
+        self._temp_tables = set()
+        self.closed = 0
+
+    def cursor(self):
+        return Cursor(self)
+
+    def _begin(self):
+        if not self._db.in_transaction:
+            self._db.execute("BEGIN IMMEDIATE;")
+
+    def _end(self, statement):
+        if self._db.in_transaction:
+            self._db.execute(statement)
+        # Temp tables created ON COMMIT DELETE ROWS (forgotten if the CREATE was rolled back)
+        for table in list(self._temp_tables):
+            try:
+                self._db.execute(f"DELETE FROM temp.{table};")
+            except sqlite3.OperationalError:
+                self._temp_tables.discard(table)
+
+    def commit(self):
+        self._end("COMMIT;")
+
+    def rollback(self):
+        self._end("ROLLBACK;")
+
+    def close(self):
+        if not self.closed:
+            self._db.close()
+            self.closed = 1
+            _unlock_all(self)
+
+class Cursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._db.cursor()
+        self.rowcount = -1
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, query, vars=None):
+        sql, kinds, is_write, temp_table = translate(query)
+        if is_write:
+            self.connection._begin()
+        if temp_table:
+            self.connection._temp_tables.add(temp_table)
+        caller = metrics._caller()
+        start = time.perf_counter()
+        try:
+            self._cursor.execute(sql, _bind(kinds, vars))
+        finally:
+            self.rowcount = self._cursor.rowcount
+            metrics.record_sql(caller, sql, vars, time.perf_counter() - start, self.rowcount, store="sqlite")
+
+    def executemany(self, query, vars_list):
+        sql, kinds, is_write, _ = translate(query)
+        self.connection._begin()
+        self._cursor.executemany(sql, (_bind(kinds, v) for v in vars_list))
+        self.rowcount = self._cursor.rowcount
+
+    def execute_values(self, sql, argslist, template=None, page_size=100, fetch=False):
+        """psycopg2.extras.execute_values: expand the single VALUES %s into multi-row VALUES pages."""
+        rows = [tuple(r) for r in argslist]
+        if not rows:
+            return [] if fetch else None
+        template = template or "(" + ", ".join(["%s"] * len(rows[0])) + ")"
+        page_size = max(1, min(page_size, MAX_VARIABLES // len(rows[0])))
+        head, tail = sql.split("%s", 1)
+        results = []
+        for i in range(0, len(rows), page_size):
+            page = rows[i:i + page_size]
+            self.execute(head + ", ".join([template] * len(page)) + tail, [v for r in page for v in r])
+            if fetch:
+                results.extend(self.fetchall())
+        return results if fetch else None
+
+    def copy_expert(self, sql, file, size=8192):
+        """COPY <table> (<columns>) FROM STDIN in CSV format; empty fields load as NULL."""
+        m = _COPY.search(sql)
+        if not m or "CSV" not in sql.upper():
+            raise NotImplementedError(f"embedded storage only supports COPY ... FROM STDIN CSV: {sql}")
+        columns = [c.strip() for c in m.group(2).split(",")]
+        insert = f"INSERT INTO {m.group(1)} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+        self.connection._begin()
+        self._cursor.executemany(insert, ([v if v != "" else None for v in row] for row in csv.reader(file)))
+        self.rowcount = self._cursor.rowcount
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self.rowcount = self._cursor.rowcount
+        return rows
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def connect(path, timeout=BUSY_TIMEOUT):
+    return Connection(path, timeout)
+
+def is_embedded(sql_cursor_or_conn):
+    return isinstance(sql_cursor_or_conn, (Connection, Cursor))
+
+def execute_values(sql_cursor, sql, argslist, template=None, page_size=100, fetch=False):
+    """psycopg2.extras.execute_values for either backend's cursor."""
+    if isinstance(sql_cursor, Cursor):
+        return sql_cursor.execute_values(sql, argslist, template, page_size, fetch)
+    return _pg_execute_values(sql_cursor, sql, argslist, template, page_size, fetch)
+
+class Pool:
+    """Stand-in for psycopg2's ThreadedConnectionPool over one SQLite file (see trial_core.ConnectionPool)."""
+    def __init__(self, minconn, maxconn, path, timeout=BUSY_TIMEOUT):
+        self.maxconn, self.path, self.timeout = maxconn, path, timeout
+        self._idle = [connect(path, timeout) for _ in range(minconn)]
+        self._lock = threading.Lock()
+
+    def getconn(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return connect(self.path, self.timeout)
+
+    def putconn(self, conn, close=False):
+        if not close:
+            conn.rollback()
+        with self._lock:
+            if not close and len(self._idle) < self.maxconn:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
@@ -0,0 +1,191 @@
+import json
+import queue
+import threading
+import select
+import time
+
+# -----------------------------------------------------------
+# IN-PROCESS EVENT BUS
+# -----------------------------------------------------------
+PG_CHANNEL = "swms_events"
+NOTIFY_MAX_BYTES = 7500  # PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+RECONNECT_MAX_DELAY = 30.0  # seconds between attempts to reopen a dropped NOTIFY connection
+
+_subscribers = set()
+_handlers = {}
+_lock = threading.Lock()
+_bridge = None
+
+def subscribe(max_queue=256):
+    """Register a listener; returns a queue.Queue of (event_type, data) tuples."""
+    q = queue.Queue(maxsize=max_queue)
+    with _lock:
+        _subscribers.add(q)
+    return q
+
+def unsubscribe(q):
+    with _lock:
+        _subscribers.discard(q)
+
+def subscriber_count():
+    with _lock:
+        return len(_subscribers)
+
+def on(event_type, handler):
+    """Call handler(data) for every event of this type delivered to this process."""
+    with _lock:
+        _handlers.setdefault(event_type, []).append(handler)
+
+def _dispatch(event_type, data):
+    with _lock:
+        targets = list(_subscribers)
+        handlers = list(_handlers.get(event_type, ()))
+    for handler in handlers:
+        try:
+            handler(data)
+        except Exception as e:
+            print(f"⚠️ Event handler for '{event_type}' failed: {e}")
+    for q in targets:
+        try:
+            q.put_nowait((event_type, data))
+        except queue.Full:
+            # Slow client: drop its oldest event rather than block the publisher
+            try:
+                q.get_nowait()
+                q.put_nowait((event_type, data))
+            except (queue.Empty, queue.Full):
+                pass
+
+def publish(event_type, data):
+    """
+    Fan an event out to every subscriber. With the PostgreSQL bridge running, the event
+    goes through NOTIFY so subscribers in every worker process receive it exactly once.
+    """
+    if _bridge is None:
+        _dispatch(event_type, data)
+        return
+    chunks = _chunks(event_type, data) if isinstance(data, list) else [data]
+    for chunk in chunks:
+        if not _bridge.notify(event_type, chunk):
+            _dispatch(event_type, chunk)
+
+def _encode(event_type, data):
+    return json.dumps({"type": event_type, "data": data}, default=str)
+
+def _chunks(event_type, items):
+    """Split a list so each chunk's NOTIFY payload stays under NOTIFY_MAX_BYTES."""
+    budget = NOTIFY_MAX_BYTES - len(_encode(event_type, []).encode())
+    chunk, size = [], 0
+    for item in items:
+        item_size = len(json.dumps(item, default=str).encode()) + 2  # ", " separator
+        if chunk and size + item_size > budget:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(item)
+        size += item_size
+    if chunk:
+        yield chunk
+
+# -----------------------------------------------------------
+# POSTGRESQL LISTEN/NOTIFY BRIDGE (cross-process fan-out)
+# -----------------------------------------------------------
+# A dropped NOTIFY connection (PostgreSQL restart, idle timeout, failover) is closed and
+# reopened, and the event retried once; while PostgreSQL stays unreachable, reconnects
+# back off exponentially and events are delivered in-process only.
+class _PgBridge:
+    def __init__(self, connect):
+        self._connect = connect
+        self._listen_conn = self._open_listener()
+        self._notify_conn = self._open_notifier()
+        self._notify_lock = threading.Lock()
+        self._reconnect_at, self._reconnect_delay = 0.0, 0.0
+        threading.Thread(target=self._listen, name="pg-event-bridge", daemon=True).start()
+
+    def notify(self, event_type, data):
+        """Send one event through pg_notify; False (deliver locally instead) if that failed."""
+        payload = _encode(event_type, data)
+        with self._notify_lock:
+            for attempt in range(2):
+                conn = self._notifier()
+                if conn is None:
+                    return False
+                try:
+                    conn.cursor().execute("SELECT pg_notify(%s, %s);", (PG_CHANNEL, payload))
+                    return True
+                except Exception as e:
+                    print(f"❌ Event notify failed, {'reconnecting' if attempt == 0 else 'delivering locally'}: {e}")
+                    self._close_notifier()
+        return False
+
+    def _open_notifier(self):
+        conn = self._connect()
+        conn.autocommit = True
+        return conn
+
+    def _notifier(self):
+        """The NOTIFY connection, reopened if it was dropped; None while reconnects are backing off."""
+        if self._notify_conn is not None:
+            return self._notify_conn
+        if time.monotonic() < self._reconnect_at:
+            return None
+        try:
+            self._notify_conn = self._open_notifier()
+        except Exception as e:
+            self._reconnect_delay = min(max(self._reconnect_delay * 2, 1.0), RECONNECT_MAX_DELAY)
+            self._reconnect_at = time.monotonic() + self._reconnect_delay
+            print(f"⚠️ Event bus cannot reach PostgreSQL, next attempt in {self._reconnect_delay:.0f}s: {e}")
+            return None
+        self._reconnect_delay = 0.0
+        return self._notify_conn
+
+    def _close_notifier(self):
+        conn, self._notify_conn = self._notify_conn, None
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _open_listener(self):
+        conn = self._connect()
+        conn.autocommit = True
+        conn.cursor().execute(f"LISTEN {PG_CHANNEL};")
+        return conn
+
+    def _listen(self):
+        while True:
+            conn = self._listen_conn
+            try:
+                if select.select([conn], [], [], 5.0) == ([], [], []):
+                    continue
+                conn.poll()
+            except Exception as e:
+                print(f"⚠️ Event listener lost its connection, reconnecting: {e}")
+                time.sleep(1)
+                try:
+                    self._listen_conn = self._open_listener()
+                except Exception:
+                    pass
+                continue
+            while conn.notifies:
+                note = conn.notifies.pop(0)
+                try:
+                    msg = json.loads(note.payload)
+                except ValueError:
+                    continue
+                _dispatch(msg.get("type"), msg.get("data"))
+
+def start_pg_bridge(connect):
+    """
+    Route published events through PostgreSQL LISTEN/NOTIFY. `connect` returns a new
+    psycopg2 connection. Falls back to in-process delivery if the bridge can't start.
+    """
+    global _bridge
+    if _bridge is not None:
+        return True
+    try:
+        _bridge = _PgBridge(connect)
+        print(f"📡 Event bus bridged through PostgreSQL channel '{PG_CHANNEL}'.")
+        return True
+    except Exception as e:
+        print(f"⚠️ LISTEN/NOTIFY unavailable, using in-process event bus: {e}")
+        return False
@@ -0,0 +1,105 @@
+import threading
+from datetime import datetime
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+
+def _hours(t):
+    """Hours since the epoch for a naive UTC datetime or pandas Timestamp."""
+    return (t - EPOCH).total_seconds() / 3600
+
+# -----------------------------------------------------------
+# FILL-LEVEL FORECASTING
+# -----------------------------------------------------------
+class FillForecaster:
+    """
+    Per-bin linear fill-rate model over the current fill cycle (since the bin was last
+    emptied). Each bin keeps least-squares sufficient statistics (n, Σx, Σy, Σx², Σxy)
+    in numpy arrays, so a reading is an O(1) update and slopes for every bin are solved
+    in one vectorized pass. A drop of more than `reset_drop` points starts a new cycle.
+    "Now" defaults to the newest reading time seen, so replayed history predicts the
+    same way live data does.
+    """
+    def __init__(self, reset_drop=20, min_points=3, min_rate=0.05, initial_capacity=256):
+        self.reset_drop = reset_drop
+        self.min_points = min_points
+        self.min_rate = min_rate  # fill points/hour below which a bin is treated as not filling
+        self._index = {}
+        self._serials = []
+        self._stats = np.zeros((initial_capacity, 5))  # n, Σx, Σy, Σx², Σxy
+        self._t0 = np.zeros(initial_capacity)          # cycle start, epoch hours
+        self._last_t = np.full(initial_capacity, np.nan)
+        self._last_y = np.full(initial_capacity, np.nan)
+        self._watermark = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._serials)
+
+    def _slot(self, serial):
+        k = self._index.get(serial)
+        if k is None:
+            k = len(self._serials)
+            if k == len(self._t0):
+                grow = len(self._t0)
+                self._stats = np.vstack((self._stats, np.zeros((grow, 5))))
+                self._t0 = np.append(self._t0, np.zeros(grow))
+                self._last_t = np.append(self._last_t, np.full(grow, np.nan))
+                self._last_y = np.append(self._last_y, np.full(grow, np.nan))
+            self._index[serial] = k
+            self._serials.append(serial)
+        return k
+
+    def observe(self, readings):
+        with self._lock:
+            for r in sorted(readings, key=lambda r: r["time"]):
+                serial, t, y = r.get("serial"), r.get("time"), r.get("status_current_fill_level")
+                if serial is None or t is None or y is None or y != y:
+                    continue
+                hours = _hours(t)
+                k = self._slot(serial)
+                if hours <= self._last_t[k]:
+                    continue
+                if np.isnan(self._last_y[k]) or y < self._last_y[k] - self.reset_drop:
+                    self._stats[k] = 0
+                    self._t0[k] = hours
+                x = hours - self._t0[k]
+                self._stats[k] += (1, x, y, x * x, x * y)
+                self._last_t[k], self._last_y[k] = hours, y
+                if self._watermark is None or hours > self._watermark:
+                    self._watermark = hours
+
+    def fill_rates(self):
+        """Least-squares fill rate (points/hour) of every bin's current cycle; NaN if unknown."""
+        with self._lock:
+            m = len(self._serials)
+            n, sx, sy, sxx, sxy = self._stats[:m].T
+            denom = n * sxx - sx * sx
+            with np.errstate(divide="ignore", invalid="ignore"):
+                slope = np.where((n >= self.min_points) & (denom > 0), (n * sxy - sx * sy) / denom, np.nan)
+            return list(self._serials), slope, self._last_t[:m].copy(), self._last_y[:m].copy()
+
+    def hours_to_full(self, threshold=80, now=None):
+        """{serial: predicted hours from `now` until the fill reaches threshold} (inf if not filling)."""
+        serials, slope, last_t, last_y = self.fill_rates()
+        if not serials:
+            return {}
+        now_h = _hours(now) if now is not None else self._watermark
+        filling = slope > self.min_rate
+        with np.errstate(divide="ignore", invalid="ignore"):
+            eta = np.where(filling, (threshold - last_y) / slope - (now_h - last_t), np.inf)
+        eta = np.where(last_y >= threshold, 0.0, eta)
+        return dict(zip(serials, np.maximum(eta, 0.0).tolist()))
+
+    def bins_crossing_within(self, horizon_hours, threshold=80, now=None):
+        """Serials predicted to reach `threshold` within `horizon_hours`."""
+        return [s for s, h in self.hours_to_full(threshold, now).items() if h <= horizon_hours]
+
+    def reset(self):
+        with self._lock:
+            self._index.clear()
+            self._serials.clear()
+            self._stats[:] = 0
+            self._last_t[:] = np.nan
+            self._last_y[:] = np.nan
+            self._watermark = None
@@ -0,0 +1,64 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# -----------------------------------------------------------
+# DISTANCES
+# -----------------------------------------------------------
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance (km), broadcasting over any array-like inputs."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def distance_matrix(lats_a, lons_a, lats_b=None, lons_b=None, dtype=np.float32):
+    """
+    Distances (km) from every point of set A to every point of set B, shape (len(A), len(B)).
+    With B omitted, returns the square matrix of A against itself.
+    """
+    if lats_b is None:
+        lats_b, lons_b = lats_a, lons_a
+    lat_a, lon_a = np.asarray(lats_a, dtype=np.float64), np.asarray(lons_a, dtype=np.float64)
+    lat_b, lon_b = np.asarray(lats_b, dtype=np.float64), np.asarray(lons_b, dtype=np.float64)
+    return haversine_km(lat_a[:, None], lon_a[:, None], lat_b[None, :], lon_b[None, :]).astype(dtype)
+
+def path_legs(lats, lons):
+    """Length (km) of each consecutive leg of a path."""
+    lats, lons = np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+    return haversine_km(lats[:-1], lons[:-1], lats[1:], lons[1:])
+
+# -----------------------------------------------------------
+# NEIGHBOUR QUERIES
+# -----------------------------------------------------------
+def nearest_k(query_lats, query_lons, lats, lons, k=1):
+    """
+    Indices and distances (km) of the k nearest points to each query point, nearest first.
+    Returns two arrays of shape (len(query), k).
+    """
+    dist = distance_matrix(query_lats, query_lons, lats, lons, dtype=np.float64)
+    k = min(k, dist.shape[1])
+    idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(dist, idx, axis=1)
+    order = np.argsort(part, axis=1)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+def within_radius(lat, lon, lats, lons, radius_km):
+    """Indices of points within radius_km of (lat, lon)."""
+    return np.flatnonzero(haversine_km(lat, lon, lats, lons) <= radius_km)
+
+# -----------------------------------------------------------
+# CENTROID
+# -----------------------------------------------------------
+def spherical_centroid(lats, lons):
+    """
+    Geographic center as the normalised mean of 3D unit vectors. Unlike averaging raw
+    degrees, this is correct across the antimeridian and over large areas.
+    Returns (lat, lon) or None if the points cancel out (e.g. antipodal pairs).
+    """
+    lat, lon = np.radians(np.asarray(lats, dtype=np.float64)), np.radians(np.asarray(lons, dtype=np.float64))
+    x = np.mean(np.cos(lat) * np.cos(lon))
+    y = np.mean(np.cos(lat) * np.sin(lon))
+    z = np.mean(np.sin(lat))
+    if np.sqrt(x * x + y * y + z * z) < 1e-12:
+        return None
+    return float(np.degrees(np.arctan2(z, np.hypot(x, y)))), float(np.degrees(np.arctan2(y, x)))
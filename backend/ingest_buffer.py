@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import deque
+
+# -----------------------------------------------------------
+# BOUNDED INGESTION BUFFER
+# -----------------------------------------------------------
+class BufferFull(Exception):
+    """The buffer cannot take the offered readings; the client should retry later."""
+
+class ReadingBuffer:
+    """
+    Bounded in-process queue of sensor readings drained by one background thread.
+    A flush runs when `flush_size` readings are waiting or `flush_interval` seconds
+    have passed since the last one. `flush_fn(batch, progress)` writes a batch; if it
+    raises, the same batch is retried (with backoff) before anything newer, so a
+    database outage turns into backpressure instead of lost readings. `progress` is a
+    dict kept with the batch across retries, where flush_fn records the steps that
+    completed so a retry resumes after them. A batch still failing after
+    `max_attempts` is handed to `dead_letter_fn(batch, error)` and dropped from the
+    queue, so one bad batch cannot block every later reading.
+    """
+    def __init__(self, flush_fn, max_size=50000, flush_size=2000, flush_interval=1.0,
+                 max_attempts=10, dead_letter_fn=None):
+        self.flush_fn = flush_fn
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.dead_letter_fn = dead_letter_fn
+        self._queue = deque()
+        self._retry = None  # the failed batch: {"readings", "progress", "attempts"}
+        self._cond = threading.Condition()
+        self._stats = {"accepted": 0, "rejected": 0, "flushed": 0, "flushes": 0, "failed_flushes": 0,
+                       "consecutive_failures": 0, "dead_lettered": 0, "last_error": None}
+        self._thread = threading.Thread(target=self._run, name="reading-flusher", daemon=True)
+        self._thread.start()
+
+    def offer(self, readings):
+        """Queue readings all-or-nothing; raises BufferFull when they don't fit."""
+        with self._cond:
+            if self._queued() + len(readings) > self.max_size:
+                self._stats["rejected"] += len(readings)
+                raise BufferFull(f"Ingestion buffer full ({self._queued()}/{self.max_size})")
+            self._queue.extend(readings)
+            self._stats["accepted"] += len(readings)
+            if len(self._queue) >= self.flush_size:
+                self._cond.notify()
+
+    @property
+    def healthy(self):
+        """False when the flusher is dead or the last few flushes all failed."""
+        return self._thread.is_alive() and self._stats["consecutive_failures"] < 3
+
+    def _queued(self):
+        return len(self._queue) + (len(self._retry["readings"]) if self._retry else 0)
+
+    def _take(self):
+        """The failed batch if there is one, else the next `flush_size` readings (None if empty)."""
+        pending, self._retry = self._retry, None
+        if pending is None and self._queue:
+            pending = {"readings": [self._queue.popleft() for _ in range(min(len(self._queue), self.flush_size))],
+                       "progress": {}, "attempts": 0}
+        return pending
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while self._retry is None and len(self._queue) < self.flush_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                pending = self._take()
+            if pending:
+                self._flush(pending)
+
+    def _flush(self, pending):
+        batch = pending["readings"]
+        try:
+            self.flush_fn(batch, pending["progress"])
+        except Exception as e:
+            pending["attempts"] += 1
+            give_up = pending["attempts"] >= self.max_attempts
+            with self._cond:
+                self._stats["failed_flushes"] += 1
+                self._stats["last_error"] = str(e)
+                if give_up:
+                    self._stats["dead_lettered"] += len(batch)
+                    self._stats["consecutive_failures"] = 0
+                else:
+                    self._stats["consecutive_failures"] += 1
+                    self._retry = pending
+            if give_up:
+                self._dead_letter(batch, e, pending["attempts"])
+            else:
+                print(f"❌ Reading flush failed ({len(batch)} readings requeued, "
+                      f"attempt {pending['attempts']}/{self.max_attempts}): {e}")
+                time.sleep(min(self.flush_interval * pending["attempts"], 10))
+            return False
+        with self._cond:
+            self._stats["flushed"] += len(batch)
+            self._stats["flushes"] += 1
+            self._stats["consecutive_failures"] = 0
+        return True
+
+    def _dead_letter(self, batch, error, attempts):
+        print(f"☠️ Giving up on {len(batch)} readings after {attempts} failed flushes: {error}")
+        if self.dead_letter_fn is None:
+            return
+        try:
+            self.dead_letter_fn(batch, error)
+        except Exception as e:
+            print(f"❌ Dead-letter write failed, {len(batch)} readings lost: {e}")
+
+    def flush_now(self):
+        """Synchronously drain everything queued (used at shutdown)."""
+        while True:
+            with self._cond:
+                pending = self._take()
+            if not pending or not self._flush(pending):
+                return
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queued"] = self._queued()
+        stats["max_size"] = self.max_size
+        stats["healthy"] = self.healthy
+        return stats
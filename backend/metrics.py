@@ -0,0 +1,278 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+import psycopg2.extensions
+from pymongo import monitoring
+
+# -----------------------------------------------------------
+# METRICS REGISTRY (Prometheus text exposition)
+# -----------------------------------------------------------
+# Small in-process registry rendered in the Prometheus text format by /metrics.
+# Metrics are per process: scrape every worker, or sum them in the query.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_QUERY_SECONDS = float(os.environ.get("SWMS_SLOW_QUERY_MS", 200)) / 1000
+_registry = []
+_gauge_callbacks = []
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, values)} {total}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labelvalues -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {series[-1]}")
+        return lines
+
+def register_gauges(callback):
+    """callback() -> [(name, help, {label: value}, value), ...], evaluated at scrape time."""
+    _gauge_callbacks.append(callback)
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    seen = set()
+    for callback in _gauge_callbacks:
+        try:
+            samples = callback()
+        except Exception as e:
+            print(f"⚠️ Gauge callback failed: {e}")
+            continue
+        for name, help_text, labels, value in samples:
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {value}")
+    return "\n".join(lines) + "\n"
+
+HTTP_LATENCY = Histogram("swms_http_request_duration_seconds", "Flask request latency by route.",
+                         ("route", "method", "status"))
+SQL_LATENCY = Histogram("swms_sql_query_duration_seconds", "SQL statement latency by calling function.",
+                        ("caller", "verb"))
+SQL_ROWS = Counter("swms_sql_rows_total", "Rows returned or affected by SQL statements.", ("caller", "verb"))
+MONGO_LATENCY = Histogram("swms_mongo_command_duration_seconds", "MongoDB command latency by calling function.",
+                          ("caller", "command", "collection"))
+MONGO_DOCS = Counter("swms_mongo_documents_total", "Documents returned or written by MongoDB commands.",
+                     ("caller", "command", "collection"))
+SLOW_QUERIES = Counter("swms_slow_queries_total", "Statements slower than SWMS_SLOW_QUERY_MS.", ("store", "caller"))
+
+# -----------------------------------------------------------
+# CALLER ATTRIBUTION
+# -----------------------------------------------------------
+# Label each query with the first application function on the stack (e.g.
+# "trial_core._load_dashboard_summary"), skipping driver and helper frames.
+_SKIP_PATHS = (os.sep + "psycopg2" + os.sep, os.sep + "pymongo" + os.sep, os.sep + "mongomock" + os.sep,
+               os.sep + "contextlib.py", os.sep + "threading.py", os.path.abspath(__file__),
+               os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedded.py"),
+               os.path.join(os.path.dirname(os.path.abspath(__file__)), "docstore.py"))
+
+def _caller():
+    frame = sys._getframe(2)
+    while frame is not None:
+        path = frame.f_code.co_filename
+        if not any(p in path for p in _SKIP_PATHS):
+            return f"{os.path.splitext(os.path.basename(path))[0]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+def _short(value, limit=500):
+    text = str(value)
+    return text if len(text) <= limit else text[:limit] + f"... ({len(text)} chars)"
+
+# -----------------------------------------------------------
+# SQL (psycopg2 cursor_factory; embedded.Cursor calls record_sql itself)
+# -----------------------------------------------------------
+def record_sql(caller, query, params, elapsed, rowcount, store="postgres"):
+    sql = query.decode() if isinstance(query, bytes) else str(query)
+    verb = (sql.split(None, 1) or ["?"])[0].upper()
+    SQL_LATENCY.observe(elapsed, caller, verb)
+    if rowcount and rowcount > 0:
+        SQL_ROWS.inc(caller, verb, amount=rowcount)
+    if elapsed >= SLOW_QUERY_SECONDS:
+        SLOW_QUERIES.inc(store, caller)
+        print(f"🐢 Slow SQL {elapsed * 1000:.0f} ms ({rowcount} rows) in {caller}: "
+              f"{_short(' '.join(sql.split()))} | params={_short(params)}")
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """psycopg2 cursor that times every statement. Pass as cursor_factory to connect()."""
+    def _timed(self, run, query, params):
+        caller = _caller()
+        start = time.perf_counter()
+        try:
+            return run()
+        finally:
+            record_sql(caller, query, params, time.perf_counter() - start, self.rowcount)
+
+    def execute(self, query, vars=None):
+        return self._timed(lambda: super(InstrumentedCursor, self).execute(query, vars), query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(lambda: super(InstrumentedCursor, self).executemany(query, vars_list), query, "<many>")
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(lambda: super(InstrumentedCursor, self).copy_expert(sql, file, size), sql, "<copy>")
+
+# -----------------------------------------------------------
+# MONGODB (command monitoring)
+# -----------------------------------------------------------
+def _documents(reply):
+    if "cursor" in reply:
+        batch = reply["cursor"].get("firstBatch", reply["cursor"].get("nextBatch", []))
+        return len(batch)
+    return reply.get("n", 0) or 0
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """pymongo listener timing every command. Pass in MongoClient(event_listeners=[...])."""
+    IGNORED = {"hello", "ismaster", "isMaster", "ping", "buildInfo", "saslStart", "saslContinue", "endSessions"}
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name in self.IGNORED:
+            return
+        command = event.command
+        collection = command.get(event.command_name)
+        with self._lock:
+            self._inflight[(event.request_id, event.connection_id)] = (
+                _caller(), collection if isinstance(collection, str) else "", command)
+
+    def _finish(self, event, reply):
+        with self._lock:
+            info = self._inflight.pop((event.request_id, event.connection_id), None)
+        if info is None:
+            return
+        caller, collection, command = info
+        elapsed = event.duration_micros / 1e6
+        MONGO_LATENCY.observe(elapsed, caller, event.command_name, collection)
+        docs = _documents(reply) if reply else 0
+        if docs:
+            MONGO_DOCS.inc(caller, event.command_name, collection, amount=docs)
+        if elapsed >= SLOW_QUERY_SECONDS:
+            SLOW_QUERIES.inc("mongo", caller)
+            shown = {k: v for k, v in command.items() if k not in ("documents", "updates", "deletes", "lsid", "$db")}
+            print(f"🐢 Slow Mongo {event.command_name} {elapsed * 1000:.0f} ms ({docs} docs) in {caller}: {_short(shown)}")
+
+    def succeeded(self, event):
+        self._finish(event, event.reply)
+
+    def failed(self, event):
+        self._finish(event, None)
+
+# -----------------------------------------------------------
+# SAMPLING PROFILER
+# -----------------------------------------------------------
+class SamplingProfiler:
+    """
+    Samples every thread's stack each `interval` seconds while running and counts
+    collapsed stacks ("a;b;c" -> samples), the input format of flamegraph tools.
+    Costs nothing while stopped.
+    """
+    def __init__(self, interval=0.01, max_depth=40):
+        self.interval, self.max_depth = interval, max_depth
+        self._stacks = _Tally()
+        self._samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        with self._lock:
+            if self.running:
+                return False
+            self.interval = interval or self.interval
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self._samples = 0
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                self._samples += 1
+                for ident, frame in frames.items():
+                    if ident == own:
+                        continue
+                    stack = []
+                    while frame is not None and len(stack) < self.max_depth:
+                        code = frame.f_code
+                        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                        frame = frame.f_back
+                    self._stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self, limit=None):
+        """Collapsed stacks, most sampled first."""
+        with self._lock:
+            return "\n".join(f"{stack} {n}" for stack, n in self._stacks.most_common(limit)) + "\n"
+
+    def stats(self):
+        with self._lock:
+            return {"running": self.running, "interval_seconds": self.interval,
+                    "samples": self._samples, "distinct_stacks": len(self._stacks)}
+
+profiler = SamplingProfiler()
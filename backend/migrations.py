@@ -0,0 +1,226 @@
+import embedded
+
+# -----------------------------------------------------------
+# VERSIONED SCHEMA MIGRATIONS
+# -----------------------------------------------------------
+# Each migration runs once per database, in version order, and is recorded in
+# SchemaMigrations. A PostgreSQL advisory lock serialises concurrent runners (e.g.
+# several workers starting together): the first applies what is missing, the rest
+# wait and then find nothing to do. Statements stay IF NOT EXISTS so databases
+# created before migrations were tracked adopt the recorded versions cleanly.
+# Append new migrations at the end; never edit one that has shipped.
+# Embedded (SQLite) databases run the same migrations: embedded.translate rewrites
+# column types (SERIAL, JSONB), and the few statements SQLite has no spelling for go
+# through _add_column / _create_view below.
+LOCK_NAME = "swms_schema_migrations"
+
+def _add_column(sql_cursor, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN IF NOT EXISTS (SQLite lacks the IF NOT EXISTS)."""
+    if embedded.is_embedded(sql_cursor):
+        sql_cursor.execute("SELECT 1 FROM pragma_table_info(%s) WHERE name = %s;", (table, column))
+        if not sql_cursor.fetchone():
+            sql_cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+    else:
+        sql_cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition};")
+
+def _create_view(sql_cursor, name, query):
+    """CREATE OR REPLACE VIEW (SQLite lacks OR REPLACE, so the view is dropped first)."""
+    if embedded.is_embedded(sql_cursor):
+        sql_cursor.execute(f"DROP VIEW IF EXISTS {name};")
+        sql_cursor.execute(f"CREATE VIEW {name} AS {query}")
+    else:
+        sql_cursor.execute(f"CREATE OR REPLACE VIEW {name} AS {query}")
+
+def _initial_schema(sql_cursor):
+    sql_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Bins (
+            serial TEXT PRIMARY KEY,
+            address TEXT,
+            lat DOUBLE PRECISION,
+            lon DOUBLE PRECISION,
+            status TEXT DEFAULT 'Active'
+        );
+    """)
+    sql_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Trucks (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            status TEXT DEFAULT 'Idle' -- Status: Idle, On-Route
+        );
+    """)
+    sql_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Landfills (
+            id SERIAL PRIMARY KEY,
+            name TEXT UNIQUE,
+            capacity_tons FLOAT,
+            used_tons FLOAT DEFAULT 0
+        );
+    """)
+    sql_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Transactions (
+            id SERIAL PRIMARY KEY,
+            truck_id INT REFERENCES Trucks(id) ON DELETE CASCADE,
+            bins_collected INT,
+            waste_weight FLOAT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    sql_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS MonitoringAlerts (
+            id SERIAL PRIMARY KEY,
+            type TEXT,
+            message TEXT,
+            severity TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    # TruckRoutes table (route history)
+    sql_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS TruckRoutes (
+            id SERIAL PRIMARY KEY,
+            truck_id INT REFERENCES Trucks(id) ON DELETE SET NULL,
+            route JSONB,
+            assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP
+        );
+    """)
+
+    # Sample trucks and landfills (insert if not exists)
+    for t in [("Truck-01",), ("Truck-02",), ("Truck-03",)]:
+        sql_cursor.execute("INSERT INTO Trucks (name) VALUES (%s) ON CONFLICT (name) DO NOTHING;", t)
+    for l in [("Central Landfill", 10000, 4000), ("East Waste Facility", 8000, 2500)]:
+        sql_cursor.execute("""
+            INSERT INTO Landfills (name, capacity_tons, used_tons)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (name) DO NOTHING;
+        """, l)
+
+    # Indexes for performance
+    sql_cursor.execute("CREATE INDEX IF NOT EXISTS idx_bins_status ON Bins(status);")
+    sql_cursor.execute("CREATE INDEX IF NOT EXISTS idx_trucks_status ON Trucks(status);")
+
+    _create_view(sql_cursor, "DashboardSummary", """
+        SELECT
+            (SELECT COUNT(*) FROM Bins) AS total_bins,
+            (SELECT COUNT(*) FROM Bins WHERE status='In-Service') AS active_bins,
+            (SELECT COUNT(*) FROM Bins WHERE status='Active') AS available_bins,
+            (SELECT COUNT(*) FROM Trucks WHERE status='On-Route') AS active_trucks,
+            (SELECT COUNT(*) FROM Trucks WHERE status='Idle') AS idle_trucks;
+    """)
+
+def _truck_limits_and_alert_serials(sql_cursor):
+    # Per-truck planning limits used by fleet (multi-truck) collection
+    _add_column(sql_cursor, "Trucks", "capacity_bins", "INT DEFAULT 40")
+    _add_column(sql_cursor, "Trucks", "max_route_km", "DOUBLE PRECISION DEFAULT 60")
+    _add_column(sql_cursor, "MonitoringAlerts", "serial", "TEXT")
+
+def _rollups_and_ingest_ledger(sql_cursor):
+    # Pre-aggregated route metrics (see rollups.py)
+    sql_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Rollups (
+            metric TEXT,
+            granularity TEXT,
+            rollup_key TEXT,
+            bucket TIMESTAMP,
+            n BIGINT,
+            total DOUBLE PRECISION,
+            min_value DOUBLE PRECISION,
+            max_value DOUBLE PRECISION,
+            PRIMARY KEY (metric, granularity, rollup_key, bucket)
+        );
+    """)
+    # Ingestion ledger (files already loaded by incremental ingestion)
+    sql_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS IngestedFiles (
+            checksum TEXT PRIMARY KEY,
+            path TEXT,
+            size_bytes BIGINT,
+            rows_inserted INT,
+            ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+def _route_bins(sql_cursor):
+    # RouteBins (bins on each route, in visiting order)
+    sql_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS RouteBins (
+            route_id INT REFERENCES TruckRoutes(id) ON DELETE CASCADE,
+            serial TEXT REFERENCES Bins(serial) ON DELETE CASCADE,
+            position INT,
+            fill_level DOUBLE PRECISION,
+            PRIMARY KEY (route_id, serial)
+        );
+    """)
+    sql_cursor.execute("CREATE INDEX IF NOT EXISTS idx_routebins_serial ON RouteBins(serial);")
+    # Routes logged before RouteBins existed only have the JSONB serial list
+    # (embedded databases never had such routes)
+    if embedded.is_embedded(sql_cursor):
+        return
+    sql_cursor.execute("""
+        INSERT INTO RouteBins (route_id, serial, position)
+        SELECT tr.id, s.serial, s.ord - 1
+        FROM TruckRoutes tr
+        CROSS JOIN LATERAL jsonb_array_elements_text(tr.route) WITH ORDINALITY AS s(serial, ord)
+        JOIN Bins b ON b.serial = s.serial
+        WHERE jsonb_typeof(tr.route) = 'array'
+          AND NOT EXISTS (SELECT 1 FROM RouteBins rb WHERE rb.route_id = tr.id)
+        ON CONFLICT DO NOTHING;
+    """)
+
+def _scheduled_routes(sql_cursor):
+    # Planned routes created from the UI (previously created by /api/routes on every call)
+    sql_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Routes (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            area TEXT,
+            truck_id INT REFERENCES Trucks(id),
+            status TEXT DEFAULT 'Scheduled',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "truck planning limits and alert serials", _truck_limits_and_alert_serials),
+    (3, "rollups and ingestion ledger", _rollups_and_ingest_ledger),
+    (4, "route bins", _route_bins),
+    (5, "scheduled routes", _scheduled_routes),
+]
+
+def applied_versions(sql_cursor):
+    sql_cursor.execute("SELECT version FROM SchemaMigrations ORDER BY version;")
+    return [row[0] for row in sql_cursor.fetchall()]
+
+def migrate(sql_cursor, sql_conn):
+    """Apply pending migrations, each in its own transaction. Returns the versions applied."""
+    sql_cursor.execute("SELECT pg_advisory_lock(hashtext(%s));", (LOCK_NAME,))
+    try:
+        sql_cursor.execute("""
+            CREATE TABLE IF NOT EXISTS SchemaMigrations (
+                version INT PRIMARY KEY,
+                name TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        sql_conn.commit()
+        done = set(applied_versions(sql_cursor))
+        applied = []
+        for version, name, apply in MIGRATIONS:
+            if version in done:
+                continue
+            try:
+                apply(sql_cursor)
+                sql_cursor.execute("INSERT INTO SchemaMigrations (version, name) VALUES (%s, %s);", (version, name))
+                sql_conn.commit()
+            except Exception as e:
+                sql_conn.rollback()
+                print(f"❌ Migration {version} ({name}) failed: {e}")
+                raise
+            print(f"🧱 Applied migration {version}: {name}")
+            applied.append(version)
+        return applied
+    finally:
+        sql_conn.rollback()
+        sql_cursor.execute("SELECT pg_advisory_unlock(hashtext(%s));", (LOCK_NAME,))
+        sql_conn.commit()
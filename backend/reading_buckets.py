@@ -0,0 +1,140 @@
+import os
+from datetime import timedelta
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+# -----------------------------------------------------------
+# BUCKETED READING STORAGE
+# -----------------------------------------------------------
+# One document per (bin, UTC day) holding that day's readings as parallel arrays:
+#   {_id: "<serial>|<YYYY-MM-DD>", serial, day,
+#    t: [milliseconds since day start], f: [fill level], s: [bin status],
+#    n, sum, min, max, first, last}
+# Only the measurement is stored; bin metadata (address, coordinates) lives in the
+# Bins table and bin_state. A day of 15-minute readings is one ~3 KB document instead
+# of 96 documents and 96 (serial, time) index entries.
+# Used for every reading when SWMS_READINGS_FORMAT=buckets, and as the cold tier of
+# retention.py for readings compacted out of the per-reading collection.
+COLLECTION = "reading_buckets"
+FORMAT = os.environ.get("SWMS_READINGS_FORMAT", "documents")
+if FORMAT not in ("documents", "buckets"):
+    raise ValueError(f"SWMS_READINGS_FORMAT must be 'documents' or 'buckets', not {FORMAT!r}")
+ENABLED = FORMAT == "buckets"
+
+def get_collection(bin_readings_collection):
+    return bin_readings_collection.database[COLLECTION]
+
+def ensure_indexes(bin_readings_collection):
+    get_collection(bin_readings_collection).create_index([("serial", 1), ("day", 1)])
+    get_collection(bin_readings_collection).create_index([("day", 1)])
+
+def has_readings(bin_readings_collection):
+    """True if any reading is stored, in either layout."""
+    return bin_readings_collection.estimated_document_count() > 0 or \
+        get_collection(bin_readings_collection).estimated_document_count() > 0
+
+def day_start(t):
+    return t.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def bucket_id(serial, day):
+    return f"{serial}|{day:%Y-%m-%d}"
+
+def fill_value(value):
+    return float(value) if value is not None and value == value else None
+
+def offset_ms(t, day):
+    return (t - day) // timedelta(milliseconds=1)
+
+def _push(serial, day, key, rows, stored_filter):
+    t = [offset_ms(r["time"], day) for r in rows]
+    f = [fill_value(r.get("status_current_fill_level")) for r in rows]
+    fills = [v for v in f if v is not None]
+    update = {
+        "$setOnInsert": {"serial": serial, "day": day},
+        "$push": {"t": {"$each": t}, "f": {"$each": f}, "s": {"$each": [r.get("bin_status") for r in rows]}},
+        "$inc": {"n": len(t), "sum": sum(fills)},
+        "$min": {"first": min(t)},
+        "$max": {"last": max(t)},
+    }
+    if fills:
+        update["$min"]["min"] = min(fills)
+        update["$max"]["max"] = max(fills)
+    return UpdateOne(dict({"_id": key}, **stored_filter), update, upsert=True)
+
+def _write(collection, ops):
+    """bulk_write `ops` unordered; returns the indexes rejected by a duplicate _id (a failed dedupe filter)."""
+    try:
+        collection.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in errors):
+            raise
+        return {err["index"] for err in errors}
+    return set()
+
+def append(bin_readings_collection, readings, dedupe=True):
+    """
+    Add readings to their day buckets with one upsert per bucket. With dedupe=True
+    readings whose (serial, time) is already stored are skipped: the check is part of
+    the update filter (the bucket must not already hold any of the offsets), so two
+    writers appending the same reading cannot both store it. If the filter fails the
+    upsert collides on _id, and that bucket's readings are retried one per update.
+    Returns the readings actually stored.
+    """
+    buckets = {}
+    for r in readings:
+        if r.get("serial") is None or r.get("time") is None:
+            continue
+        day = day_start(r["time"])
+        rows = buckets.setdefault(bucket_id(r["serial"], day), (r["serial"], day, {}))[2]
+        rows.setdefault(offset_ms(r["time"], day), r)  # first copy of a repeated reading wins
+    if not buckets:
+        return []
+
+    collection = get_collection(bin_readings_collection)
+    keys = list(buckets)
+    ops = [_push(serial, day, key, list(rows.values()),
+                 {"t": {"$nin": list(rows)}} if dedupe else {})
+           for key, (serial, day, rows) in ((k, buckets[k]) for k in keys)]
+    rejected = _write(collection, ops)
+    fresh = [r for k, key in enumerate(keys) if k not in rejected for r in buckets[key][2].values()]
+    if not rejected:
+        return fresh
+
+    # Some offsets of these buckets are already stored: add the rest one reading at a time
+    single = [(key, offset, r) for k, key in enumerate(keys) if k in rejected for offset, r in buckets[key][2].items()]
+    rejected = _write(collection, [_push(buckets[key][0], buckets[key][1], key, [r], {"t": {"$ne": offset}})
+                                   for key, offset, r in single])
+    fresh.extend(r for k, (_, _, r) in enumerate(single) if k not in rejected)
+    return fresh
+
+def expand(bucket):
+    """Yield a bucket's readings as {serial, time, status_current_fill_level, bin_status}, oldest first."""
+    for offset, fill, status in sorted(zip(bucket["t"], bucket["f"], bucket["s"]), key=lambda x: x[0]):
+        yield {"serial": bucket["serial"], "time": bucket["day"] + timedelta(milliseconds=offset),
+               "status_current_fill_level": fill, "bin_status": status}
+
+def find(bin_readings_collection, serial=None, start=None, end=None):
+    """Readings in [start, end) (optionally for one serial), ordered by serial then time."""
+    query = {}
+    if serial is not None:
+        query["serial"] = serial
+    if start or end:
+        query["day"] = {}
+        if start:
+            query["day"]["$gte"] = day_start(start)
+        if end:
+            query["day"]["$lt"] = end
+    for bucket in get_collection(bin_readings_collection).find(query).sort([("serial", 1), ("day", 1)]):
+        for r in expand(bucket):
+            if (start is None or r["time"] >= start) and (end is None or r["time"] < end):
+                yield r
+
+def latest_per_serial(bin_readings_collection):
+    """{serial: newest reading} from each bin's most recent bucket."""
+    latest = {}
+    for bucket in get_collection(bin_readings_collection).find({}, {"serial": 1, "day": 1, "t": 1, "f": 1, "s": 1}) \
+            .sort([("serial", 1), ("day", -1)]):
+        if bucket["serial"] not in latest:
+            latest[bucket["serial"]] = list(expand(bucket))[-1]
+    return latest
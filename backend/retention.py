@@ -0,0 +1,181 @@
+import argparse
+import glob
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+import reading_buckets
+
+# -----------------------------------------------------------
+# HOT/COLD RETENTION FOR bin_readings
+# -----------------------------------------------------------
+# Hot tier: raw readings newer than `hot_days` stay in bin_readings, where ingestion,
+# alerting and forecasting read them. Cold tier: compact() moves older readings into
+# either
+#   - reading_buckets: one document per (bin, day) with parallel arrays of time
+#     offsets, fill levels and statuses plus n/sum/min/max (the default; see
+#     reading_buckets.py), or
+#   - Parquet files under `cold_dir`, partitioned by day and zstd-compressed
+#     (when SWMS_COLD_DIR is set; needs pyarrow).
+# With SWMS_READINGS_FORMAT=buckets every reading is already bucketed, so compaction
+# only exports buckets older than the hot window to Parquet, if `cold_dir` is set.
+# Readings are copied to the cold tier first and then deleted by _id, so a reading is
+# never dropped uncompacted. A crash in between is harmless on retry: bucket appends
+# skip (serial, time) pairs already bucketed, so counts and sums stay exact, and a
+# duplicate Parquet row is removed by history(). No TTL index is used because it would expire readings whether or
+# not they had been compacted.
+# "Now" is the newest reading time (from bin_state), so replayed history ages the
+# same way live data does; it never runs ahead of the wall clock, so one reading with
+# a bad future timestamp can't push the whole hot tier out.
+HOT_DAYS = int(os.environ.get("SWMS_HOT_DAYS", 30))
+COLD_DIR = os.environ.get("SWMS_COLD_DIR") or None
+
+def ensure_indexes(bin_readings_collection):
+    bin_readings_collection.create_index([("time", 1)])
+    reading_buckets.ensure_indexes(bin_readings_collection)
+
+def hot_cutoff(bin_readings_collection, hot_days=HOT_DAYS, now=None):
+    """Start of the oldest day kept hot, or None if there is no data yet."""
+    if now is None:
+        latest = bin_readings_collection.database["bin_state"].find_one(sort=[("time", -1)])
+        if not latest:
+            return None
+        now = min(latest["time"], datetime.utcnow())
+    return reading_buckets.day_start(now - timedelta(days=hot_days))
+
+# -----------------------------------------------------------
+# COMPACTION
+# -----------------------------------------------------------
+def _write_parquet(docs, cold_dir):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    by_day = {}
+    for d in docs:
+        by_day.setdefault(reading_buckets.day_start(d["time"]), []).append(d)
+    for day, rows in by_day.items():
+        table = pa.table({
+            "serial": [r["serial"] for r in rows],
+            "time": pa.array([r["time"] for r in rows], type=pa.timestamp("us")),
+            "status_current_fill_level": [reading_buckets.fill_value(r.get("status_current_fill_level")) for r in rows],
+            "bin_status": [r.get("bin_status") for r in rows],
+        })
+        directory = os.path.join(cold_dir, f"day={day:%Y-%m-%d}")
+        os.makedirs(directory, exist_ok=True)
+        # Append-only: each compaction run adds a part file, nothing is rewritten
+        pq.write_table(table, os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet"), compression="zstd")
+
+def compact(bin_readings_collection, hot_days=HOT_DAYS, cold_dir=COLD_DIR, now=None, batch_size=20000):
+    """Move readings older than the hot window to the cold tier. Returns stats."""
+    started = datetime.now()
+    cutoff = hot_cutoff(bin_readings_collection, hot_days, now)
+    moved = 0
+    if cutoff is not None and reading_buckets.ENABLED:
+        if cold_dir:
+            moved = _export_buckets(bin_readings_collection, cutoff, cold_dir, batch_size)
+    elif cutoff is not None:
+        cursor = bin_readings_collection.find({"time": {"$lt": cutoff}}).sort([("serial", 1), ("time", 1)])
+        batch = []
+        for doc in cursor.batch_size(batch_size):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                moved += _move(bin_readings_collection, batch, cold_dir)
+                batch = []
+        moved += _move(bin_readings_collection, batch, cold_dir)
+    seconds = (datetime.now() - started).total_seconds()
+    print(f"🧊 Compacted {moved} readings older than {cutoff} into the "
+          f"{'parquet' if cold_dir else 'bucket'} tier in {seconds:.1f}s.")
+    return {"cutoff": cutoff, "moved": moved, "tier": "parquet" if cold_dir else "buckets",
+            "seconds": round(seconds, 3)}
+
+def _move(bin_readings_collection, docs, cold_dir):
+    if not docs:
+        return 0
+    if cold_dir:
+        _write_parquet(docs, cold_dir)
+    else:
+        reading_buckets.append(bin_readings_collection, docs)
+    bin_readings_collection.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+    return len(docs)
+
+def _export_buckets(bin_readings_collection, cutoff, cold_dir, batch_size):
+    """Bucket format: move whole day buckets older than cutoff to Parquet."""
+    buckets = reading_buckets.get_collection(bin_readings_collection)
+    moved = 0
+    while True:
+        batch = list(buckets.find({"day": {"$lt": cutoff}}).sort([("day", 1), ("serial", 1)]).limit(max(1, batch_size // 96)))
+        if not batch:
+            return moved
+        docs = [r for b in batch for r in reading_buckets.expand(b)]
+        _write_parquet(docs, cold_dir)
+        buckets.delete_many({"_id": {"$in": [b["_id"] for b in batch]}})
+        moved += len(docs)
+
+def clear(bin_readings_collection, cold_dir=COLD_DIR):
+    """Drop the cold tier (used when history is reloaded from scratch)."""
+    reading_buckets.get_collection(bin_readings_collection).delete_many({})
+    if cold_dir:
+        for directory in glob.glob(os.path.join(cold_dir, "day=*")):
+            shutil.rmtree(directory, ignore_errors=True)
+
+# -----------------------------------------------------------
+# QUERIES SPANNING BOTH TIERS
+# -----------------------------------------------------------
+def _from_parquet(cold_dir, serial, start, end):
+    if not cold_dir or not glob.glob(os.path.join(cold_dir, "day=*")):
+        return []
+    import pyarrow.dataset as ds
+    condition = ds.field("serial") == serial
+    if start:
+        condition &= ds.field("time") >= start
+    if end:
+        condition &= ds.field("time") < end
+    table = ds.dataset(cold_dir, format="parquet", partitioning="hive").to_table(
+        filter=condition, columns=["time", "status_current_fill_level", "bin_status"])
+    return [dict(row, tier="cold") for row in table.to_pylist()]
+
+def history(bin_readings_collection, serial, start=None, end=None, cold_dir=COLD_DIR):
+    """
+    Readings of one bin in [start, end), oldest first, from whichever tiers hold them.
+    Each row is {time, status_current_fill_level, bin_status, tier}.
+    """
+    rows = {}
+    # Bucketed readings are hot when buckets are the primary format, cold otherwise
+    cutoff = hot_cutoff(bin_readings_collection) if reading_buckets.ENABLED else None
+    for r in reading_buckets.find(bin_readings_collection, serial, start, end):
+        r.pop("serial")
+        rows[r["time"]] = dict(r, tier="hot" if cutoff is not None and r["time"] >= cutoff else "cold")
+    for r in _from_parquet(cold_dir, serial, start, end):
+        rows[r["time"]] = r
+    query = {"serial": serial}
+    if start or end:
+        query["time"] = {}
+        if start:
+            query["time"]["$gte"] = start
+        if end:
+            query["time"]["$lt"] = end
+    for r in bin_readings_collection.find(query, {"_id": 0, "time": 1, "status_current_fill_level": 1, "bin_status": 1}):
+        rows[r["time"]] = dict(r, tier="hot")
+    return [rows[t] for t in sorted(rows)]
+
+def tier_stats(bin_readings_collection, cold_dir=COLD_DIR):
+    files = glob.glob(os.path.join(cold_dir, "day=*", "*.parquet")) if cold_dir else []
+    return {
+        "hot_days": HOT_DAYS,
+        "readings_format": reading_buckets.FORMAT,
+        "hot_readings": bin_readings_collection.estimated_document_count(),
+        "buckets": reading_buckets.get_collection(bin_readings_collection).estimated_document_count(),
+        "parquet_files": len(files),
+        "parquet_bytes": sum(os.path.getsize(f) for f in files),
+    }
+
+if __name__ == "__main__":
+    import trial_core as core
+    parser = argparse.ArgumentParser(description="Compact old bin readings into the cold tier.")
+    parser.add_argument("--hot-days", type=int, default=HOT_DAYS)
+    parser.add_argument("--cold-dir", default=COLD_DIR, help="write Parquet files here instead of bucket documents")
+    args = parser.parse_args()
+    mongo_client, _, bin_readings_collection = core.get_mongo_connection()
+    ensure_indexes(bin_readings_collection)
+    compact(bin_readings_collection, args.hot_days, args.cold_dir)
+    print(tier_stats(bin_readings_collection, args.cold_dir))
+    mongo_client.close()
@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from embedded import execute_values
+
+# -----------------------------------------------------------
+# TIME-SERIES ROLLUPS
+# -----------------------------------------------------------
+# One row/document per (metric, granularity, key, bucket) holding count/sum/min/max,
+# maintained incrementally as observations arrive. Reading metrics live in MongoDB
+# next to bin_readings; route metrics live in PostgreSQL (Rollups table) so they
+# commit in the same transaction as the route change that produced them.
+GRANULARITIES = ("hour", "day")
+READING_METRICS = ("fill", "fill_area")
+ROUTE_METRICS = ("collected_bins", "collected_fill", "route_minutes")
+
+def bucket_start(t, granularity):
+    if granularity == "hour":
+        return t.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return t.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"unknown granularity: {granularity}")
+
+def ensure_indexes(rollup_collection):
+    rollup_collection.create_index([("metric", 1), ("granularity", 1), ("key", 1), ("bucket", 1)])
+    rollup_collection.create_index([("metric", 1), ("granularity", 1), ("bucket", 1)])
+
+def _accumulate(observations):
+    """Pre-aggregate (key, time, value) observations per (granularity, key, bucket)."""
+    acc = {}
+    for key, t, value in observations:
+        if t is None or value is None or value != value:  # skip NaN
+            continue
+        value = float(value)
+        for g in GRANULARITIES:
+            slot = acc.setdefault((g, key, bucket_start(t, g)), [0, 0.0, value, value])
+            slot[0] += 1
+            slot[1] += value
+            slot[2] = min(slot[2], value)
+            slot[3] = max(slot[3], value)
+    return acc
+
+def add_observations(rollup_collection, metric, observations):
+    """Fold (key, time, value) observations into the MongoDB rollups, one upsert per bucket."""
+    acc = _accumulate(observations)
+    if not acc:
+        return 0
+
+    ops = [
+        UpdateOne(
+            {"_id": f"{metric}|{g}|{key}|{bucket.isoformat()}"},
+            {
+                "$setOnInsert": {"metric": metric, "granularity": g, "key": key, "bucket": bucket},
+                "$inc": {"count": count, "sum": total},
+                "$min": {"min": lo},
+                "$max": {"max": hi},
+            },
+            upsert=True,
+        )
+        for (g, key, bucket), (count, total, lo, hi) in acc.items()
+    ]
+    rollup_collection.bulk_write(ops, ordered=False)
+    return len(ops)
+
+def add_observations_sql(sql_cursor, metric, observations):
+    """Fold (key, time, value) observations into the PostgreSQL Rollups table (caller commits)."""
+    acc = _accumulate(observations)
+    if not acc:
+        return 0
+    rows = [(metric, g, str(key), bucket, count, total, lo, hi)
+            for (g, key, bucket), (count, total, lo, hi) in acc.items()]
+    execute_values(sql_cursor, """
+        INSERT INTO Rollups (metric, granularity, rollup_key, bucket, n, total, min_value, max_value)
+        VALUES %s
+        ON CONFLICT (metric, granularity, rollup_key, bucket) DO UPDATE SET
+            n = Rollups.n + EXCLUDED.n,
+            total = Rollups.total + EXCLUDED.total,
+            min_value = LEAST(Rollups.min_value, EXCLUDED.min_value),
+            max_value = GREATEST(Rollups.max_value, EXCLUDED.max_value);
+    """, rows)
+    return len(rows)
+
+def _check_granularity(granularity):
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+def _row(bucket, count, total, lo, hi):
+    return {"bucket": bucket, "count": count, "sum": total,
+            "avg": round(total / count, 2) if count else None, "min": lo, "max": hi}
+
+def query_sql(sql_cursor, metric, granularity="day", key=None, start=None, end=None):
+    """PostgreSQL counterpart of query()."""
+    _check_granularity(granularity)
+    sql = """
+        SELECT bucket, SUM(n), SUM(total), MIN(min_value), MAX(max_value)
+        FROM Rollups
+        WHERE metric = %s AND granularity = %s
+    """
+    params = [metric, granularity]
+    if key is not None:
+        sql += " AND rollup_key = %s"
+        params.append(str(key))
+    if start:
+        sql += " AND bucket >= %s"
+        params.append(bucket_start(start, granularity))
+    if end:
+        sql += " AND bucket < %s"
+        params.append(end)
+    sql += " GROUP BY bucket ORDER BY bucket;"
+    sql_cursor.execute(sql, params)
+    return [_row(b, int(n), float(t), lo, hi) for b, n, t, lo, hi in sql_cursor.fetchall()]
+
+def query(rollup_collection, metric, granularity="day", key=None, start=None, end=None):
+    """
+    Rollup buckets for a metric in [start, end). With key=None buckets are merged
+    across all keys. Returns [{bucket, count, sum, avg, min, max}, ...] oldest first.
+    """
+    _check_granularity(granularity)
+    match = {"metric": metric, "granularity": granularity}
+    if key is not None:
+        match["key"] = key
+    if start or end:
+        match["bucket"] = {}
+        if start:
+            match["bucket"]["$gte"] = bucket_start(start, granularity)
+        if end:
+            match["bucket"]["$lt"] = end
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": "$bucket", "count": {"$sum": "$count"}, "sum": {"$sum": "$sum"},
+                    "min": {"$min": "$min"}, "max": {"$max": "$max"}}},
+        {"$sort": {"_id": 1}},
+    ]
+    return [_row(d["_id"], d["count"], d["sum"], d["min"], d["max"]) for d in rollup_collection.aggregate(pipeline)]
+
+def last_days(rows, days=7, now=None):
+    """Align daily rollup rows to the last `days` days (ending today); None where a day has no data."""
+    today = bucket_start(now or datetime.utcnow(), "day")
+    by_day = {r["bucket"]: r for r in rows}
+    return [(d, by_day.get(d)) for d in (today - timedelta(days=days - 1 - i) for i in range(days))]
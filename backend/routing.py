@@ -0,0 +1,190 @@
+import time
+import numpy as np
+import geo
+
+EPS = 1e-9
+
+# -----------------------------------------------------------
+# DISTANCES
+# -----------------------------------------------------------
+def tour_length(tour, dist):
+    """Length of an open path that visits `tour` in order (no return leg)."""
+    tour = np.asarray(tour)
+    return float(dist[tour[:-1], tour[1:]].astype(np.float64).sum())
+
+# -----------------------------------------------------------
+# CONSTRUCTION
+# -----------------------------------------------------------
+def nearest_neighbour_tour(dist, start=0):
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    tour = [start]
+    visited[start] = True
+    curr = start
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[curr])
+        curr = int(np.argmin(row))
+        visited[curr] = True
+        tour.append(curr)
+    return np.array(tour)
+
+# -----------------------------------------------------------
+# LOCAL SEARCH (tour[0] is the fixed start, the path end is free)
+# -----------------------------------------------------------
+def two_opt(tour, dist, deadline):
+    """Reverse segments while that shortens the path. Each i scans every j in one numpy step."""
+    tour = tour.copy()
+    n = len(tour)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = tour[i - 1], tour[i]
+            cs = tour[i + 1:]
+            ds = tour[i + 2:]
+            delta = dist[a, cs] - dist[a, b]
+            delta[:-1] += dist[b, ds] - dist[cs[:-1], ds]
+            k = int(np.argmin(delta))
+            if delta[k] < -EPS:
+                j = i + 1 + k
+                tour[i:j + 1] = tour[i:j + 1][::-1].copy()
+                improved = True
+            if time.perf_counter() >= deadline:
+                break
+    return tour
+
+def or_opt(tour, dist, deadline, max_segment=3):
+    """Move runs of 1..max_segment stops (optionally reversed) to their cheapest position."""
+    tour = tour.copy()
+    n = len(tour)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for k in range(1, max_segment + 1):
+            i = 1
+            while i + k <= n and time.perf_counter() < deadline:
+                seg = tour[i:i + k]
+                p, s0, se = tour[i - 1], seg[0], seg[-1]
+                rest = np.concatenate((tour[:i], tour[i + k:]))
+                if i + k < n:
+                    nx = tour[i + k]
+                    gain = dist[p, s0] + dist[se, nx] - dist[p, nx]
+                else:
+                    gain = dist[p, s0]
+                u, v = rest[:-1], rest[1:]
+                base = dist[u, v]
+                fwd = np.append(dist[u, s0] + dist[se, v] - base, dist[rest[-1], s0])
+                rev = np.append(dist[u, se] + dist[s0, v] - base, dist[rest[-1], se])
+                jf, jr = int(np.argmin(fwd)), int(np.argmin(rev))
+                if min(fwd[jf], rev[jr]) < gain - EPS:
+                    j, piece = (jf, seg) if fwd[jf] <= rev[jr] else (jr, seg[::-1])
+                    tour = np.concatenate((rest[:j + 1], piece, rest[j + 1:]))
+                    improved = True
+                else:
+                    i += 1
+    return tour
+
+# -----------------------------------------------------------
+# ROUTE PLANNING
+# -----------------------------------------------------------
+def plan_route(points, start_location, time_limit=0.5):
+    """
+    Order `points` [(lat, lon), ...] into a short path from `start_location`.
+    Builds a nearest-neighbour tour, then improves it with 2-opt and Or-opt until
+    no move helps or `time_limit` seconds pass. Returns (order, stats).
+    """
+    if not points:
+        return [], {"bins": 0, "initial_km": 0.0, "length_km": 0.0, "seconds": 0.0}
+    started = time.perf_counter()
+    deadline = started + time_limit
+    lats = [start_location[0]] + [p[0] for p in points]
+    lons = [start_location[1]] + [p[1] for p in points]
+    dist = geo.distance_matrix(lats, lons)
+
+    tour = nearest_neighbour_tour(dist)
+    initial = tour_length(tour, dist)
+    while time.perf_counter() < deadline:
+        before = tour_length(tour, dist)
+        tour = or_opt(two_opt(tour, dist, deadline), dist, deadline)
+        if tour_length(tour, dist) >= before - EPS:
+            break
+
+    order = [int(k) - 1 for k in tour[1:]]
+    stats = {
+        "bins": len(order),
+        "initial_km": round(initial, 3),
+        "length_km": round(tour_length(tour, dist), 3),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    return order, stats
+
+# -----------------------------------------------------------
+# FLEET PLANNING (capacitated, multi-truck)
+# -----------------------------------------------------------
+def _trim_to_length(order, points, start_location, max_km):
+    """Drop stops from the end of a planned path until it fits within max_km."""
+    lats = [start_location[0]] + [points[k][0] for k in order]
+    lons = [start_location[1]] + [points[k][1] for k in order]
+    legs = np.cumsum(geo.path_legs(lats, lons))
+    keep = int(np.searchsorted(legs, max_km, side="right"))
+    return order[:keep], order[keep:], float(legs[keep - 1]) if keep else 0.0
+
+def plan_fleet_routes(points, trucks, start_location, time_limit=1.0):
+    """
+    Split `points` [(lat, lon), ...] across `trucks` [(capacity, max_route_km), ...].
+
+    Sweep clustering: stops are sorted by bearing around the depot, starting after the
+    widest angular gap, and handed out in contiguous arcs sized by truck capacity. Each
+    arc is then routed with plan_route and trimmed to the truck's max route length.
+    Returns (routes, unassigned) where routes is [(truck_index, order, stats), ...].
+    """
+    if not points or not trucks:
+        return [], list(range(len(points)))
+    pts = np.asarray(points, dtype=np.float64)
+    bearing = np.arctan2(pts[:, 0] - start_location[0],
+                         (pts[:, 1] - start_location[1]) * np.cos(np.radians(start_location[0])))
+    by_angle = np.argsort(bearing)
+    if len(by_angle) > 1:
+        sorted_bearing = bearing[by_angle]
+        gaps = np.diff(np.append(sorted_bearing, sorted_bearing[0] + 2 * np.pi))
+        by_angle = np.roll(by_angle, -(int(np.argmax(gaps)) + 1))
+
+    # Largest trucks first; use only as many as the load needs, splitting it evenly by capacity
+    fleet = sorted(range(len(trucks)), key=lambda t: -trucks[t][0])
+    needed, total_cap = 0, 0
+    for t in fleet:
+        if total_cap >= len(pts):
+            break
+        needed += 1
+        total_cap += trucks[t][0]
+    fleet = fleet[:needed]
+    load = min(len(pts), total_cap)
+    share = [int(round(load * trucks[t][0] / total_cap)) for t in fleet]
+    share[-1] = load - sum(share[:-1])
+
+    routes, unassigned, pos = [], [int(k) for k in by_angle[load:]], 0
+    per_route_limit = time_limit / max(len(fleet), 1)
+    for t, count in zip(fleet, share):
+        cluster = [int(k) for k in by_angle[pos:pos + count]]
+        pos += count
+        if not cluster:
+            continue
+        order, stats = plan_route([points[k] for k in cluster], start_location, per_route_limit)
+        order = [cluster[k] for k in order]
+        max_km = trucks[t][1]
+        if max_km and stats["length_km"] > max_km:
+            order, dropped, length = _trim_to_length(order, points, start_location, max_km)
+            unassigned.extend(dropped)
+            stats.update(bins=len(order), length_km=round(length, 3))
+        if order:
+            routes.append((t, order, stats))
+
+    # Stops cut by route-length limits go to the trucks that were not needed above
+    spare = [t for t in range(len(trucks)) if t not in fleet]
+    if unassigned and spare:
+        src = unassigned
+        extra, left = plan_fleet_routes([points[k] for k in src], [trucks[t] for t in spare],
+                                        start_location, per_route_limit)
+        routes += [(spare[t], [src[k] for k in order], stats) for t, order, stats in extra]
+        unassigned = [src[k] for k in left]
+    return routes, unassigned
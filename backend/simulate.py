@@ -0,0 +1,273 @@
+import argparse
+import heapq
+import json
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import geo
+import routing
+import synthetic
+from forecast import FillForecaster
+
+# -----------------------------------------------------------
+# OFFLINE COLLECTION SIMULATOR
+# -----------------------------------------------------------
+# Replays reading history (a CSV export of bin_readings, the live collections, or a
+# synthetic stream) through the collection logic, entirely in memory:
+#   - the bins needing collection are the ones find_bins_for_collection would return
+#     (Full, at/above the threshold, or forecast to cross it within horizon_hours),
+#     minus bins already claimed by a truck on the road (claim_bins);
+#   - "single" dispatches the lowest idle truck with every such bin, routed by
+#     routing.plan_route as in dispatch_truck; "fleet" splits them across the idle
+#     trucks with routing.plan_fleet_routes as in dispatch_fleet;
+#   - a truck empties each bin when it reaches it and is idle again once back at the
+#     depot, which is complete_route.
+# History only supplies how fast bins fill: the rises between consecutive readings are
+# added to the simulated level and the drops (real collections) are ignored, so each
+# policy empties bins on its own schedule. A collected bin is recorded as empty at the
+# moment of pickup. Time advances in `step_minutes` steps (overflow is measured at that
+# resolution) and a collection cycle, i.e. one /api/collect call, runs every
+# `cycle_minutes` of the policy.
+DEPOT = (-37.80, 144.96)
+FLEET = [(40, 60.0)] * 3  # (capacity_bins, max_route_km) of the seeded trucks
+DEFAULT_POLICIES = {
+    "threshold-80": {"threshold": 80},
+    "threshold-60": {"threshold": 60},
+    "forecast-80-12h": {"threshold": 80, "horizon_hours": 12},
+    "fleet-80": {"threshold": 80, "mode": "fleet"},
+    "fleet-80-nn": {"threshold": 80, "mode": "fleet", "route_time_limit": 0},
+    "fleet-80-hourly": {"threshold": 80, "mode": "fleet", "cycle_minutes": 60},
+}
+
+# -----------------------------------------------------------
+# INPUT
+# -----------------------------------------------------------
+def load_csv(path):
+    """Readings from a CSV in the smart-bins layout (serial, address, latlong, time, ...)."""
+    return pd.read_csv(path)
+
+def load_history(bin_readings_collection, start=None, end=None):
+    """Readings from MongoDB (either storage format) joined with the bin_state locations."""
+    import reading_buckets
+    import trial_core as core
+    if reading_buckets.ENABLED:
+        rows = list(reading_buckets.find(bin_readings_collection, start=start, end=end))
+    else:
+        query = {}
+        if start or end:
+            query["time"] = {k: v for k, v in (("$gte", start), ("$lt", end)) if v}
+        rows = list(bin_readings_collection.find(query, {"_id": 0, "serial": 1, "time": 1,
+                                                         "status_current_fill_level": 1}))
+    state = core.get_bin_state_collection(bin_readings_collection).find({}, {"lat": 1, "lon": 1, "address": 1})
+    bins = pd.DataFrame(list(state)).rename(columns={"_id": "serial"})
+    return pd.DataFrame(rows).merge(bins, on="serial", how="inner")
+
+def synthetic_readings(n_bins, n_readings, days=14, seed=0):
+    """A generated stream (synthetic.py) in the CSV layout."""
+    bins = synthetic.generate_bins(n_bins, seed=seed)
+    return synthetic.generate_readings(bins, n_readings, days=days, seed=seed)
+
+def prepare(df):
+    """
+    Split readings into bins (serial, lat, lon) and fill events ordered by time:
+    (minutes since the first reading, bin index, fill increase). A bin's first reading
+    counts as an increase from empty.
+    """
+    df = df.dropna(subset=["serial", "time", "status_current_fill_level"]).copy()
+    if "latlong" in df and "lat" not in df:
+        df[["lat", "lon"]] = df["latlong"].str.split(", ", expand=True).astype(float)
+    df = df.dropna(subset=["lat", "lon"])
+    df["time"] = pd.to_datetime(df["time"], utc=True).dt.tz_localize(None)
+    df = df.sort_values(["serial", "time"], kind="stable")
+    fill = df["status_current_fill_level"].astype(float).clip(0, 100)
+    increase = fill.groupby(df["serial"]).diff().clip(lower=0).fillna(fill)
+
+    bins = df.groupby("serial", sort=True)[["lat", "lon"]].last().reset_index()
+    code = pd.Categorical(df["serial"], categories=bins["serial"]).codes
+    start = df["time"].min()
+    minutes = ((df["time"] - start).dt.total_seconds() / 60).to_numpy()
+    order = np.argsort(minutes, kind="stable")
+    events = (minutes[order], code[order].astype(np.int64), increase.to_numpy()[order])
+    return bins, events, start.to_pydatetime()
+
+# -----------------------------------------------------------
+# ENGINE
+# -----------------------------------------------------------
+def simulate(bins, events, start, policy, fleet=FLEET, depot=DEPOT, step_minutes=15, speed_kmh=30.0,
+             service_minutes=2.0, overflow_at=100.0, full_at=synthetic.FULL_AT):
+    """
+    Run one policy over prepared readings. policy keys: threshold (80), horizon_hours
+    (None), mode ("single" | "fleet"), cycle_minutes (240), route_time_limit (seconds
+    per plan, 0.05). Returns the policy's metrics.
+    """
+    threshold = policy.get("threshold", 80)
+    horizon = policy.get("horizon_hours")
+    mode = policy.get("mode", "single")
+    cycle_steps = max(1, int(round(policy.get("cycle_minutes", 240) / step_minutes)))
+    time_limit = policy.get("route_time_limit", 0.05)
+    ev_minutes, ev_bin, ev_increase = events
+    serials = bins["serial"].to_numpy()
+    lats, lons = bins["lat"].to_numpy(dtype=np.float64), bins["lon"].to_numpy(dtype=np.float64)
+    n = len(bins)
+
+    level = np.zeros(n)
+    reported = np.zeros(n, dtype=bool)
+    claimed = np.zeros(n, dtype=bool)
+    overflow_since = np.full(n, np.nan)
+    truck_free_at = np.zeros(len(fleet))
+    visits = []  # heap of (minute, bin)
+    forecaster = FillForecaster() if horizon else None
+    totals = {"routes": 0, "bins_collected": 0, "distance_km": 0.0, "truck_busy_minutes": 0.0,
+              "overflow_minutes": 0.0, "pickup_fill_sum": 0.0}
+    overflowed = set()
+
+    def empty(b, at):
+        totals["bins_collected"] += 1
+        totals["pickup_fill_sum"] += float(level[b])
+        if overflow_since[b] == overflow_since[b]:
+            totals["overflow_minutes"] += max(at - float(overflow_since[b]), 0.0)
+            overflow_since[b] = np.nan
+        level[b] = 0.0
+        claimed[b] = False
+        if forecaster is not None:
+            forecaster.observe([{"serial": serials[b], "time": start + timedelta(minutes=at),
+                                 "status_current_fill_level": 0.0}])
+
+    def send(truck, stops, now):
+        path = [(depot[0], depot[1])] + [(lats[b], lons[b]) for b in stops]
+        legs = geo.path_legs([p[0] for p in path], [p[1] for p in path])
+        arrive = now + np.cumsum(legs) / speed_kmh * 60 + service_minutes * np.arange(1, len(stops) + 1)
+        back = float(geo.haversine_km(lats[stops[-1]], lons[stops[-1]], depot[0], depot[1]))
+        done = arrive[-1] + back / speed_kmh * 60
+        for b, at in zip(stops, arrive):
+            heapq.heappush(visits, (float(at), int(b)))
+        claimed[stops] = True
+        truck_free_at[truck] = done
+        totals["routes"] += 1
+        totals["distance_km"] += float(legs.sum()) + back
+        totals["truck_busy_minutes"] += float(done - now)
+
+    end = float(ev_minutes[-1]) if len(ev_minutes) else 0.0
+    step_ends = np.arange(step_minutes, end + step_minutes, step_minutes)
+    bounds = np.searchsorted(ev_minutes, step_ends, side="right")
+    lo = 0
+    for step, (now, hi) in enumerate(zip(step_ends, bounds), 1):
+        while visits and visits[0][0] <= now:
+            at, b = heapq.heappop(visits)
+            empty(b, at)
+
+        if hi > lo:
+            touched = ev_bin[lo:hi]
+            level += np.bincount(touched, weights=ev_increase[lo:hi], minlength=n)
+            np.minimum(level, 100.0, out=level)
+            reported[touched] = True
+            if forecaster is not None:
+                at = start + timedelta(minutes=float(now))
+                forecaster.observe([{"serial": serials[b], "time": at, "status_current_fill_level": level[b]}
+                                    for b in np.unique(touched)])
+            lo = hi
+        crossed = (level >= overflow_at) & (overflow_since != overflow_since)
+        overflow_since[crossed] = now
+        overflowed.update(np.flatnonzero(crossed).tolist())
+
+        if step % cycle_steps:
+            continue
+        idle = np.flatnonzero(truck_free_at <= now)
+        if not len(idle):
+            continue
+        due = reported & ~claimed & ((level >= threshold) | (level >= full_at))
+        if forecaster is not None:
+            upcoming = forecaster.bins_crossing_within(horizon, threshold, now=start + timedelta(minutes=float(now)))
+            due |= reported & ~claimed & np.isin(serials, upcoming)
+        candidates = np.flatnonzero(due)
+        if not len(candidates):
+            continue
+        points = list(zip(lats[candidates], lons[candidates]))
+        if mode == "fleet":
+            planned, _ = routing.plan_fleet_routes(points, [fleet[t] for t in idle], depot, time_limit)
+            for t, order, _ in planned:
+                send(idle[t], candidates[order], now)
+        else:
+            order, _ = routing.plan_route(points, depot, time_limit)
+            send(idle[0], candidates[order], now)
+
+    for b in np.flatnonzero(overflow_since == overflow_since):
+        totals["overflow_minutes"] += end - float(overflow_since[b])
+    days = end / 1440 or 1.0
+    collected = totals["bins_collected"]
+    return {
+        "routes": totals["routes"],
+        "bins_collected": collected,
+        "distance_km": round(totals["distance_km"], 2),
+        "km_per_bin": round(totals["distance_km"] / collected, 3) if collected else None,
+        "avg_fill_at_pickup": round(totals["pickup_fill_sum"] / collected, 2) if collected else None,
+        "overflow_minutes": round(totals["overflow_minutes"], 1),
+        "overflow_minutes_per_bin_day": round(totals["overflow_minutes"] / (max(n, 1) * days), 3),
+        "bins_overflowed": len(overflowed),
+        "truck_utilization": round(min(totals["truck_busy_minutes"], len(fleet) * end) / (len(fleet) * end), 4)
+        if end else 0.0,
+    }
+
+def compare(df, policies=None, **options):
+    """Run every policy over the same readings. Returns {policy: metrics} plus timings."""
+    policies = policies or DEFAULT_POLICIES
+    bins, events, start = prepare(df)
+    span_minutes = float(events[0][-1]) if len(events[0]) else 0.0
+    results = {}
+    for name, policy in policies.items():
+        started = time.perf_counter()
+        results[name] = simulate(bins, events, start, policy, **options)
+        seconds = time.perf_counter() - started
+        results[name]["seconds"] = round(seconds, 3)
+        results[name]["speedup"] = round(span_minutes * 60 / seconds) if seconds else None
+        print(f"🧮 {name}: {results[name]['distance_km']} km, {results[name]['overflow_minutes']} overflow minutes, "
+              f"utilization {results[name]['truck_utilization']:.1%} ({seconds:.1f}s)")
+    return {"bins": len(bins), "readings": len(events[0]), "start": start,
+            "days": round(span_minutes / 1440, 2), "policies": results}
+
+def print_report(report):
+    print(f"\n📊 {report['bins']} bins, {report['readings']} readings, {report['days']} days")
+    print(f"   {'policy':20s} {'routes':>7s} {'km':>10s} {'km/bin':>7s} {'pickup%':>8s} "
+          f"{'overflow min':>13s} {'overflowed':>10s} {'util':>6s}")
+    for name, r in report["policies"].items():
+        print(f"   {name:20s} {r['routes']:7d} {r['distance_km']:10.1f} {r['km_per_bin'] or 0:7.2f} "
+              f"{r['avg_fill_at_pickup'] or 0:8.1f} {r['overflow_minutes']:13.0f} {r['bins_overflowed']:10d} "
+              f"{r['truck_utilization']:6.1%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay readings through collection policies, in memory.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--csv", default="smart-bins-argyle-square.csv", help="readings CSV to replay")
+    source.add_argument("--synthetic", action="store_true", help="replay a generated stream instead")
+    source.add_argument("--mongo", action="store_true", help="read history from the configured MongoDB")
+    parser.add_argument("--bins", type=int, default=500, help="synthetic bins")
+    parser.add_argument("--readings", type=int, default=500000, help="synthetic readings")
+    parser.add_argument("--days", type=int, default=365, help="synthetic days")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--policies", type=json.loads, help='JSON {"name": {"threshold": 70, ...}}')
+    parser.add_argument("--trucks", type=int, default=len(FLEET))
+    parser.add_argument("--step-minutes", type=float, default=15)
+    parser.add_argument("--speed-kmh", type=float, default=30.0)
+    parser.add_argument("--service-minutes", type=float, default=2.0)
+    parser.add_argument("--out", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    started = datetime.now()
+    if args.synthetic:
+        readings = synthetic_readings(args.bins, args.readings, args.days, args.seed)
+    elif args.mongo:
+        import trial_core as core
+        mongo_client, _, bin_readings_collection = core.get_mongo_connection()
+        readings = load_history(bin_readings_collection)
+        mongo_client.close()
+    else:
+        readings = load_csv(args.csv)
+    print(f"📥 {len(readings)} readings loaded in {(datetime.now() - started).total_seconds():.1f}s.")
+    report = compare(readings, args.policies, fleet=[FLEET[0]] * args.trucks, step_minutes=args.step_minutes,
+                     speed_kmh=args.speed_kmh, service_minutes=args.service_minutes)
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"💾 Results written to {args.out}")
@@ -0,0 +1,131 @@
+import argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# -----------------------------------------------------------
+# SYNTHETIC CITY-SCALE DATA
+# -----------------------------------------------------------
+# Generates bins and sensor readings in the same shape as smart-bins-argyle-square.csv
+# (serial, address, latlong, time, status_current_fill_level, bin_status), so the
+# output goes straight into load_data_from_csv or POST /api/readings.
+#
+# Space: bins sit along streets inside districts. District centres are scattered
+# around the city centre and district sizes are Zipf-like, so a few dense precincts
+# hold most bins, as in a real CBD.
+# Time: every bin reports on a regular interval with jitter. Fill rises at a per-bin
+# rate (log-normal) scaled by a day/night cycle. Bins are emptied when they pass
+# `empty_at` or on their district's collection day. Readings have sensor noise and
+# a small share go missing.
+CITY_CENTRE = (-37.8136, 144.9631)
+STREETS = ["Argyle", "Lygon", "Swanston", "Elizabeth", "Queen", "William", "King", "Spencer",
+           "Flinders", "Collins", "Bourke", "Lonsdale", "La Trobe", "Victoria", "Grattan", "Rathdowne",
+           "Nicholson", "Brunswick", "Smith", "Johnston", "Gertrude", "Faraday", "Pelham", "Queensberry"]
+SUBURBS = ["Carlton", "Fitzroy", "Docklands", "Southbank", "Parkville", "North Melbourne", "East Melbourne",
+           "Collingwood", "Richmond", "South Yarra", "Kensington", "Brunswick", "Abbotsford", "Port Melbourne"]
+FULL_AT = 90
+
+def generate_bins(n_bins, n_districts=None, spread_km=6.0, seed=0):
+    """DataFrame of n_bins bins: serial, address, lat, lon, district, fill_rate (points/hour)."""
+    rng = np.random.default_rng(seed)
+    n_districts = n_districts or max(1, int(np.sqrt(n_bins) / 2))
+    weights = 1.0 / np.arange(1, n_districts + 1)
+    sizes = rng.multinomial(n_bins, weights / weights.sum())
+
+    km_lat = 1 / 111.0
+    km_lon = 1 / (111.0 * np.cos(np.radians(CITY_CENTRE[0])))
+    rows = []
+    for d, size in enumerate(sizes):
+        centre_lat = CITY_CENTRE[0] + rng.normal(0, spread_km / 2) * km_lat
+        centre_lon = CITY_CENTRE[1] + rng.normal(0, spread_km / 2) * km_lon
+        n_streets = max(1, size // 25)
+        for s in range(n_streets):
+            street = STREETS[(d * 7 + s) % len(STREETS)]
+            angle = rng.uniform(0, np.pi)
+            offset = rng.normal(0, 0.4, 2)
+            count = size // n_streets + (1 if s < size % n_streets else 0)
+            # bins roughly every 60 m along the street, numbered by position
+            along = np.sort(rng.uniform(-1, 1, count)) * count * 0.03
+            for k, a in enumerate(along):
+                rows.append((
+                    f"{centre_lat + (offset[0] + a * np.sin(angle)) * km_lat:.6f}",
+                    f"{centre_lon + (offset[1] + a * np.cos(angle)) * km_lon:.6f}",
+                    f"{2 * k + 1} {street} St, {SUBURBS[d % len(SUBURBS)]}",
+                    d,
+                ))
+    bins = pd.DataFrame(rows, columns=["lat", "lon", "address", "district"])
+    bins[["lat", "lon"]] = bins[["lat", "lon"]].astype(float)
+    bins.insert(0, "serial", [f"SYN{i:06d}" for i in range(len(bins))])
+    bins["fill_rate"] = rng.lognormal(mean=np.log(0.9), sigma=0.6, size=len(bins))
+    return bins
+
+def generate_readings(bins, n_readings, start=None, days=14, empty_at=95, noise=2.0,
+                      missing=0.02, seed=0):
+    """
+    About n_readings readings spread evenly over the bins and `days` days from `start`
+    (naive UTC), in the CSV's column layout, ordered by time.
+    """
+    rng = np.random.default_rng(seed + 1)
+    start = start or datetime(2024, 1, 1)
+    n = len(bins)
+    per_bin = max(2, int(np.ceil(n_readings / max(n, 1))))
+    step_h = days * 24 / per_bin
+
+    # All bins advance together, one reporting step at a time
+    hours = np.arange(per_bin) * step_h
+    jitter = rng.uniform(0, step_h, n)
+    fill = rng.uniform(0, 60, n)
+    rate = bins["fill_rate"].to_numpy()
+    collection_day = bins["district"].to_numpy() % 7
+    levels = np.empty((per_bin, n))
+    for k, h in enumerate(hours):
+        t_h = h + jitter
+        hour_of_day = t_h % 24
+        diurnal = 0.3 + 1.4 * np.exp(-((hour_of_day - 14) ** 2) / 18)  # busiest mid-afternoon
+        if k:
+            fill = fill + rate * diurnal * step_h
+            emptied = (fill >= empty_at) | (((t_h // 24) % 7 == collection_day) & (hour_of_day < step_h) & (fill > 40))
+            fill = np.where(emptied, rng.uniform(0, 5, n), np.minimum(fill, 100))
+        levels[k] = fill
+
+    observed = np.clip(np.rint(levels + rng.normal(0, noise, levels.shape)), 0, 100).astype(int)
+    times = pd.Timestamp(start) + pd.to_timedelta((hours[:, None] + jitter[None, :]).ravel(), unit="h")
+    keep = rng.random(levels.shape) >= missing
+
+    df = pd.DataFrame({
+        "serial": np.tile(bins["serial"].to_numpy(), per_bin)[keep.ravel()],
+        "address": np.tile(bins["address"].to_numpy(), per_bin)[keep.ravel()],
+        "latlong": np.tile((bins["lat"].round(6).astype(str) + ", " + bins["lon"].round(6).astype(str)).to_numpy(),
+                           per_bin)[keep.ravel()],
+        "time": times[keep.ravel()],
+        "status_current_fill_level": observed.ravel()[keep.ravel()],
+    })
+    df["bin_status"] = np.where(df["status_current_fill_level"] >= FULL_AT, "Full", "Not Full")
+    df = df.sort_values("time", kind="stable").head(n_readings).reset_index(drop=True)
+    df["time"] = df["time"].dt.strftime("%Y-%m-%dT%H:%M:%S")
+    return df
+
+def generate_csv(path, n_bins, n_readings, days=14, seed=0):
+    """Write a synthetic readings CSV; returns (path, bins DataFrame)."""
+    bins = generate_bins(n_bins, seed=seed)
+    generate_readings(bins, n_readings, days=days, seed=seed).to_csv(path, index=False)
+    return path, bins
+
+def as_api_readings(df):
+    """Rows of a generated readings DataFrame as POST /api/readings objects."""
+    lat_lon = df["latlong"].str.split(", ", expand=True).astype(float)
+    out = df.drop(columns=["latlong"]).assign(lat=lat_lon[0], lon=lat_lon[1])
+    return out.to_dict("records")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic smart-bin readings CSV.")
+    parser.add_argument("--bins", type=int, default=2000)
+    parser.add_argument("--readings", type=int, default=200000)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="synthetic-bins.csv")
+    args = parser.parse_args()
+    started = datetime.now()
+    path, bins = generate_csv(args.out, args.bins, args.readings, args.days, args.seed)
+    print(f"🧪 Wrote {args.readings} readings for {len(bins)} bins to {path} "
+          f"in {(datetime.now() - started).total_seconds():.1f}s.")
@@ -0,0 +1,75 @@
+import itertools
+import os
+import psycopg2
+import pytest
+import docstore
+import embedded
+import migrations
+import trial_core as core
+
+# -----------------------------------------------------------
+# BACKEND FIXTURES
+# -----------------------------------------------------------
+# Tests that take `sql` or `collection` run once per backend: the embedded SQLite
+# stores, and PostgreSQL / mongomock standing in for the server deployment. The
+# PostgreSQL run uses the SWMS_PG_* settings and is skipped when no server answers;
+# each test gets its own schema, dropped afterwards.
+_schemas = itertools.count()
+
+@pytest.fixture(autouse=True)
+def _fresh_caches():
+    for cache in (core.summary_cache, core.reference_cache, core.truck_name_cache,
+                  core.bin_metadata_cache, core.truck_cache):
+        cache.invalidate()
+    yield
+
+@pytest.fixture(params=["embedded", "postgres"])
+def sql_connect(request, tmp_path):
+    """Factory for (conn, cursor) pairs on one migrated database of the parametrized backend."""
+    opened = []
+    if request.param == "embedded":
+        path = str(tmp_path / "swms.db")
+
+        def connect():
+            conn = embedded.connect(path)
+            opened.append(conn)
+            return conn, conn.cursor()
+    else:
+        schema = f"swms_test_{os.getpid()}_{next(_schemas)}"
+
+        def connect():
+            try:
+                conn = psycopg2.connect(**core.PG_CONFIG, connect_timeout=3)
+            except psycopg2.OperationalError as e:
+                pytest.skip(f"PostgreSQL unavailable: {e}")
+            opened.append(conn)
+            cursor = conn.cursor()
+            cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}; SET search_path TO {schema};")
+            conn.commit()
+            return conn, cursor
+
+    conn, cursor = connect()
+    migrations.migrate(cursor, conn)
+    yield connect
+    if request.param == "postgres":
+        conn.rollback()
+        cursor.execute(f"DROP SCHEMA {schema} CASCADE;")
+        conn.commit()
+    for c in opened:
+        c.close()
+
+@pytest.fixture
+def sql(sql_connect):
+    """(conn, cursor) on a freshly migrated database."""
+    return sql_connect()
+
+@pytest.fixture(params=["docstore", "mongomock"])
+def collection(request, tmp_path):
+    """An empty bin_readings collection in the embedded docstore or in mongomock."""
+    if request.param == "docstore":
+        client = docstore.Client(str(tmp_path / "swms.db"))
+    else:
+        mongomock = pytest.importorskip("mongomock")
+        client = mongomock.MongoClient()
+    yield client["smart_waste_db"]["bin_readings"]
+    client.close()
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+import pytest
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+import rollups
+import trial_core as core
+
+T0 = datetime(2026, 1, 1, 8)
+
+def readings(n, serials=("A", "B", "C")):
+    return [{"serial": serials[i % len(serials)], "time": T0 + timedelta(minutes=15 * i),
+             "status_current_fill_level": float(i % 101), "bin_status": "Full" if i % 101 >= 90 else "Normal"}
+            for i in range(n)]
+
+def test_query_operators(collection):
+    collection.insert_many(readings(30))
+    ids = lambda q: sorted(d["status_current_fill_level"] for d in collection.find(q))
+    assert ids({"status_current_fill_level": {"$in": [1, 2.0, 99]}}) == [1, 2]
+    assert len(ids({"serial": {"$nin": ["A", "B"]}})) == 10
+    assert ids({"status_current_fill_level": {"$gte": 27, "$lt": 29}}) == [27, 28]
+    assert ids({"$or": [{"status_current_fill_level": 0}, {"serial": "C", "status_current_fill_level": {"$gt": 25}}]}) == [0, 26, 29]
+    assert collection.count_documents({"address": {"$exists": False}}) == 30
+    assert collection.count_documents({"time": {"$lt": T0 + timedelta(hours=1)}}) == 4
+
+def test_in_on_large_lists_of_ids(collection):
+    collection.insert_many(readings(3000))
+    ids = [d["_id"] for d in collection.find({}, {"_id": 1})]
+    assert collection.count_documents({"_id": {"$in": ids[::2]}}) == 1500
+    assert collection.delete_many({"_id": {"$in": ids[:2000]}}).deleted_count == 2000
+    assert collection.count_documents({}) == 1000
+
+def test_conditions_on_array_fields_match_elements(collection):
+    collection.insert_many([{"_id": 1, "t": [5, 10]}, {"_id": 2, "t": [7]}, {"_id": 3, "t": []}])
+    assert [d["_id"] for d in collection.find({"t": 5})] == [1]
+    assert [d["_id"] for d in collection.find({"t": {"$in": [7, 10]}}).sort("_id", 1)] == [1, 2]
+    assert [d["_id"] for d in collection.find({"t": {"$ne": 5}}).sort("_id", 1)] == [2, 3]
+    assert [d["_id"] for d in collection.find({"t": {"$nin": [7, 10]}})] == [3]
+
+def test_sort_skip_limit_and_projection(collection):
+    collection.insert_many(readings(12))
+    docs = list(collection.find({"serial": "A"}, {"status_current_fill_level": 1, "_id": 0})
+                .sort("status_current_fill_level", -1).skip(1).limit(2))
+    assert docs == [{"status_current_fill_level": 6.0}, {"status_current_fill_level": 3.0}]
+
+def test_versioned_upsert_collides_on_id(collection):
+    collection.insert_one({"_id": "A", "v": 1})
+    with pytest.raises(DuplicateKeyError):
+        collection.update_one({"_id": "A", "v": 0}, {"$set": {"v": 1}}, upsert=True)
+    with pytest.raises(BulkWriteError) as e:
+        collection.bulk_write([UpdateOne({"_id": "A", "v": 0}, {"$set": {"v": 1}}, upsert=True),
+                               UpdateOne({"_id": "B", "v": 0}, {"$set": {"v": 1}}, upsert=True),
+                               UpdateOne({"_id": "A", "v": 1}, {"$set": {"v": 2}}, upsert=True)], ordered=False)
+    assert [(err["index"], err["code"]) for err in e.value.details["writeErrors"]] == [(0, 11000)]
+    assert {d["_id"]: d["v"] for d in collection.find()} == {"A": 2, "B": 1}
+
+def test_unique_index_removes_duplicates_once(collection):
+    rows = readings(6)
+    collection.insert_many([dict(r) for r in rows] + [dict(r) for r in rows[:2]])
+    assert core.ensure_reading_unique_index(collection)
+    assert collection.count_documents({}) == 6
+    assert collection.index_information()["serial_1_time_-1"]["unique"]
+    with pytest.raises(BulkWriteError) as e:
+        collection.insert_many([dict(rows[0]), dict(rows[1], time=T0 - timedelta(days=1))], ordered=False)
+    assert core._is_duplicate_only(e.value)
+    assert [err["index"] for err in e.value.details["writeErrors"]] == [0]
+
+def test_insert_readings_skips_stored_ones(collection):
+    core.ensure_reading_unique_index(collection)
+    rows = readings(9)
+    assert core.insert_readings(collection, [dict(r) for r in rows[:6]], emit_alerts=False) == 6
+    assert core.insert_readings(collection, [dict(r) for r in rows], emit_alerts=False) == 3
+    assert collection.count_documents({}) == 9
+
+def test_bin_state_keeps_the_newest_reading(collection):
+    rows = readings(6)
+    assert core.update_bin_state(collection, rows[3:]) == 3
+    assert core.update_bin_state(collection, rows[:3]) == 0  # older than what is stored
+    state = {d["_id"]: d["time"] for d in core.get_bin_state_collection(collection).find()}
+    assert state == {r["serial"]: r["time"] for r in rows[3:]}
+
+def test_rollup_aggregation(collection):
+    rollup_collection = core.get_rollup_collection(collection)
+    rollups.add_observations(rollup_collection, "fill", [(r["serial"], r["time"], r["status_current_fill_level"])
+                                                         for r in readings(200)])
+    days = rollups.query(rollup_collection, "fill", "day")
+    assert [d["count"] for d in days] == [64, 96, 40]
+    assert days[0]["min"] == 0 and days[0]["max"] == 63
+    hours = rollups.query(rollup_collection, "fill", "hour", key="A", start=T0, end=T0 + timedelta(hours=2))
+    assert [(h["count"], h["sum"]) for h in hours] == [(2, 3.0), (1, 6.0)]
+
+def test_geo_filters(collection):
+    if type(collection).__module__.startswith("mongomock"):
+        pytest.skip("mongomock does not evaluate $geoWithin")
+    core.update_bin_state(collection, [
+        {"serial": "near", "time": T0, "lat": -37.800, "lon": 144.960},
+        {"serial": "far", "time": T0, "lat": -37.900, "lon": 145.100},
+    ])
+    state = core.get_bin_state_collection(collection)
+    assert [d["_id"] for d in state.find(core.geo_filter(near=(-37.801, 144.961, 1)))] == ["near"]
+    assert [d["_id"] for d in state.find(core.geo_filter(bbox=(145.0, -38.0, 145.2, -37.85)))] == ["far"]
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+import pandas as pd
+import embedded
+import migrations
+import rollups
+import trial_core as core
+
+T0 = datetime(2026, 1, 1, 8)
+
+def add_bins(sql, n=4):
+    conn, cursor = sql
+    core.commit_bins(cursor, conn, pd.DataFrame([
+        {"serial": f"S{i}", "address": f"{i} Argyle Sq", "lat": -37.80 + i / 1000, "lon": 144.96} for i in range(n)]))
+
+def test_translate_rewrites_postgres_syntax():
+    sql, kinds, is_write, temp = embedded.translate(
+        "SELECT serial, EXTRACT(EPOCH FROM b - a) FROM Bins WHERE serial = ANY(%s) AND lat > %s::float FOR UPDATE SKIP LOCKED;")
+    assert "json_each(?)" in sql and "::" not in sql and "FOR UPDATE" not in sql and "julianday(b)" in sql
+    assert kinds == (True, False) or list(kinds) == [True, False]
+    assert is_write  # FOR UPDATE takes the write lock up front
+    sql, _, is_write, _ = embedded.translate("SELECT LEAST(a, b), GREATEST(a, b), NOW() FROM t;")
+    assert "MIN(a, b)" in sql and "MAX(a, b)" in sql and "CURRENT_TIMESTAMP" in sql and not is_write
+
+def test_migrations_apply_once_in_order(sql):
+    conn, cursor = sql
+    versions = [v for v, _, _ in migrations.MIGRATIONS]
+    assert versions == sorted(versions)
+    assert migrations.applied_versions(cursor) == versions
+    assert migrations.migrate(cursor, conn) == []
+
+def test_bin_upserts_and_metadata(sql):
+    conn, cursor = sql
+    add_bins(sql)
+    core.commit_bins(cursor, conn, pd.DataFrame([{"serial": "S1", "address": "moved", "lat": -37.9, "lon": 145.0}]))
+    meta = core.get_bin_metadata(cursor, ["S0", "S1", "missing"])
+    assert meta["S0"]["address"] == "0 Argyle Sq"
+    assert meta["S1"] == {"address": "moved", "lat": -37.9, "lon": 145.0}
+    assert "missing" not in meta
+
+def test_execute_values_returning(sql):
+    conn, cursor = sql
+    rows = embedded.execute_values(cursor, """
+        INSERT INTO MonitoringAlerts (type, message, severity, serial)
+        VALUES %s
+        RETURNING id, timestamp
+    """, [("Overfilled Bin", "m1", "High", "S0"), ("Fill Spike", "m2", "Medium", "S1")], fetch=True)
+    conn.commit()
+    assert len(rows) == 2 and rows[0][0] < rows[1][0] and isinstance(rows[0][1], datetime)
+
+def test_route_sql_rollups(sql):
+    conn, cursor = sql
+    rollups.add_observations_sql(cursor, "collected_fill", [("all", T0, 80), ("all", T0, 95)])
+    rollups.add_observations_sql(cursor, "collected_fill", [("all", T0 + timedelta(hours=1), 70)])
+    conn.commit()
+    (day,) = rollups.query_sql(cursor, "collected_fill", "day")
+    assert (day["count"], day["sum"], day["min"], day["max"]) == (3, 245.0, 70.0, 95.0)
+    assert [h["count"] for h in rollups.query_sql(cursor, "collected_fill", "hour", "all")] == [2, 1]
+
+def test_claims_and_route_completion(sql):
+    conn, cursor = sql
+    add_bins(sql)
+    bins = [{"serial": f"S{i}", "lat": -37.80 + i / 1000, "lon": 144.96, "status_current_fill_level": 90}
+            for i in range(3)]
+    truck, route = core.dispatch_truck(cursor, conn, bins, time_limit=0.1)
+    assert truck is not None and sorted(b["serial"] for b in route) == ["S0", "S1", "S2"]
+    assert core.claimed_serials(cursor, ["S0", "S1", "S2", "S3"]) == {"S0", "S1", "S2"}
+    assert core.claim_bins(cursor, bins + [{"serial": "S3"}]) == [{"serial": "S3"}]
+    conn.rollback()
+    core.complete_route(cursor, conn, truck[0])
+    assert core.claimed_serials(cursor, ["S0", "S1", "S2", "S3"]) == set()
+
+def test_advisory_locks_belong_to_a_session(sql_connect):
+    (_, a), (_, b) = sql_connect(), sql_connect()
+
+    def call(cursor, fn):
+        cursor.execute(f"SELECT {fn}(hashtext(%s));", ("swms_test_lock",))
+        return bool(cursor.fetchone()[0])
+
+    assert call(a, "pg_try_advisory_lock")
+    assert call(a, "pg_try_advisory_lock")  # re-entrant for the holder
+    assert not call(b, "pg_try_advisory_lock")
+    assert not call(b, "pg_advisory_unlock")  # not the holder: no effect
+    assert call(a, "pg_advisory_unlock")
+    assert not call(b, "pg_try_advisory_lock")  # still held once
+    assert call(a, "pg_advisory_unlock")
+    assert call(b, "pg_try_advisory_lock")
+    assert call(b, "pg_advisory_unlock")
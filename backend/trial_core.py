@@ -1,44 +1,217 @@
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 import pandas as pd
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 from math import radians, sin, cos, sqrt, atan2
-from datetime import datetime
-import random, json
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+import random, json, threading, time, io, hashlib, os, base64
+import routing
+import geo
+import rollups
+import retention
+import reading_buckets
+import migrations
+import embedded
+import docstore
+from embedded import execute_values
+from cache import TTLCache, etag
+import events
+import metrics
+from alert_engine import AlertEngine, STATE_COLLECTION as ALERT_STATE_COLLECTION
+from forecast import FillForecaster
 
 # -----------------------------------------------------------
 # DATABASE CONNECTIONS
 # -----------------------------------------------------------
+# SWMS_STORAGE picks the backend behind every function below:
+#   server    PostgreSQL + MongoDB (production; credentials from the environment)
+#   embedded  one SQLite file (SWMS_SQLITE_PATH) holding both the SQL tables and the
+#             document collections, for single-process depots and tests; see
+#             embedded.py and docstore.py
+STORAGE = os.environ.get("SWMS_STORAGE", "server")
+if STORAGE not in ("server", "embedded"):
+    raise ValueError(f"SWMS_STORAGE must be 'server' or 'embedded', not {STORAGE!r}")
+# The default deliberately avoids the old prototype's smart_waste.db, whose schema is incompatible
+SQLITE_PATH = os.environ.get("SWMS_SQLITE_PATH",
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "swms-embedded.db"))
+
+PG_CONFIG = {
+    "dbname": os.environ.get("SWMS_PG_DBNAME", "smart_waste"),
+    "user": os.environ.get("SWMS_PG_USER", "postgres"),
+    "host": os.environ.get("SWMS_PG_HOST", "localhost"),
+    "port": os.environ.get("SWMS_PG_PORT", "5432"),
+}
+# Without SWMS_PG_PASSWORD libpq falls back to PGPASSWORD / ~/.pgpass
+if os.environ.get("SWMS_PG_PASSWORD"):
+    PG_CONFIG["password"] = os.environ["SWMS_PG_PASSWORD"]
+MONGO_URI = os.environ.get("SWMS_MONGO_URI", "mongodb://localhost:27017/")
+
+def get_mongo_connection(max_pool_size=100):
+    """Return (mongo_client, mongo_db, bin_readings_collection). MongoClient pools internally and is thread-safe."""
+    if STORAGE == "embedded":
+        mongo_client = docstore.Client(SQLITE_PATH)
+    else:
+        # connect=False: no server contact until the first operation
+        mongo_client = MongoClient(MONGO_URI, maxPoolSize=max_pool_size, connect=False,
+                                   event_listeners=[metrics.MongoCommandTimer()])
+    mongo_db = mongo_client["smart_waste_db"]
+    bin_readings_collection = mongo_db["bin_readings"]
+    return mongo_client, mongo_db, bin_readings_collection
+
 def get_connections():
     try:
-        sql_conn = psycopg2.connect(
-            dbname="smart_waste",
-            user="postgres",
-            password="5484", # Your password
-            host="localhost",
-            port="5432"
-        )
+        if STORAGE == "embedded":
+            sql_conn = embedded.connect(SQLITE_PATH)
+        else:
+            sql_conn = psycopg2.connect(**PG_CONFIG, cursor_factory=metrics.InstrumentedCursor)
         sql_cursor = sql_conn.cursor()
-        mongo_client = MongoClient("mongodb://localhost:27017/")
-        mongo_db = mongo_client["smart_waste_db"]
-        bin_readings_collection = mongo_db["bin_readings"]
-        print("✅ Connected to PostgreSQL & MongoDB")
+        mongo_client, mongo_db, bin_readings_collection = get_mongo_connection()
+        print(f"✅ Opened embedded database {SQLITE_PATH}" if STORAGE == "embedded"
+              else "✅ Connected to PostgreSQL & MongoDB")
         return sql_conn, sql_cursor, mongo_client, mongo_db, bin_readings_collection
     except Exception as e:
         print(f"❌ Database connection error: {e}")
         raise
 
+# -----------------------------------------------------------
+# CONNECTION POOL
+# -----------------------------------------------------------
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became free within the wait timeout."""
+
+class ConnectionPool:
+    """
+    Thread-safe SQL connection pool. Unlike psycopg2's pool, getconn() blocks (up to
+    `timeout` seconds) when all `maxconn` connections are checked out, and records
+    wait-time metrics for every checkout.
+    """
+    def __init__(self, minconn=1, maxconn=10, timeout=10.0, **conn_kwargs):
+        self.minconn, self.maxconn, self.timeout = minconn, maxconn, timeout
+        if STORAGE == "embedded":
+            self._pool = embedded.Pool(minconn, maxconn, SQLITE_PATH)
+        else:
+            # Every pooled cursor is timed (see metrics.py)
+            self._pool = ThreadedConnectionPool(minconn, maxconn, cursor_factory=metrics.InstrumentedCursor,
+                                                **(conn_kwargs or PG_CONFIG))
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._stats = {"checkouts": 0, "timeouts": 0, "in_use": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+    def getconn(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise PoolTimeout(f"No database connection available after {self.timeout}s")
+        waited = time.perf_counter() - start
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+            self._stats["total_wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        return conn
+
+    def putconn(self, conn, close=False):
+        # psycopg2 rolls back any open transaction before the connection is reused
+        try:
+            self._pool.putconn(conn, close=close or conn.closed != 0)
+        finally:
+            with self._lock:
+                self._stats["in_use"] -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Check out (sql_conn, sql_cursor) for the duration of a with-block."""
+        conn = self.getconn()
+        cursor = conn.cursor()
+        try:
+            yield conn, cursor
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            self.putconn(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["min_size"], stats["max_size"] = self.minconn, self.maxconn
+        stats["avg_wait_seconds"] = round(stats["total_wait_seconds"] / stats["checkouts"], 6) if stats["checkouts"] else 0.0
+        return stats
+
+    def closeall(self):
+        self._pool.closeall()
+
+def create_connection_pool(minconn=1, maxconn=10, timeout=10.0):
+    try:
+        pool = ConnectionPool(minconn, maxconn, timeout)
+        backend = f"Embedded SQLite ({SQLITE_PATH})" if STORAGE == "embedded" else "PostgreSQL"
+        print(f"✅ {backend} pool ready (min={minconn}, max={maxconn})")
+        return pool
+    except Exception as e:
+        print(f"❌ Database connection error: {e}")
+        raise
+
+# Dashboard summary cache; writes that change the counts call invalidate_dashboard_summary()
+summary_cache = TTLCache(ttl=float(os.environ.get("SWMS_SUMMARY_TTL", 30)))
+
+def invalidate_dashboard_summary():
+    summary_cache.invalidate("dashboard_summary")
+
+# Reference data (landfills, truck names, bin address/coordinates) changes rarely, so
+# reads go through these caches; the writes that change it invalidate the entries.
+REFERENCE_TTL = float(os.environ.get("SWMS_REFERENCE_TTL", 300))
+reference_cache = TTLCache(ttl=REFERENCE_TTL, max_entries=1000)
+truck_name_cache = TTLCache(ttl=REFERENCE_TTL, max_entries=256)
+bin_metadata_cache = TTLCache(ttl=REFERENCE_TTL, max_entries=int(os.environ.get("SWMS_BIN_CACHE_MAX", 50000)))
+
+# Truck status is live state: the roster is only cached briefly and is dropped on every
+# "trucks" event, which the PostgreSQL bridge delivers to every worker process
+truck_cache = TTLCache(ttl=float(os.environ.get("SWMS_TRUCK_TTL", 10)))
+
+def invalidate_trucks():
+    truck_cache.invalidate()
+
+events.on("trucks", lambda data: invalidate_trucks())
+
+# Streaming alert rules evaluated on every ingested reading; their per-bin state is
+# shared by all workers (see alert_engine.py)
+alert_engine = AlertEngine(
+    fill_threshold=float(os.environ.get("SWMS_ALERT_FILL_THRESHOLD", 80)),
+    silence_minutes=float(os.environ.get("SWMS_ALERT_SILENCE_MINUTES", 120)),
+    spike_per_hour=float(os.environ.get("SWMS_ALERT_SPIKE_PER_HOUR", 40)),
+    debounce_minutes=float(os.environ.get("SWMS_ALERT_DEBOUNCE_MINUTES", 30)),
+)
+
+# Per-bin fill-rate model, updated on every ingested reading
+fill_forecaster = FillForecaster()
+
 # -----------------------------------------------------------
 # DATABASE SETUP
 # -----------------------------------------------------------
 def setup_databases(sql_cursor, sql_conn, bin_readings_collection, drop_existing=False):
     """
-    Create required tables and indexes.
-    By default this will DROP existing tables (useful in dev). Set drop_existing=False to avoid drops.
+    Apply pending schema migrations and create the MongoDB indexes.
+    With drop_existing=True every table is dropped first (useful in dev).
     """
     if drop_existing:
         # WARNING: dropping tables will remove existing data
         sql_cursor.execute("DROP VIEW IF EXISTS DashboardSummary CASCADE;")
+        sql_cursor.execute("DROP TABLE IF EXISTS SchemaMigrations CASCADE;")
+        sql_cursor.execute("DROP TABLE IF EXISTS Routes CASCADE;")
+        sql_cursor.execute("DROP TABLE IF EXISTS RouteBins CASCADE;")
         sql_cursor.execute("DROP TABLE IF EXISTS TruckRoutes CASCADE;")
+        sql_cursor.execute("DROP TABLE IF EXISTS IngestedFiles CASCADE;")
+        sql_cursor.execute("DROP TABLE IF EXISTS Rollups CASCADE;")
         sql_cursor.execute("DROP TABLE IF EXISTS Transactions CASCADE;")
         sql_cursor.execute("DROP TABLE IF EXISTS MonitoringAlerts CASCADE;")
         sql_cursor.execute("DROP TABLE IF EXISTS Landfills CASCADE;")
@@ -47,233 +220,1057 @@ def setup_databases(sql_cursor, sql_conn, bin_readings_collection, drop_existing
         sql_conn.commit()
         print("⚠️ Dropped existing tables/views (drop_existing=False).")
 
-    # Core structured tables
+    # PostgreSQL schema (versioned, applied once per database; see migrations.py)
+    migrations.migrate(sql_cursor, sql_conn)
+    for c in (reference_cache, truck_name_cache, bin_metadata_cache, truck_cache):
+        c.invalidate()
+
+    # MongoDB indexes
+    ensure_reading_unique_index(bin_readings_collection)
+    bin_readings_collection.create_index([("status_current_fill_level", -1)])
+
+    # Latest-state collection (one document per bin, _id = serial)
+    bin_state_collection = get_bin_state_collection(bin_readings_collection)
+    bin_state_collection.create_index([("status_current_fill_level", -1)])
+    bin_state_collection.create_index([("bin_status", 1)])
+    # GeoJSON points for bins that predate the location field, then the spatial index
+    bin_state_collection.update_many(
+        {"location": {"$exists": False}, "lat": {"$gte": -90, "$lte": 90}, "lon": {"$gte": -180, "$lte": 180}},
+        [{"$set": {"location": {"type": "Point", "coordinates": ["$lon", "$lat"]}}}]
+    )
+    bin_state_collection.create_index([("location", "2dsphere")])
+    rollups.ensure_indexes(get_rollup_collection(bin_readings_collection))
+    alert_engine.ensure_indexes(get_alert_state_collection(bin_readings_collection))
+    retention.ensure_indexes(bin_readings_collection)
+    if bin_state_collection.estimated_document_count() == 0 and reading_buckets.has_readings(bin_readings_collection):
+        rebuild_bin_state(bin_readings_collection, sql_cursor)
+    print("✅ PostgreSQL tables, indexes & MongoDB indexes ready.")
+
+def ensure_reading_unique_index(bin_readings_collection, batch_size=5000):
+    """
+    Make (serial, time) unique so re-ingested readings are rejected as duplicates.
+    History stored before the index existed may hold duplicate copies of a reading;
+    they are deleted (keeping one of each) before the index is built, so the
+    duplicate scan runs once and later starts return as soon as they see the index.
+    """
+    keys = [("serial", 1), ("time", -1)]
+    existing = bin_readings_collection.index_information().get("serial_1_time_-1")
+    if existing and existing.get("unique"):
+        return True
+    removed = 0
+    for _ in range(3):  # a duplicate written between the scan and the build fails the build; rescan
+        extra = []
+        for group in bin_readings_collection.aggregate([
+            {"$group": {"_id": {"serial": "$serial", "time": "$time"}, "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+            {"$match": {"n": {"$gt": 1}}},
+        ], allowDiskUse=True):
+            extra.extend(group["ids"][1:])
+        for i in range(0, len(extra), batch_size):
+            removed += bin_readings_collection.delete_many({"_id": {"$in": extra[i:i + batch_size]}}).deleted_count
+        if removed:
+            print(f"♻️ Removed {removed} duplicate (serial, time) readings before building the unique index.")
+        if existing:
+            bin_readings_collection.drop_index("serial_1_time_-1")
+            existing = None
+        try:
+            bin_readings_collection.create_index(keys, unique=True)
+            return True
+        except OperationFailure as e:
+            error = e
+    bin_readings_collection.create_index(keys)
+    print(f"⚠️ Unique (serial, time) index not created: {error}")
+    return False
+
+def _is_duplicate_only(bulk_error):
+    """True if every write error in a BulkWriteError is a duplicate key (code 11000)."""
+    return all(err.get("code") == 11000 for err in bulk_error.details.get("writeErrors", []))
+
+# -----------------------------------------------------------
+# DATA LOADING
+# -----------------------------------------------------------
+def _prepare_readings(df):
+    """Drop unusable rows and split the 'lat, lon' column of a raw CSV chunk into lat/lon."""
+    df = df.dropna(subset=["latlong", "serial"]).copy()
+    df[["lat", "lon"]] = df["latlong"].str.split(", ", expand=True).astype(float)
+    # Stored readings keep only the parsed coordinates, not the raw string
+    df = df.drop(columns=["latlong"])
+    # Store naive UTC, which is what pymongo hands back, so times compare consistently
+    df["time"] = pd.to_datetime(df["time"], utc=True).dt.tz_localize(None)
+    return df
+
+def upsert_bins(sql_cursor, bins_df):
+    """
+    COPY bin metadata into a temporary staging table and merge it into Bins
+    with a single INSERT ... ON CONFLICT statement. Unchanged rows are not rewritten,
+    and a missing (NULL) value keeps what is already stored. Returns the serials
+    inserted or changed; callers drop them from bin_metadata_cache once committed.
+    """
     sql_cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Bins (
-            serial TEXT PRIMARY KEY,
+        CREATE TEMP TABLE IF NOT EXISTS bins_staging (
+            serial TEXT,
             address TEXT,
             lat DOUBLE PRECISION,
-            lon DOUBLE PRECISION,
-            status TEXT DEFAULT 'Active'
-        );
-    """)
-    sql_cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Trucks (
-            id SERIAL PRIMARY KEY,
-            name TEXT NOT NULL UNIQUE,
-            status TEXT DEFAULT 'Idle' -- Status: Idle, On-Route
-        );
-    """)
-    sql_cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Landfills (
-            id SERIAL PRIMARY KEY,
-            name TEXT UNIQUE,
-            capacity_tons FLOAT,
-            used_tons FLOAT DEFAULT 0
-        );
-    """)
-    sql_cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Transactions (
-            id SERIAL PRIMARY KEY,
-            truck_id INT REFERENCES Trucks(id) ON DELETE CASCADE,
-            bins_collected INT,
-            waste_weight FLOAT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
-    sql_cursor.execute("""
-        CREATE TABLE IF NOT EXISTS MonitoringAlerts (
-            id SERIAL PRIMARY KEY,
-            type TEXT,
-            message TEXT,
-            severity TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
+            lon DOUBLE PRECISION
+        ) ON COMMIT DELETE ROWS;
     """)
-
-    # TruckRoutes table (route history)
+    buf = io.StringIO()
+    bins_df[["serial", "address", "lat", "lon"]].to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    sql_cursor.copy_expert("COPY bins_staging (serial, address, lat, lon) FROM STDIN WITH (FORMAT csv)", buf)
     sql_cursor.execute("""
-        CREATE TABLE IF NOT EXISTS TruckRoutes (
-            id SERIAL PRIMARY KEY,
-            truck_id INT REFERENCES Trucks(id) ON DELETE SET NULL,
-            route JSONB,
-            assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            completed_at TIMESTAMP
-        );
+        INSERT INTO Bins (serial, address, lat, lon)
+        SELECT DISTINCT ON (serial) serial, address, lat, lon FROM bins_staging
+        ON CONFLICT (serial) DO UPDATE
+            SET address = COALESCE(EXCLUDED.address, Bins.address),
+                lat = COALESCE(EXCLUDED.lat, Bins.lat),
+                lon = COALESCE(EXCLUDED.lon, Bins.lon)
+            WHERE (Bins.address, Bins.lat, Bins.lon) IS DISTINCT FROM (
+                COALESCE(EXCLUDED.address, Bins.address),
+                COALESCE(EXCLUDED.lat, Bins.lat),
+                COALESCE(EXCLUDED.lon, Bins.lon))
+        RETURNING serial;
     """)
+    return [serial for (serial,) in sql_cursor.fetchall()]
 
+def commit_bins(sql_cursor, sql_conn, df):
+    """Upsert the bins in `df` (last row per serial wins), commit, then drop the changed serials from the cache."""
+    changed = upsert_bins(sql_cursor, df.drop_duplicates(subset=["serial"], keep="last"))
     sql_conn.commit()
+    for serial in changed:
+        bin_metadata_cache.invalidate(serial)
 
-    # Sample trucks (insert if not exists)
-    trucks = [("Truck-01",), ("Truck-02",), ("Truck-03",)]
-    for t in trucks:
-        sql_cursor.execute("""
-            INSERT INTO Trucks (name)
-            VALUES (%s)
-            ON CONFLICT (name) DO NOTHING;
-        """, t)
-
-    # Sample landfills
-    landfills = [
-        ("Central Landfill", 10000, 4000),
-        ("East Waste Facility", 8000, 2500)
-    ]
-    for l in landfills:
-        sql_cursor.execute("""
-            INSERT INTO Landfills (name, capacity_tons, used_tons)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (name) DO NOTHING;
-        """, l)
-
-    # Indexes for performance
-    sql_cursor.execute("CREATE INDEX IF NOT EXISTS idx_bins_status ON Bins(status);")
-    sql_cursor.execute("CREATE INDEX IF NOT EXISTS idx_trucks_status ON Trucks(status);")
-    sql_conn.commit()
+def insert_readings(bin_readings_collection, records, batch_size=5000, emit_alerts=True):
+    """
+    Write readings in bounded, unordered insert_many batches, refresh the bin state and
+    feed the alert engine. Readings rejected by the (serial, time) unique index are
+    skipped; returns the number inserted.
+    With SWMS_READINGS_FORMAT=buckets readings are appended to per-bin day buckets
+    instead (see reading_buckets.py), skipping (serial, time) pairs already stored.
+    """
+    fresh = store_readings(bin_readings_collection, records, batch_size)
+    apply_readings(bin_readings_collection, fresh, emit_alerts)
+    return len(fresh)
 
-    # Dashboard summary view (properly terminated)
-    sql_cursor.execute("""
-        CREATE OR REPLACE VIEW DashboardSummary AS
-        SELECT 
-            (SELECT COUNT(*) FROM Bins) AS total_bins,
-            (SELECT COUNT(*) FROM Bins WHERE status='In-Service') AS active_bins,
-            (SELECT COUNT(*) FROM Bins WHERE status='Active') AS available_bins,
-            (SELECT COUNT(*) FROM Trucks WHERE status='On-Route') AS active_trucks,
-            (SELECT COUNT(*) FROM Trucks WHERE status='Idle') AS idle_trucks;
-    """)
-    sql_conn.commit()
+def store_readings(bin_readings_collection, records, batch_size=5000, progress=None):
+    """
+    Write readings to the reading store and return the ones that were not already there.
+    With a `progress` dict, batches already written by an earlier failed call are skipped.
+    """
+    progress = {} if progress is None else progress
+    fresh = progress.setdefault("stored_fresh", [])
+    for i in range(progress.get("stored", 0), len(records), batch_size):
+        batch = records[i:i + batch_size]
+        if reading_buckets.ENABLED:
+            fresh.extend(reading_buckets.append(bin_readings_collection, batch))
+        else:
+            try:
+                bin_readings_collection.insert_many(batch, ordered=False)
+                fresh.extend(batch)
+            except BulkWriteError as e:
+                if not _is_duplicate_only(e):
+                    raise
+                rejected = {err["index"] for err in e.details.get("writeErrors", [])}
+                fresh.extend(r for k, r in enumerate(batch) if k not in rejected)
+        progress["stored"] = i + len(batch)
+    return fresh
 
-    # MongoDB indexes
-    bin_readings_collection.create_index([("serial", 1), ("time", -1)])
-    bin_readings_collection.create_index([("status_current_fill_level", -1)])
-    print("✅ PostgreSQL tables, indexes & MongoDB indexes ready.")
+def apply_readings(bin_readings_collection, fresh, emit_alerts=True):
+    """Fold newly stored readings into bin state, rollups, alert state and the forecaster."""
+    update_bin_state(bin_readings_collection, fresh)
+    update_reading_rollups(bin_readings_collection, fresh)
+    alert_engine.observe(get_alert_state_collection(bin_readings_collection), fresh, emit=emit_alerts)
+    fill_forecaster.observe(fresh)
+    invalidate_dashboard_summary()
 
-# -----------------------------------------------------------
-# DATA LOADING
-# -----------------------------------------------------------
-def load_data_from_csv(sql_cursor, sql_conn, bin_readings_collection, filepath="smart-bins-argyle-square.csv"):
+READING_FIELDS = ("serial", "time", "status_current_fill_level", "bin_status", "address", "lat", "lon")
+# Sensor clocks drift; anything further ahead than this is rejected rather than stored
+MAX_CLOCK_SKEW = timedelta(minutes=float(os.environ.get("SWMS_MAX_CLOCK_SKEW_MINUTES", 10)))
+
+def normalize_reading(raw):
+    """
+    Validate one reading posted by a sensor and coerce it to the stored shape.
+    Requires serial, time (ISO 8601, not in the future) and status_current_fill_level
+    (0-100); lat/lon, when present, must be valid coordinates. Raises ValueError otherwise.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("reading must be an object")
+    missing = [k for k in ("serial", "time", "status_current_fill_level") if raw.get(k) in (None, "")]
+    if missing:
+        raise ValueError(f"missing field(s): {', '.join(missing)}")
+    reading = {k: raw[k] for k in READING_FIELDS if raw.get(k) is not None}
+    reading["serial"] = str(reading["serial"])
+    ts = pd.Timestamp(reading["time"])
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    reading["time"] = ts.to_pydatetime()
+    if reading["time"] > datetime.utcnow() + MAX_CLOCK_SKEW:
+        raise ValueError(f"time {ts.isoformat()} is in the future")
+    for k, low, high in (("status_current_fill_level", 0, 100), ("lat", -90, 90), ("lon", -180, 180)):
+        if k in reading:
+            reading[k] = float(reading[k])
+            if not low <= reading[k] <= high:  # also rejects nan; inf is out of any range
+                raise ValueError(f"{k} {raw[k]!r} is outside [{low}, {high}]")
+    return reading
+
+def ingest_readings(sql_cursor, sql_conn, bin_readings_collection, readings, progress=None):
+    """
+    Store a batch of normalized readings from the API: register bins that report
+    coordinates, fill in the registered address/coordinates a reading leaves out,
+    write readings and bin state, then flush any alerts they raised.
+    Completed steps are recorded in `progress`; calling again with the same dict after
+    a failure resumes after them, so readings already stored are not re-inserted (and
+    their alerts not re-derived).
+    """
+    progress = {} if progress is None else progress
+    if "bins" not in progress:
+        located = [r for r in readings if "lat" in r and "lon" in r]
+        if located:
+            commit_bins(sql_cursor, sql_conn, pd.DataFrame(located).reindex(columns=["serial", "address", "lat", "lon"]))
+        partial = {r["serial"] for r in readings if not all(k in r for k in ("address", "lat", "lon"))}
+        if partial:
+            known = get_bin_metadata(sql_cursor, list(partial))
+            for r in readings:
+                for k, v in known.get(r["serial"], {}).items():
+                    if k not in r and v is not None:
+                        r[k] = v
+        progress["bins"] = True
+    fresh = store_readings(bin_readings_collection, readings, progress=progress)
+    if "applied" not in progress:
+        apply_readings(bin_readings_collection, fresh)
+        progress["applied"] = True
+    flush_alerts(sql_cursor, sql_conn)  # failed alert writes are requeued by flush_alerts itself
+    return len(fresh)
+
+def file_checksum(filepath, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_high_water_marks(bin_readings_collection):
+    """Return {serial: time of latest stored reading}, read from the bin state collection."""
+    state = get_bin_state_collection(bin_readings_collection)
+    return {d["_id"]: d["time"] for d in state.find({}, {"time": 1}) if d.get("time") is not None}
+
+def load_data_from_csv(sql_cursor, sql_conn, bin_readings_collection, filepath="smart-bins-argyle-square.csv",
+                       chunksize=50000, batch_size=5000, incremental=False):
+    """
+    Stream the sensor CSV into both databases `chunksize` rows at a time, so memory
+    stays constant regardless of file size. Returns ingestion stats.
+
+    With incremental=True nothing is deleted: files already ingested (by checksum) are
+    skipped, and only readings newer than each bin's last stored reading are inserted.
+    """
     try:
-        df = pd.read_csv(filepath)
-        print(f"📄 Loaded {len(df)} records from CSV.")
+        reader = pd.read_csv(filepath, chunksize=chunksize)
     except FileNotFoundError:
         print(f"❌ File not found: {filepath}. Please make sure 'smart-bins-argyle-square.csv' is in the same directory.")
         return
 
-    df.dropna(subset=["latlong", "serial"], inplace=True)
-    df[["lat", "lon"]] = df["latlong"].str.split(", ", expand=True).astype(float)
-    df["time"] = pd.to_datetime(df["time"])
+    if incremental:
+        checksum = file_checksum(filepath)
+        sql_cursor.execute("SELECT ingested_at FROM IngestedFiles WHERE checksum=%s;", (checksum,))
+        seen = sql_cursor.fetchone()
+        if seen:
+            print(f"⏭️ {filepath} already ingested at {seen[0]}. Skipping.")
+            return {"rows": 0, "skipped": 0, "seconds": 0.0, "rows_per_sec": 0.0}
+        high_water = get_high_water_marks(bin_readings_collection)
+    else:
+        # Clear Bins table and reload (development-friendly)
+        sql_cursor.execute("DELETE FROM Bins;")
+        sql_conn.commit()
+        bin_metadata_cache.invalidate()
+        bin_readings_collection.delete_many({})
+        get_bin_state_collection(bin_readings_collection).delete_many({})
+        get_rollup_collection(bin_readings_collection).delete_many({"metric": {"$in": list(rollups.READING_METRICS)}})
+        retention.clear(bin_readings_collection)
+        invalidate_dashboard_summary()
+        # A full reload replays history: rebuild alert state without alerting on old events
+        alert_engine.reset(get_alert_state_collection(bin_readings_collection))
+        fill_forecaster.reset()
 
-    unique_bins = df[["serial", "address", "lat", "lon"]].drop_duplicates(subset=["serial"])
+    start = time.perf_counter()
+    rows = skipped = 0
+    for chunk in reader:
+        df = _prepare_readings(chunk)
+        if incremental and high_water:
+            mark = df["serial"].map(high_water)
+            fresh = mark.isna() | (df["time"] > pd.to_datetime(mark))
+            skipped += int((~fresh).sum())
+            df = df[fresh]
+        if df.empty:
+            continue
+        commit_bins(sql_cursor, sql_conn, df)
+        rows += insert_readings(bin_readings_collection, df.to_dict("records"), batch_size, emit_alerts=incremental)
+        if incremental:
+            flush_alerts(sql_cursor, sql_conn)
 
-    # Clear Bins table and re-insert (development-friendly)
-    sql_cursor.execute("DELETE FROM Bins;")
-    for _, row in unique_bins.iterrows():
+    if incremental:
         sql_cursor.execute("""
-            INSERT INTO Bins (serial, address, lat, lon)
+            INSERT INTO IngestedFiles (checksum, path, size_bytes, rows_inserted)
             VALUES (%s, %s, %s, %s)
-            ON CONFLICT (serial) DO NOTHING;
-        """, (row["serial"], row["address"], row["lat"], row["lon"]))
-    sql_conn.commit()
+            ON CONFLICT (checksum) DO NOTHING;
+        """, (checksum, os.path.abspath(filepath), os.path.getsize(filepath), rows))
+        sql_conn.commit()
 
-    # Populate MongoDB sensor readings
-    bin_readings_collection.delete_many({})
-    bin_readings_collection.insert_many(df.to_dict("records"))
+    elapsed = time.perf_counter() - start
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"📄 Loaded {rows} records from CSV in {elapsed:.2f}s ({rate:,.0f} rows/s), {skipped} already stored.")
     print("✅ Databases populated with bin and reading data.")
+    return {"rows": rows, "skipped": skipped, "seconds": round(elapsed, 3), "rows_per_sec": round(rate, 1)}
 
 # -----------------------------------------------------------
-# BIN + ROUTE LOGIC
+# BIN STATE (latest reading per bin)
 # -----------------------------------------------------------
-def find_bins_for_collection(bin_readings_collection, fill_level_threshold=80):
+BIN_STATE_COLLECTION = "bin_state"
+
+def get_bin_state_collection(bin_readings_collection):
+    """Return the collection holding the latest reading of every bin, keyed by serial."""
+    return bin_readings_collection.database[BIN_STATE_COLLECTION]
+
+def get_alert_state_collection(bin_readings_collection):
+    """Return the collection holding each bin's alert state, keyed by serial."""
+    return bin_readings_collection.database[ALERT_STATE_COLLECTION]
+
+def update_bin_state(bin_readings_collection, readings):
+    """
+    Upsert the latest reading per serial into the bin state collection.
+    Only readings newer than the stored one replace it, so batches may arrive out of order.
+    Returns the number of bins whose state was replaced.
+    """
+    latest = {}
+    for r in readings:
+        serial = r.get("serial")
+        if serial is None or r.get("time") is None:
+            continue
+        if serial not in latest or r["time"] > latest[serial]["time"]:
+            latest[serial] = r
+    if not latest:
+        return 0
+
+    ops = []
+    for serial, r in latest.items():
+        doc = {k: v for k, v in r.items() if k != "_id"}
+        location = geo_point(r.get("lat"), r.get("lon"))
+        if location:
+            doc["location"] = location
+        # Filter on an older time: a newer stored reading makes the upsert collide
+        # on _id, which is reported as a duplicate key error and ignored below.
+        ops.append(UpdateOne(
+            {"_id": serial, "time": {"$lt": r["time"]}},
+            {"$set": doc},
+            upsert=True
+        ))
+    rejected = set()
+    try:
+        get_bin_state_collection(bin_readings_collection).bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+        if errors:
+            raise
+        rejected = {err["index"] for err in e.details.get("writeErrors", [])}
+    # Only readings that actually replaced the stored state go out; a stale one would
+    # overwrite a newer fill level on the clients
+    applied = [r for k, r in enumerate(latest.values()) if k not in rejected]
+    if applied:
+        events.publish("bins", [format_bin(r) for r in applied])
+    return len(applied)
+
+def geo_point(lat, lon):
+    """GeoJSON Point for a valid coordinate pair, else None (NaN and out-of-range are rejected)."""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return {"type": "Point", "coordinates": [lon, lat]}
+    return None
+
+def geo_filter(bbox=None, near=None):
+    """
+    Mongo filter on the 2dsphere-indexed location field.
+    bbox = (min_lon, min_lat, max_lon, max_lat); near = (lat, lon, radius_km).
+    $geoWithin (not $near) keeps results in the caller's sort order, so it pages cleanly.
+    """
+    clauses = []
+    if bbox:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        ring = [[min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat], [min_lon, max_lat], [min_lon, min_lat]]
+        clauses.append({"location": {"$geoWithin": {"$geometry": {"type": "Polygon", "coordinates": [ring]}}}})
+    if near:
+        lat, lon, radius_km = near
+        clauses.append({"location": {"$geoWithin": {"$centerSphere": [[lon, lat], radius_km / geo.EARTH_RADIUS_KM]}}})
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def format_bin(doc):
+    """Standard bin shape returned by the API and pushed to live clients."""
+    return {
+        "serial": doc.get("serial"),
+        "address": doc.get("address"),
+        "status": doc.get("bin_status") or "Unknown",
+        "fill_level": doc.get("status_current_fill_level") or 0,
+        "lat": doc.get("lat"),
+        "lon": doc.get("lon"),
+        "last_updated": doc.get("time"),
+    }
+
+def rebuild_bin_state(bin_readings_collection, sql_cursor=None):
+    """
+    Rebuild the bin state collection from the full reading history (one-off backfill).
+    Buckets hold no bin metadata, so in bucket format address and coordinates come from
+    the Bins table (sql_cursor).
+    """
+    if reading_buckets.ENABLED:
+        return _rebuild_bin_state_from_buckets(bin_readings_collection, sql_cursor)
     pipeline = [
-        {"$sort": {"time": -1}},
+        {"$sort": {"serial": 1, "time": -1}},
         {"$group": {"_id": "$serial", "latest": {"$first": "$$ROOT"}}},
         {"$replaceRoot": {"newRoot": "$latest"}},
-        {"$match": {
-            "$or": [
-                {"bin_status": "Full"},
-                {"status_current_fill_level": {"$gte": fill_level_threshold}}
-            ]
-        }}
+        {"$set": {"_id": "$serial", "location": {"$cond": [
+            {"$and": [{"$gte": ["$lat", -90]}, {"$lte": ["$lat", 90]}, {"$gte": ["$lon", -180]}, {"$lte": ["$lon", 180]}]},
+            {"type": "Point", "coordinates": ["$lon", "$lat"]},
+            "$$REMOVE"
+        ]}}},
+        {"$merge": {"into": BIN_STATE_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
     ]
-    bins = list(bin_readings_collection.aggregate(pipeline))
+    bin_readings_collection.aggregate(pipeline, allowDiskUse=True)
+    count = get_bin_state_collection(bin_readings_collection).estimated_document_count()
+    print(f"🔁 Bin state rebuilt for {count} bins.")
+    return count
+
+def _rebuild_bin_state_from_buckets(bin_readings_collection, sql_cursor):
+    latest = reading_buckets.latest_per_serial(bin_readings_collection)
+    if sql_cursor is not None:
+        for serial, meta in get_bin_metadata(sql_cursor, list(latest)).items():
+            latest[serial].update(meta)
+    get_bin_state_collection(bin_readings_collection).delete_many({})
+    update_bin_state(bin_readings_collection, list(latest.values()))
+    print(f"🔁 Bin state rebuilt for {len(latest)} bins from reading buckets.")
+    return len(latest)
+
+# -----------------------------------------------------------
+# ROLLUPS (hourly/daily aggregates, see rollups.py)
+# -----------------------------------------------------------
+ROLLUP_COLLECTION = "rollups"
+
+def get_rollup_collection(bin_readings_collection):
+    return bin_readings_collection.database[ROLLUP_COLLECTION]
+
+def update_reading_rollups(bin_readings_collection, readings):
+    """Fold newly stored readings into the per-bin and per-area fill rollups."""
+    rollup_collection = get_rollup_collection(bin_readings_collection)
+    rollups.add_observations(rollup_collection, "fill", [
+        (r.get("serial"), r.get("time"), r.get("status_current_fill_level")) for r in readings
+    ])
+    rollups.add_observations(rollup_collection, "fill_area", [
+        (r["address"], r.get("time"), r.get("status_current_fill_level"))
+        for r in readings if isinstance(r.get("address"), str)
+    ])
+
+def query_rollups(sql_cursor, bin_readings_collection, metric, granularity="day", key=None, start=None, end=None):
+    """Read a rollup series from whichever store maintains `metric`."""
+    if metric in rollups.READING_METRICS:
+        return rollups.query(get_rollup_collection(bin_readings_collection), metric, granularity, key, start, end)
+    if metric in rollups.ROUTE_METRICS:
+        return rollups.query_sql(sql_cursor, metric, granularity, key, start, end)
+    raise ValueError(f"unknown metric: {metric}")
+
+def get_collection_efficiency(sql_cursor, days=7):
+    """
+    Daily collection efficiency: the average fill level of bins when a truck was sent
+    to them. Higher means fewer trips to half-empty bins. 0 for days without collections.
+    """
+    today = datetime.utcnow()
+    rows = rollups.query_sql(sql_cursor, "collected_fill", "day", "all", start=today - timedelta(days=days - 1))
+    return [
+        {"day": day.strftime("%a"), "date": day.date().isoformat(), "efficiency": row["avg"] if row else 0}
+        for day, row in rollups.last_days(rows, days, today)
+    ]
+
+# -----------------------------------------------------------
+# BIN + ROUTE LOGIC
+# -----------------------------------------------------------
+def _collection_query(fill_level_threshold):
+    return {
+        "$or": [
+            {"bin_status": "Full"},
+            {"status_current_fill_level": {"$gte": fill_level_threshold}}
+        ]
+    }
+
+def find_bins_for_collection(bin_readings_collection, fill_level_threshold=80, horizon_hours=None, near=None,
+                             sql_cursor=None):
+    """
+    Bins whose latest reading is full or at/above the threshold. With horizon_hours,
+    also bins the fill forecaster predicts will cross the threshold within that horizon.
+    near=(lat, lon, radius_km) limits candidates to a radius via the 2dsphere index.
+    With sql_cursor, bins a truck has already claimed are left out (see claimed_serials),
+    so dispatch only plans routes over bins it can still claim.
+    """
+    query = _collection_query(fill_level_threshold)
+    if horizon_hours:
+        ensure_forecaster(bin_readings_collection)
+        upcoming = fill_forecaster.bins_crossing_within(horizon_hours, fill_level_threshold)
+        query = {"$or": [query, {"_id": {"$in": upcoming}}]}
+    if near:
+        query = {"$and": [query, geo_filter(near=near)]}
+    bins = list(get_bin_state_collection(bin_readings_collection).find(query))
+    if sql_cursor is not None and bins:
+        claimed = claimed_serials(sql_cursor, [b["serial"] for b in bins])
+        if claimed:
+            bins = [b for b in bins if b["serial"] not in claimed]
+            print(f"🚛 {len(claimed)} bins skipped: already claimed by a truck.")
     print(f"♻️ {len(bins)} bins need collection.")
     return bins
 
+# -----------------------------------------------------------
+# READING HISTORY (hot + cold tiers, see retention.py)
+# -----------------------------------------------------------
+def get_reading_history(bin_readings_collection, serial, start=None, end=None):
+    """One bin's readings in [start, end) across the hot collection and the cold tier."""
+    rows = retention.history(bin_readings_collection, serial, start, end)
+    for r in rows:
+        r["time"] = r["time"].isoformat()
+    return rows
+
+def compact_readings(bin_readings_collection, hot_days=None):
+    """Move readings older than the hot window (SWMS_HOT_DAYS) into the cold tier."""
+    return retention.compact(bin_readings_collection, retention.HOT_DAYS if hot_days is None else hot_days)
+
+# -----------------------------------------------------------
+# FILL FORECASTING
+# -----------------------------------------------------------
+def ensure_forecaster(bin_readings_collection, lookback_days=14):
+    """
+    Fit the forecaster from recent history once (e.g. after a restart); afterwards it is
+    kept current by insert_readings. Only the last `lookback_days` of readings are read.
+    """
+    if len(fill_forecaster):
+        return
+    latest = get_bin_state_collection(bin_readings_collection).find_one(sort=[("time", -1)])
+    if not latest:
+        return
+    since = latest["time"] - timedelta(days=lookback_days)
+    if reading_buckets.ENABLED:
+        cursor = reading_buckets.find(bin_readings_collection, start=since)
+    else:
+        cursor = bin_readings_collection.find(
+            {"time": {"$gte": since}},
+            {"serial": 1, "time": 1, "status_current_fill_level": 1, "_id": 0},
+        ).sort([("serial", 1), ("time", 1)]).batch_size(10000)
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= 10000:
+            fill_forecaster.observe(batch)
+            batch = []
+    fill_forecaster.observe(batch)
+    print(f"📈 Fill forecaster fitted for {len(fill_forecaster)} bins.")
+
+def get_fill_forecast(bin_readings_collection, fill_level_threshold=80, limit=50):
+    """Bins ordered by predicted hours until they reach the threshold (soonest first)."""
+    ensure_forecaster(bin_readings_collection)
+    serials, rates, _, last_fill = fill_forecaster.fill_rates()
+    eta = fill_forecaster.hours_to_full(fill_level_threshold)
+    rows = [
+        {"serial": s, "fill_level": float(f), "fill_rate_per_hour": None if r != r else round(float(r), 3),
+         "hours_to_full": None if eta.get(s, float("inf")) == float("inf") else round(eta[s], 2)}
+        for s, r, f in zip(serials, rates, last_fill)
+    ]
+    rows.sort(key=lambda r: float("inf") if r["hours_to_full"] is None else r["hours_to_full"])
+    return rows[:limit]
+
 def haversine(lat1, lon1, lat2, lon2):
     R = 6371
     dLat, dLon = radians(lat2 - lat1), radians(lon2 - lon1)
     a = sin(dLat/2)**2 + cos(radians(lat1))*cos(radians(lat2))*sin(dLon/2)**2
     return R * 2 * atan2(sqrt(a), sqrt(1-a))
 
-def create_optimized_route(bins, start_location=(-37.80, 144.96)):
+def create_optimized_route(bins, start_location=(-37.80, 144.96), time_limit=0.5):
+    """Order bins into a short route: nearest-neighbour start, then time-bounded 2-opt/Or-opt."""
     if not bins:
         return []
-    route, unvisited = [], bins.copy()
-    curr_lat, curr_lon = start_location
-    while unvisited:
-        nearest = min(unvisited, key=lambda b: haversine(curr_lat, curr_lon, b["lat"], b["lon"]))
-        route.append(nearest)
-        curr_lat, curr_lon = nearest["lat"], nearest["lon"]
-        unvisited.remove(nearest)
-    print(f"🗺️ Optimized route created for {len(route)} bins.")
+    order, stats = routing.plan_route([(b["lat"], b["lon"]) for b in bins], start_location, time_limit)
+    route = [bins[k] for k in order]
+    print(f"🗺️ Optimized route created for {len(route)} bins: "
+          f"{stats['length_km']} km (nearest-neighbour {stats['initial_km']} km) in {stats['seconds']}s.")
     return route
 
+def plan_fleet_collection(bins, trucks, start_location=(-37.80, 144.96), time_limit=1.0):
+    """
+    Split bins across idle trucks (rows from get_available_trucks) respecting each truck's
+    capacity and max route length. Returns ([(truck_row, route), ...], unassigned_bins).
+    """
+    points = [(b["lat"], b["lon"]) for b in bins]
+    limits = [(t[2], t[3]) for t in trucks]
+    planned, unassigned = routing.plan_fleet_routes(points, limits, start_location, time_limit)
+    assignments = [(trucks[t], [bins[k] for k in order]) for t, order, _ in planned]
+    for t, _, stats in planned:
+        print(f"🗺️ {trucks[t][1]}: {stats['bins']} bins, {stats['length_km']} km.")
+    print(f"🚛 Fleet plan: {len(assignments)} trucks, {len(unassigned)} bins left for the next cycle.")
+    return assignments, [bins[k] for k in unassigned]
+
+# -----------------------------------------------------------
+# PAGINATED LISTINGS (keyset cursors + field projection)
+# -----------------------------------------------------------
+BIN_FIELDS = {
+    "serial": "serial", "address": "address", "status": "bin_status", "fill_level": "status_current_fill_level",
+    "lat": "lat", "lon": "lon", "last_updated": "time",
+}
+ALERT_FIELDS = ("id", "type", "message", "severity", "timestamp", "serial")
+ROUTE_FIELDS = {
+    "id": "r.id", "name": "r.name", "area": "r.area", "status": "r.status",
+    "truck_name": "t.name", "created_at": "r.created_at",
+}
+
+def encode_cursor(values):
+    """Opaque keyset cursor: the sort key of the last row returned."""
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("invalid cursor")
+
+def _select_fields(requested, allowed):
+    if not requested:
+        return list(allowed)
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise ValueError(f"unknown field(s): {', '.join(unknown)}")
+    return list(requested)
+
+def list_bins(bin_readings_collection, cursor=None, limit=100, status=None, area=None,
+              min_fill=None, max_fill=None, fields=None, bbox=None, near=None):
+    """
+    Page through the latest bin states ordered by serial. Filters (including bbox/near
+    on the 2dsphere index) and the field projection are pushed down into the Mongo
+    query. Returns (bins, next_cursor).
+    """
+    fields = _select_fields(fields, BIN_FIELDS)
+    query = geo_filter(bbox, near)
+    if cursor:
+        query["_id"] = {"$gt": decode_cursor(cursor)}
+    if status:
+        query["bin_status"] = status
+    if area:
+        query["address"] = area
+    if min_fill is not None or max_fill is not None:
+        query["status_current_fill_level"] = {}
+        if min_fill is not None:
+            query["status_current_fill_level"]["$gte"] = min_fill
+        if max_fill is not None:
+            query["status_current_fill_level"]["$lte"] = max_fill
+    projection = {BIN_FIELDS[f]: 1 for f in fields}
+    docs = list(get_bin_state_collection(bin_readings_collection).find(query, projection).sort("_id", 1).limit(limit))
+    bins = [{f: v for f, v in format_bin(d).items() if f in fields} for d in docs]
+    next_cursor = encode_cursor(docs[-1]["_id"]) if len(docs) == limit else None
+    return bins, next_cursor
+
+def list_alerts(sql_cursor, cursor=None, limit=10, severity=None, alert_type=None, serial=None, fields=None):
+    """Page through alerts newest first, keyed on (timestamp, id). Returns (alerts, next_cursor)."""
+    fields = _select_fields(fields, ALERT_FIELDS)
+    columns = list(dict.fromkeys(["timestamp", "id"] + fields))
+    where, params = [], []
+    if cursor:
+        ts, last_id = decode_cursor(cursor)
+        where.append("(timestamp, id) < (%s::timestamp, %s)")
+        params += [ts, last_id]
+    for column, value in (("severity", severity), ("type", alert_type), ("serial", serial)):
+        if value:
+            where.append(f"{column} = %s")
+            params.append(value)
+    sql_cursor.execute(f"""
+        SELECT {", ".join(columns)}
+        FROM MonitoringAlerts
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT %s;
+    """, params + [limit])
+    rows = [dict(zip(columns, r)) for r in sql_cursor.fetchall()]
+    next_cursor = encode_cursor([rows[-1]["timestamp"], rows[-1]["id"]]) if len(rows) == limit else None
+    alerts = [{f: (str(r[f]) if f == "timestamp" else r[f]) for f in fields} for r in rows]
+    return alerts, next_cursor
+
+def list_routes(sql_cursor, cursor=None, limit=20, status=None, area=None, truck_id=None, fields=None):
+    """Page through scheduled routes newest first, keyed on (created_at, id). Returns (routes, next_cursor)."""
+    fields = _select_fields(fields, ROUTE_FIELDS)
+    columns = list(dict.fromkeys(["created_at", "id"] + fields))
+    where, params = [], []
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        where.append("(r.created_at, r.id) < (%s::timestamp, %s)")
+        params += [created_at, last_id]
+    for column, value in (("r.status", status), ("r.area", area), ("r.truck_id", truck_id)):
+        if value:
+            where.append(f"{column} = %s")
+            params.append(value)
+    sql_cursor.execute(f"""
+        SELECT {", ".join(ROUTE_FIELDS[c] for c in columns)}
+        FROM Routes r
+        LEFT JOIN Trucks t ON r.truck_id = t.id
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY r.created_at DESC, r.id DESC
+        LIMIT %s;
+    """, params + [limit])
+    rows = [dict(zip(columns, r)) for r in sql_cursor.fetchall()]
+    next_cursor = encode_cursor([rows[-1]["created_at"], rows[-1]["id"]]) if len(rows) == limit else None
+    routes = []
+    for r in rows:
+        route = {f: r[f] for f in fields}
+        if "truck_name" in route:
+            route["truck_name"] = route["truck_name"] or "Unassigned"
+        if "created_at" in route:
+            route["created_at"] = str(route["created_at"])
+        routes.append(route)
+    return routes, next_cursor
+
+# -----------------------------------------------------------
+# REFERENCE DATA (read-through, see reference_cache)
+# -----------------------------------------------------------
+# Cached values are (etag, data) pairs so the API can answer If-None-Match with a 304
+# without touching the database.
+def _load_tagged(load):
+    data = load()
+    return etag(data), data
+
+def get_trucks(sql_cursor):
+    """(etag, [{id, name, status}, ...]) for the whole truck roster."""
+    def load():
+        sql_cursor.execute("SELECT id, name, status FROM Trucks ORDER BY id;")
+        return [{"id": t[0], "name": t[1], "status": t[2]} for t in sql_cursor.fetchall()]
+    return truck_cache.get_or_load("trucks", lambda: _load_tagged(load))
+
+def get_landfills(sql_cursor):
+    """(etag, [{id, name, capacity_tons, used_tons, usage_percent}, ...])."""
+    def load():
+        sql_cursor.execute("SELECT id, name, capacity_tons, used_tons FROM Landfills ORDER BY id;")
+        return [
+            {
+                "id": l[0],
+                "name": l[1],
+                "capacity_tons": l[2],
+                "used_tons": l[3],
+                "usage_percent": round((l[3] / l[2]) * 100, 2) if l[2] else 0
+            }
+            for l in sql_cursor.fetchall()
+        ]
+    return reference_cache.get_or_load("landfills", lambda: _load_tagged(load))
+
+def get_truck_id(sql_cursor, name):
+    """
+    Id of the truck called `name`, or None. Truck names never change once created, so
+    hits are cached; misses are not, so a truck added later is found straight away.
+    """
+    truck_id = truck_name_cache.get(name)
+    if truck_id is None:
+        sql_cursor.execute("SELECT id FROM Trucks WHERE name = %s;", (name,))
+        row = sql_cursor.fetchone()
+        if row:
+            truck_id = row[0]
+            truck_name_cache.set(name, truck_id)
+    return truck_id
+
+def get_bin_metadata(sql_cursor, serials):
+    """{serial: {address, lat, lon}} for the known serials; cache misses cost one query."""
+    found, missing = {}, []
+    generation = bin_metadata_cache.generation()
+    for serial in serials:
+        meta = bin_metadata_cache.get(serial)
+        if meta is None:
+            missing.append(serial)
+        else:
+            found[serial] = meta
+    if missing:
+        sql_cursor.execute("SELECT serial, address, lat, lon FROM Bins WHERE serial = ANY(%s);", (missing,))
+        for serial, address, lat, lon in sql_cursor.fetchall():
+            found[serial] = {"address": address, "lat": lat, "lon": lon}
+            # Skipped if upsert_bins invalidated anything meanwhile: this row may predate it
+            bin_metadata_cache.set(serial, found[serial], generation)
+    return found
+
 # -----------------------------------------------------------
 # TRUCK + ALERT LOGIC
 # -----------------------------------------------------------
-def get_available_truck(sql_cursor):
-    sql_cursor.execute("SELECT id, name FROM Trucks WHERE status='Idle' LIMIT 1;")
+# With lock=True the truck rows stay locked until the caller commits; concurrent
+# dispatches skip them (SKIP LOCKED) instead of queueing or picking the same truck.
+def get_available_truck(sql_cursor, lock=False):
+    sql = "SELECT id, name FROM Trucks WHERE status='Idle' ORDER BY id LIMIT 1"
+    sql_cursor.execute(sql + (" FOR UPDATE SKIP LOCKED;" if lock else ";"))
     return sql_cursor.fetchone()
 
-def assign_truck_to_route(sql_cursor, sql_conn, truck_id, route):
-    try:
-        sql_cursor.execute("UPDATE Trucks SET status='On-Route' WHERE id=%s;", (truck_id,))
-        for bin_doc in route:
-            # THIS IS THE CORRECTED LINE
-            sql_cursor.execute("UPDATE Bins SET status='In-Service' WHERE serial=%s;", (bin_doc["serial"],))
+def get_available_trucks(sql_cursor, lock=False):
+    """Return (id, name, capacity_bins, max_route_km) for every idle truck."""
+    sql = "SELECT id, name, capacity_bins, max_route_km FROM Trucks WHERE status='Idle' ORDER BY id"
+    sql_cursor.execute(sql + (" FOR UPDATE SKIP LOCKED;" if lock else ";"))
+    return sql_cursor.fetchall()
 
-        # Log transaction
-        sql_cursor.execute("""
-            INSERT INTO Transactions (truck_id, bins_collected, waste_weight)
-            VALUES (%s, %s, %s)
-        """, (truck_id, len(route), round(random.uniform(100, 400), 2)))
+def claimed_serials(sql_cursor, serials):
+    """The subset of `serials` held by a truck: In-Service, or on a route not yet completed."""
+    sql_cursor.execute("""
+        SELECT b.serial FROM Bins b
+        WHERE b.serial = ANY(%s)
+          AND (b.status = 'In-Service' OR EXISTS (
+                SELECT 1 FROM RouteBins rb
+                JOIN TruckRoutes tr ON tr.id = rb.route_id
+                WHERE rb.serial = b.serial AND tr.completed_at IS NULL));
+    """, (serials,))
+    return {row[0] for row in sql_cursor.fetchall()}
 
-        # Log route in TruckRoutes
-        sql_cursor.execute("""
-            INSERT INTO TruckRoutes (truck_id, route)
-            VALUES (%s, %s)
-        """, (truck_id, json.dumps([b["serial"] for b in route])))
+def claim_bins(sql_cursor, bins):
+    """
+    Mark bins In-Service unless they already are, or are being claimed by a concurrent
+    dispatch (row locked). Returns the claimed subset of `bins`, in the given order.
+    The claim is released if the caller rolls back.
+    """
+    if not bins:
+        return []
+    sql_cursor.execute("""
+        WITH free AS (
+            SELECT serial FROM Bins
+            WHERE serial = ANY(%s) AND status IS DISTINCT FROM 'In-Service'
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE Bins SET status='In-Service'
+        FROM free
+        WHERE Bins.serial = free.serial
+        RETURNING Bins.serial;
+    """, ([b["serial"] for b in bins],))
+    claimed = {row[0] for row in sql_cursor.fetchall()}
+    return [b for b in bins if b["serial"] in claimed]
+
+def _log_route_assignment(sql_cursor, truck_id, route):
+    """
+    Issue the writes for one truck/route assignment without committing. The route's bins
+    must already be claimed (claim_bins); membership goes into RouteBins in one batched
+    INSERT. Raises ValueError if the truck is no longer idle. Returns the TruckRoutes id.
+    """
+    serials = [b["serial"] for b in route]
+    sql_cursor.execute("UPDATE Trucks SET status='On-Route' WHERE id=%s AND status='Idle';", (truck_id,))
+    if sql_cursor.rowcount == 0:
+        raise ValueError(f"Truck {truck_id} is not idle")
+
+    # Log transaction
+    sql_cursor.execute("""
+        INSERT INTO Transactions (truck_id, bins_collected, waste_weight)
+        VALUES (%s, %s, %s)
+    """, (truck_id, len(route), round(random.uniform(100, 400), 2)))
+
+    # Log route in TruckRoutes, and its bins in RouteBins
+    sql_cursor.execute("""
+        INSERT INTO TruckRoutes (truck_id, route)
+        VALUES (%s, %s)
+        RETURNING id
+    """, (truck_id, json.dumps(serials)))
+    route_id = sql_cursor.fetchone()[0]
+    execute_values(sql_cursor, """
+        INSERT INTO RouteBins (route_id, serial, position, fill_level)
+        SELECT v.route_id, v.serial, v.position, v.fill_level
+        FROM (VALUES %s) AS v(route_id, serial, position, fill_level)
+        JOIN Bins b ON b.serial = v.serial
+        ON CONFLICT DO NOTHING
+    """, [(route_id, b["serial"], i, _finite(b.get("status_current_fill_level"))) for i, b in enumerate(route)],
+        template="(%s::int, %s::text, %s::int, %s::double precision)")
+
+    # Rollups commit together with the assignment
+    now = datetime.utcnow()
+    rollups.add_observations_sql(sql_cursor, "collected_bins", [(truck_id, now, len(route))])
+    rollups.add_observations_sql(sql_cursor, "collected_fill", [
+        ("all", now, b.get("status_current_fill_level")) for b in route
+    ])
+    return route_id
+
+def _finite(value):
+    """float(value), or None for missing/NaN values (stored as NULL)."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value == value else None
 
+def assign_truck_to_route(sql_cursor, sql_conn, truck_id, route):
+    """
+    Claim the route's bins and assign them to the truck. Bins another truck already
+    holds are dropped from the route. Returns the route as assigned, or None on failure.
+    """
+    try:
+        route = claim_bins(sql_cursor, route)
+        if not route:
+            sql_conn.rollback()
+            print(f"⚠️ Truck {truck_id}: every bin on the route is already being collected.")
+            return []
+        _log_route_assignment(sql_cursor, truck_id, route)
         sql_conn.commit()
+        invalidate_dashboard_summary()
+        invalidate_trucks()
+        events.publish("trucks", [{"id": truck_id, "status": "On-Route"}])
         print(f"✅ Truck {truck_id} assigned and route logged.")
+        return route
     except Exception as e:
         sql_conn.rollback()
         print(f"❌ Truck assignment failed: {e}")
+        return None
+
+def assign_trucks_to_routes(sql_cursor, sql_conn, assignments):
+    """
+    Assign every (truck_row, route) pair in a single transaction: all trucks dispatch or
+    none do. Bins are claimed per route; trucks left with no claimable bins stay idle.
+    Returns the [(truck_row, route), ...] actually assigned, or None on failure.
+    """
+    try:
+        assigned = []
+        for truck, route in assignments:
+            route = claim_bins(sql_cursor, route)
+            if route:
+                _log_route_assignment(sql_cursor, truck[0], route)
+                assigned.append((truck, route))
+        sql_conn.commit()
+        if assigned:
+            invalidate_dashboard_summary()
+            invalidate_trucks()
+            events.publish("trucks", [{"id": truck[0], "status": "On-Route"} for truck, _ in assigned])
+        print(f"✅ {len(assigned)} trucks assigned and routes logged.")
+        return assigned
+    except Exception as e:
+        sql_conn.rollback()
+        print(f"❌ Fleet assignment failed: {e}")
+        return None
+
+def dispatch_truck(sql_cursor, sql_conn, bins, time_limit=0.5):
+    """
+    Lock one idle truck, claim the bins no other dispatch holds, route them and log the
+    assignment, all in one transaction. Concurrent calls get different trucks and
+    disjoint bins. Returns (truck_row, route); truck_row is None if no truck is free,
+    route is empty if every bin was already claimed.
+    """
+    try:
+        truck = get_available_truck(sql_cursor, lock=True)
+        if not truck:
+            sql_conn.rollback()
+            return None, []
+        claimed = claim_bins(sql_cursor, bins)
+        if not claimed:
+            sql_conn.rollback()
+            return truck, []
+        route = create_optimized_route(claimed, time_limit=time_limit)
+        _log_route_assignment(sql_cursor, truck[0], route)
+        sql_conn.commit()
+    except Exception:
+        sql_conn.rollback()
+        raise
+    invalidate_dashboard_summary()
+    invalidate_trucks()
+    events.publish("trucks", [{"id": truck[0], "status": "On-Route"}])
+    print(f"✅ Truck {truck[0]} assigned and route logged.")
+    return truck, route
+
+def dispatch_fleet(sql_cursor, sql_conn, bins, time_limit=1.0):
+    """
+    Fleet counterpart of dispatch_truck: locks every idle truck no other dispatch holds,
+    plans routes across them and assigns the claimable bins in one transaction.
+    Returns ([(truck_row, route), ...], unassigned_bins), where unassigned_bins are the
+    bins no route took plus planned bins a concurrent dispatch claimed first. If the
+    assignment fails it is rolled back and (None, bins) is returned.
+    """
+    trucks = get_available_trucks(sql_cursor, lock=True)
+    if not trucks:
+        sql_conn.rollback()
+        return [], bins
+    planned, unassigned = plan_fleet_collection(bins, trucks, time_limit=time_limit)
+    assigned = assign_trucks_to_routes(sql_cursor, sql_conn, planned)
+    if assigned is None:
+        return None, bins
+    claimed = {b["serial"] for _, route in assigned for b in route}
+    lost = [b for _, route in planned for b in route if b["serial"] not in claimed]
+    return assigned, unassigned + lost
 
 def complete_route(sql_cursor, sql_conn, truck_id):
+    """
+    Close the truck's open route(s) and release only the bins on them, so bins
+    another truck is still collecting stay In-Service.
+    """
     sql_cursor.execute("UPDATE Trucks SET status='Idle' WHERE id=%s;", (truck_id,))
-    sql_cursor.execute("UPDATE Bins SET status='Active' WHERE status='In-Service';")
-    sql_cursor.execute("UPDATE TruckRoutes SET completed_at=NOW() WHERE truck_id=%s AND completed_at IS NULL;", (truck_id,))
+    sql_cursor.execute("""
+        UPDATE TruckRoutes SET completed_at=NOW()
+        WHERE truck_id=%s AND completed_at IS NULL
+        RETURNING id, EXTRACT(EPOCH FROM completed_at - assigned_at) / 60;
+    """, (truck_id,))
+    closed = sql_cursor.fetchall()
+    route_ids = [row[0] for row in closed]
+    sql_cursor.execute("""
+        UPDATE Bins SET status='Active'
+        FROM RouteBins rb
+        WHERE rb.route_id = ANY(%s) AND rb.serial = Bins.serial AND Bins.status='In-Service';
+    """, (route_ids,))
+    now = datetime.utcnow()
+    rollups.add_observations_sql(sql_cursor, "route_minutes", [(truck_id, now, row[1]) for row in closed])
     sql_conn.commit()
+    invalidate_dashboard_summary()
+    invalidate_trucks()
+    events.publish("trucks", [{"id": truck_id, "status": "Idle"}])
     print(f"🟢 Truck {truck_id} route completed and reset.")
 
-def generate_system_alerts(sql_cursor, sql_conn):
-    alerts = [
-        ("Sensor Error", "Bin sensor not responding", "High"),
-        ("Overfilled Bin", "Bin exceeded safe limit", "Critical"),
-        ("Truck Delay", "Truck delayed beyond schedule", "Medium"),
-    ]
-    for alert in alerts:
-        sql_cursor.execute("""
-            INSERT INTO MonitoringAlerts (type, message, severity)
-            VALUES (%s, %s, %s)
-        """, alert)
-    sql_conn.commit()
-    print("🔔 Monitoring alerts generated.")
+def prime_alert_engine(bin_readings_collection):
+    """
+    Seed alert state from the latest reading of each bin without alerting; bins whose
+    state is already current (the usual case after a restart) are left untouched.
+    """
+    alert_engine.observe(get_alert_state_collection(bin_readings_collection),
+                         list(get_bin_state_collection(bin_readings_collection).find()), emit=False)
+
+def flush_alerts(sql_cursor, sql_conn):
+    """
+    Write all alerts queued by the alert engine in one batched INSERT. If the write
+    fails the alerts go back on the queue for the next flush.
+    """
+    pending = alert_engine.drain()
+    if not pending:
+        return 0
+    try:
+        rows = execute_values(sql_cursor, """
+            INSERT INTO MonitoringAlerts (type, message, severity, serial)
+            VALUES %s
+            RETURNING id, timestamp
+        """, pending, fetch=True)
+        sql_conn.commit()
+    except Exception:
+        sql_conn.rollback()
+        alert_engine.requeue(pending)
+        raise
+    invalidate_dashboard_summary()
+    events.publish("alerts", [
+        {"id": row[0], "type": a[0], "message": a[1], "severity": a[2], "serial": a[3], "timestamp": str(row[1])}
+        for a, row in zip(pending, rows)
+    ])
+    print(f"🔔 {len(pending)} monitoring alerts generated.")
+    return len(pending)
+
+def check_silent_sensors(sql_cursor, sql_conn, bin_readings_collection, now=None):
+    """Alert on bins that have not reported within the silence window (app.py runs this on one worker)."""
+    alert_engine.check_silence(get_alert_state_collection(bin_readings_collection), now)
+    return flush_alerts(sql_cursor, sql_conn)
+
+def generate_system_alerts(sql_cursor, sql_conn, bin_readings_collection):
+    """Alert on the current bin state: overfilled bins not yet alerted, and silent sensors."""
+    prime_alert_engine(bin_readings_collection)
+    alert_engine.alert_current(get_alert_state_collection(bin_readings_collection))
+    return check_silent_sensors(sql_cursor, sql_conn, bin_readings_collection)
 
 def get_dashboard_summary(sql_cursor, bin_readings_collection):
+    """Dashboard counts, served from summary_cache for up to SWMS_SUMMARY_TTL seconds."""
+    summary = summary_cache.get_or_load(
+        "dashboard_summary", lambda: _load_dashboard_summary(sql_cursor, bin_readings_collection)
+    )
+    return dict(summary)
+
+def _load_dashboard_summary(sql_cursor, bin_readings_collection):
     sql_cursor.execute("SELECT * FROM DashboardSummary;")
     row = sql_cursor.fetchone() or (0,0,0,0,0)
-    full_bins = len(find_bins_for_collection(bin_readings_collection, 80))
+    full_bins = get_bin_state_collection(bin_readings_collection).count_documents(_collection_query(80))
     
     # Get total alerts
     sql_cursor.execute("SELECT COUNT(*) FROM MonitoringAlerts;")
@@ -296,9 +1293,9 @@ if __name__ == "__main__":
     sql_conn, sql_cursor, mongo_client, mongo_db, bin_readings_collection = get_connections()
     setup_databases(sql_cursor, sql_conn, bin_readings_collection, drop_existing=True)
     load_data_from_csv(sql_cursor, sql_conn, bin_readings_collection)
-    generate_system_alerts(sql_cursor, sql_conn)
+    generate_system_alerts(sql_cursor, sql_conn, bin_readings_collection)
 
-    bins = find_bins_for_collection(bin_readings_collection)
+    bins = find_bins_for_collection(bin_readings_collection, sql_cursor=sql_cursor)
     if bins:
         truck = get_available_truck(sql_cursor)
         if truck:
@@ -1,9 +1,13 @@
 import pandas as pd
 import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import geo
 
 def find_geographic_center_single_column(csv_file_path, column_name="latlong"):
     """
-    Calculates the geographic center (average latitude and longitude)
+    Calculates the geographic center (spherical centroid of the points)
     from a CSV file with a single combined lat,long column.
 
     Args:
@@ -36,11 +40,13 @@ def find_geographic_center_single_column(csv_file_path, column_name="latlong"):
             print(f"Error: No valid coordinates found in '{column_name}' column.", file=sys.stderr)
             return None
 
-        # Calculate the mean (average) of latitude and longitude
-        center_lat = df['lat'].mean()
-        center_long = df['long'].mean()
+        # Average the points as 3D unit vectors (correct across the antimeridian)
+        center = geo.spherical_centroid(df['lat'].to_numpy(), df['long'].to_numpy())
+        if center is None:
+            print("Error: Points are spread evenly around the globe; no unique center.", file=sys.stderr)
+            return None
 
-        return center_lat, center_long
+        return center
 
     except FileNotFoundError:
         print(f"Error: File not found at '{csv_file_path}'", file=sys.stderr)
@@ -9,8 +9,35 @@ export default function Monitoring() {
 
   useEffect(() => {
     fetchData();
-    const interval = setInterval(fetchData, 10000); // Auto-refresh every 10s
-    return () => clearInterval(interval);
+
+    // Live updates over Server-Sent Events; fall back to polling if the stream fails
+    let interval: ReturnType<typeof setInterval> | undefined;
+    const source = new EventSource(`${API_BASE}/api/stream`);
+
+    source.addEventListener("bins", (e) => {
+      const updates: any[] = JSON.parse((e as MessageEvent).data);
+      setBins((prev) => {
+        const bySerial = new Map(prev.map((b) => [b.serial, b]));
+        updates.forEach((b) => bySerial.set(b.serial, { ...bySerial.get(b.serial), ...b }));
+        return Array.from(bySerial.values());
+      });
+    });
+
+    source.addEventListener("alerts", (e) => {
+      const created: any[] = JSON.parse((e as MessageEvent).data);
+      setAlerts((prev) => [...created.reverse(), ...prev].slice(0, 10));
+    });
+
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED && !interval) {
+        interval = setInterval(fetchData, 10000); // Auto-refresh every 10s
+      }
+    };
+
+    return () => {
+      source.close();
+      if (interval) clearInterval(interval);
+    };
   }, []);
 
   const fetchData = async () => {
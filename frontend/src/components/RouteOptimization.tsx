@@ -31,6 +31,8 @@ export default function RouteOptimization() {
   // Fixed point
   const baseLat = -37.802694;
   const baseLon = 144.965873;
+  // Only bins within this distance of the base point are planned from here
+  const serviceRadiusKm = 15;
 
   useEffect(() => {
     fetchData();
@@ -40,7 +42,7 @@ export default function RouteOptimization() {
     try {
       const [routesRes, binsRes] = await Promise.all([
         fetch(`${API_BASE}/api/routes`),
-        fetch(`${API_BASE}/api/bins`),
+        fetch(`${API_BASE}/api/bins?status=Full&near=${baseLat},${baseLon}&radius=${serviceRadiusKm}`),
       ]);
 
       if (!routesRes.ok || !binsRes.ok)